@@ -1,15 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
+import hmac
+import os
 import uvicorn
 from AnalysisManager import AnalysisManager
+from CatalogChanges import changes_from_patch, parse_ndjson
+from ProductIndex import ProductIndex, SORT_KEYS, DEFAULT_SORT
+from BitmapIndex import FACET_FIELDS
+from JsonCodec import FastJSONResponse, RawJSONResponse, dumps, dumps_with_fragment
+from Metrics import METRICS_ENABLED, REGISTRY, SIZE_BUCKETS, MetricsMiddleware, span
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 5000
+# Token cho PATCH /catalog và POST /catalog/bulk (header X-Catalog-Token); không đặt = tắt ghi catalog qua API
+CATALOG_WRITE_TOKEN = os.getenv("CATALOG_WRITE_TOKEN")
+MAX_CATALOG_CHANGES = int(os.getenv("MAX_CATALOG_CHANGES", "100000"))
 
 # Khởi tạo FastAPI app
 app = FastAPI(
     title="Product API",
     description="API để lấy tất cả sản phẩm",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 # Thêm CORS middleware
@@ -25,12 +42,65 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cho phép FE đọc thời gian từng giai đoạn khi gửi header X-Profile
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 # Khởi tạo AnalysisManager
 analysis_manager = AnalysisManager()
 
+RESPONSES = REGISTRY.counter(
+    "what2gift_responses_total", "Response theo endpoint và status trong body (kể cả các fallback)", ("endpoint", "status")
+)
+RESULT_SIZE = REGISTRY.histogram(
+    "what2gift_result_size", "Số sản phẩm trả về mỗi response", ("endpoint",), SIZE_BUCKETS
+)
+ERRORS = REGISTRY.counter(
+    "what2gift_errors_total", "Exception bị nuốt bởi fallback trả về 200", ("endpoint", "error")
+)
+
+
+def _cache_stats():
+    stats = analysis_manager.cache.stats()
+    return {(kind,): stats[kind] for kind in ("hits", "misses", "evictions")}
+
+
+REGISTRY.counter_callback("what2gift_result_cache_events_total", "Hit/miss/eviction của cache kết quả",
+                          _cache_stats, ("event",))
+REGISTRY.gauge_callback("what2gift_result_cache_entries", "Số mục trong cache kết quả",
+                        lambda: {(): analysis_manager.cache.stats()["size"]})
+REGISTRY.gauge_callback("what2gift_sessions", "Số session đang lưu",
+                        lambda: {(): len(analysis_manager.sessions)})
+REGISTRY.gauge_callback("what2gift_catalog_version", "Phiên bản snapshot catalog đang phục vụ",
+                        lambda: {(): analysis_manager.snapshot.version})
+REGISTRY.gauge_callback("what2gift_catalog_products", "Số sản phẩm trong catalog",
+                        lambda: {(): analysis_manager.index.count})
+REGISTRY.gauge_callback("what2gift_semantic_index_ready", "1 nếu chỉ mục ngữ nghĩa đã dựng xong",
+                        lambda: {(): int(analysis_manager.index.semantic is not None)})
+REGISTRY.gauge_callback("what2gift_llm_pending", "Số câu hỏi khác nhau đang chờ LLM (giới hạn bởi HF_MAX_BACKLOG)",
+                        lambda: {(): analysis_manager.llm_flights.pending})
+REGISTRY.gauge_callback("what2gift_llm_circuit_open", "1 nếu circuit breaker tới Hugging Face đang mở (MODEL_BACKEND=remote)",
+                        lambda: {(): int(analysis_manager.model.status().get("circuit", "closed") != "closed")})
+
+
+def _respond(endpoint: str, payload: dict, index: Optional[ProductIndex] = None, positions=None) -> RawJSONResponse:
+    """
+    Ghi metrics theo status/số sản phẩm rồi encode JSON trong span 'encode'.
+    Khi có (index, positions): mảng "products" được ghép từ JSON bytes đã encode sẵn lúc nạp catalog,
+    phần còn lại của payload encode bằng orjson; không qua jsonable_encoder/validation của FastAPI
+    """
+    RESPONSES.inc(endpoint, str(payload.get("status")))
+    with span("encode"):
+        if positions is None:
+            products = payload.get("products")
+            if isinstance(products, list):
+                RESULT_SIZE.observe(len(products), endpoint)
+            return RawJSONResponse(dumps(payload))
+        RESULT_SIZE.observe(len(positions), endpoint)
+        return RawJSONResponse(dumps_with_fragment(payload, "products", index.take_json(positions)))
+
 
 @app.get("/")
 async def root():
@@ -41,6 +111,13 @@ async def root():
         "description": "API sử dụng Hugging Face AI để xử lý và lọc sản phẩm theo yêu cầu",
         "endpoints": {
             "/products": "Lấy sản phẩm đã được AI xử lý theo yêu cầu JSON",
+            "/products/batch": "Gợi ý cho danh sách GiftPrompt trong một request",
+            "/status": "Phiên bản catalog và trạng thái hot reload",
+            "/catalog": "PATCH - cập nhật/xóa sản phẩm (giá, tồn kho, ...) không cần restart",
+            "/catalog/bulk": "POST - như PATCH /catalog, body NDJSON mỗi dòng một thay đổi",
+            "/cache/stats": "Thống kê cache kết quả",
+            "/sessions/stats": "Thống kê session store",
+            "/metrics": "Metrics dạng Prometheus (thời gian từng giai đoạn, fallback, cache)",
             "/docs": "API Documentation"
         },
         "example_usage": {
@@ -57,6 +134,53 @@ async def root():
     }
 
 
+@app.on_event("startup")
+async def startup():
+    # Theo dõi database.csv để nạp lại catalog mà không cần restart
+    analysis_manager.start_watcher()
+    # Áp dụng thay đổi catalog do worker khác ghi vào change log
+    analysis_manager.start_change_follower()
+    # Warm-up model backend trước khi nhận request
+    await analysis_manager.warmup()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Dừng watcher và đóng model backend (connection pool tới Hugging Face nếu dùng remote)
+    await analysis_manager.aclose()
+
+
+@app.get("/status")
+async def status():
+    """Phiên bản catalog đang dùng và thời gian nạp lại gần nhất"""
+    return {
+        "catalog": analysis_manager.catalog_status(),
+        "hf_circuit": analysis_manager.model.status().get("circuit"),
+        "model": analysis_manager.model.status(),
+        "llm_single_flight": analysis_manager.llm_flights.stats(),
+    }
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Thống kê hit/miss của cache kết quả /products"""
+    return analysis_manager.cache.stats()
+
+
+@app.get("/sessions/stats")
+async def session_stats():
+    """Số lượng session và bộ nhớ session store đang dùng"""
+    return analysis_manager.sessions.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics theo định dạng text của Prometheus"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=0)")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 # 🧩 Định nghĩa model cho prompt JSON
 class GiftPrompt(BaseModel):
     gift_recipient: str
@@ -64,81 +188,258 @@ class GiftPrompt(BaseModel):
     occasion: str
     Preferences: Optional[str] = None
     budget: Optional[str] = None
+    # Filter mở rộng (tùy chọn)
+    categories: Optional[List[str]] = None  # OR với nhau và với category suy ra từ Preferences
+    brands: Optional[List[str]] = None
+    min_rating: Optional[float] = None
+    in_stock_only: Optional[bool] = None
+    exclude_categories: Optional[List[str]] = None
+    exclude_brands: Optional[List[str]] = None
+    exclude_product_ids: Optional[List[int]] = None
+
+
+def _facet_fields(facets: Optional[str]) -> tuple:
+    if not facets:
+        return ()
+    fields = tuple(dict.fromkeys(f.strip() for f in facets.split(",") if f.strip()))
+    invalid = [f for f in fields if f not in FACET_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400,
+                            detail=f"Invalid facets {invalid}. Use any of: {', '.join(FACET_FIELDS)}")
+    return fields
+
+
+def _paginated_products(question_data: dict, sort: str, limit: Optional[int], cursor: Optional[str], stream: bool,
+                        facet_fields: tuple = ()):
+    filter_dict = analysis_manager._rule_based_filtering_from_database(question_data)
+    status = "success"
 
+    if stream:
+        # Stream cần toàn bộ danh sách đã sắp xếp (được cache cho stream_products); match_products không có span riêng
+        with span("search"):
+            matched = len(analysis_manager.match_products(filter_dict, sort))
+        if matched == 0:
+            # Không có sản phẩm khớp -> trả về toàn bộ catalog
+            filter_dict = {}
+            status = "success_with_fallback"
+        lines, remaining = analysis_manager.stream_products(filter_dict, sort, cursor)
+        RESPONSES.inc("products", status)
+        RESULT_SIZE.observe(remaining, "products")
+        return StreamingResponse(
+            lines,
+            media_type="application/x-ndjson",
+            headers={"X-Total-Count": str(remaining), "X-Result-Status": status},
+        )
 
-@app.post("/products", response_model=Dict)
-async def get_all_products(prompt: GiftPrompt):
+    # Trang đầu chưa có trong cache chỉ cần top-k (page_positions), không sắp xếp toàn bộ kết quả
+    index, positions, next_cursor, total = analysis_manager.page_positions(
+        filter_dict, sort, limit or DEFAULT_PAGE_SIZE, cursor
+    )
+    if total == 0:
+        # Không có sản phẩm khớp -> phân trang trên toàn bộ catalog
+        filter_dict = {}
+        status = "success_with_fallback"
+        index, positions, next_cursor, total = analysis_manager.page_positions(
+            filter_dict, sort, limit or DEFAULT_PAGE_SIZE, cursor
+        )
+    payload = {
+        "status": status,
+        "prompt": question_data,
+        "session_id": analysis_manager.get_or_create_session().session_id,
+        "total_products": total,
+        "sort": sort,
+        "next_cursor": next_cursor,
+    }
+    if facet_fields:
+        payload["facets"] = analysis_manager.facet_counts(filter_dict, facet_fields, sort)
+    return _respond("products", payload, index, positions)
+
+
+@app.post("/products")
+async def get_all_products(
+    prompt: GiftPrompt,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Số sản phẩm mỗi trang"),
+    cursor: Optional[str] = Query(None, description="Cursor trả về từ trang trước (next_cursor)"),
+    sort: str = Query(DEFAULT_SORT, description=f"Khóa sắp xếp: {', '.join(SORT_KEYS)}"),
+    stream: bool = Query(False, description="Trả về NDJSON, mỗi dòng một sản phẩm"),
+    facets: Optional[str] = Query(None, description=f"Đếm số sản phẩm khớp theo: {', '.join(FACET_FIELDS)}"),
+):
     """
     Lấy sản phẩm đã được xử lý qua AI model
     """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort '{sort}'. Use one of: {', '.join(SORT_KEYS)}")
+    facet_fields = _facet_fields(facets)
+    if cursor:
+        try:
+            ProductIndex.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
         # Chuyển JSON sang dict để truyền cho AI
         question_data = prompt.dict()
 
-        # Gọi AI model
-        products, session_id = analysis_manager.get_all_products(question_data, None)
+        if limit is not None or cursor or stream:
+            return _paginated_products(question_data, sort, limit, cursor, stream, facet_fields)
+
+        # Form GiftPrompt luôn đi nhánh rule-based; lấy vị trí sản phẩm để ghép JSON đã encode sẵn
+        products, session_id = analysis_manager.product_positions(question_data)
 
         # Nếu AI trả về lỗi
         if isinstance(products, str):
             if "Error occurred" in products:
-                fallback_products = analysis_manager.search_products({})
-                return {
+                index, positions, next_cursor, total = analysis_manager.page_positions({}, limit=20)
+                return _respond("products", {
                     "status": "ai_prompt_error_fallback",
                     "prompt": question_data,
                     "session_id": session_id,
                     "note": "AI không hiểu hoặc prompt sai. Đã trả về toàn bộ sản phẩm.",
                     "error_detail": products,
-                    "total_products": len(fallback_products),
-                    "products": fallback_products[:20]
-                }
+                    "total_products": total,
+                    "next_cursor": next_cursor,
+                }, index, positions)
             else:
                 raise HTTPException(status_code=500, detail=products)
 
+        index, positions, total = products
         # Nếu AI không tìm thấy sản phẩm
-        if isinstance(products, list) and len(products) == 0:
+        if len(positions) == 0:
             # Try rule-based filtering as fallback instead of returning all products
             filter_dict = analysis_manager._rule_based_filtering_from_database(question_data)
-            fallback_products = analysis_manager.search_products(filter_dict)
+            index, positions, next_cursor, total = analysis_manager.page_positions(filter_dict, limit=50)
             
-            if len(fallback_products) == 0:
+            if total == 0:
                 # If still no products, return all products as last resort
-                fallback_products = analysis_manager.search_products({})
+                filter_dict = {}
+                index, positions, next_cursor, total = analysis_manager.page_positions(filter_dict, limit=50)
                 note = "No products matched criteria, returned all products"
             else:
                 note = "AI found no products, used rule-based filtering"
             
-            return {
+            payload = {
                 "status": "success_with_fallback",
                 "prompt": question_data,
                 "session_id": session_id,
                 "note": note,
-                "total_products": len(fallback_products),
-                "products": fallback_products[:50]
+                "total_products": total,
+                "next_cursor": next_cursor,
             }
+            if facet_fields:
+                payload["facets"] = analysis_manager.facet_counts(filter_dict, facet_fields)
+            return _respond("products", payload, index, positions)
 
-        return {
+        payload = {
             "status": "success",
             "prompt": question_data,
             "session_id": session_id,
-            "total_products": len(products) if isinstance(products, list) else 0,
-            "products": products
+            "total_products": total,
         }
+        if facet_fields:
+            # Facet đếm trên toàn bộ sản phẩm khớp filter (như total_products), không chỉ phần đầu của bảng gợi ý
+            with span("facets"):
+                filter_dict = analysis_manager._rule_based_filtering_from_database(question_data)
+                payload["facets"] = analysis_manager.facet_counts(filter_dict, facet_fields)
+        return _respond("products", payload, index, positions)
 
     except Exception as e:
+        # Lỗi bị thay bằng fallback 200 -> vẫn ghi lại để thấy trên /metrics và log
+        ERRORS.inc("products", type(e).__name__)
+        print(f"/products failed, returning fallback: {e!r}")
         try:
-            fallback_products = analysis_manager.search_products({})
-            return {
+            index, positions, next_cursor, total = analysis_manager.page_positions({}, limit=20)
+            return _respond("products", {
                 "status": "error_with_fallback",
                 "prompt": prompt.dict(),
                 "error": str(e),
                 "note": "Returned all products due to error",
-                "total_products": len(fallback_products),
-                "products": fallback_products[:20]
-            }
+                "total_products": total,
+                "next_cursor": next_cursor,
+            }, index, positions)
         except:
             raise HTTPException(status_code=500, detail=f"Critical error: {str(e)}")
 
 
+@app.post("/products/batch")
+async def get_batch_products(
+    prompts: List[GiftPrompt],
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Số sản phẩm mỗi prompt"),
+    sort: str = Query(DEFAULT_SORT, description=f"Khóa sắp xếp: {', '.join(SORT_KEYS)}"),
+):
+    """
+    Gợi ý sản phẩm cho nhiều GiftPrompt trong một request
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort '{sort}'. Use one of: {', '.join(SORT_KEYS)}")
+    if len(prompts) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: max {MAX_BATCH_SIZE} prompts")
+
+    results, unique_filters = analysis_manager.batch_products([p.dict() for p in prompts], sort, limit)
+    for result in results:
+        RESPONSES.inc("batch", result["status"])
+        RESULT_SIZE.observe(len(result["products"]), "batch")
+    with span("encode"):
+        return RawJSONResponse(dumps({
+            "status": "success",
+            "total_prompts": len(prompts),
+            "unique_filters": unique_filters,
+            "results": results
+        }))
+
+
+class CatalogPatch(BaseModel):
+    # Sản phẩm đã có: chỉ cần product_id và các trường đổi; sản phẩm mới: đủ các cột bắt buộc
+    upserts: List[Dict[str, Any]] = []
+    deletes: List[int] = []
+
+
+def _check_catalog_token(token: Optional[str]):
+    if not CATALOG_WRITE_TOKEN:
+        raise HTTPException(status_code=403, detail="Catalog updates are disabled (CATALOG_WRITE_TOKEN is not set)")
+    if token is None or not hmac.compare_digest(token.encode(), CATALOG_WRITE_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid catalog token")
+
+
+def _apply_catalog_changes(entries: List[dict]) -> dict:
+    if len(entries) > MAX_CATALOG_CHANGES:
+        raise HTTPException(status_code=413, detail=f"Too many changes: max {MAX_CATALOG_CHANGES} per request")
+    try:
+        result = analysis_manager.apply_catalog_changes(entries)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "success", **result}
+
+
+@app.patch("/catalog")
+def patch_catalog(body: CatalogPatch, x_catalog_token: Optional[str] = Header(None)):
+    """
+    Cập nhật/thêm (upserts) và xóa (deletes) sản phẩm trên catalog đang phục vụ; thay đổi được ghi vào
+    change log và áp dụng lại khi khởi động
+    """
+    _check_catalog_token(x_catalog_token)
+    try:
+        entries = changes_from_patch(body.upserts, body.deletes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _apply_catalog_changes(entries)
+
+
+@app.post("/catalog/bulk")
+async def bulk_catalog(request: Request, x_catalog_token: Optional[str] = Header(None)):
+    """
+    Như PATCH /catalog với body NDJSON, mỗi dòng một thay đổi:
+    {"op": "upsert", "product": {...}} hoặc {"op": "delete", "product_id": ...}
+    """
+    _check_catalog_token(x_catalog_token)
+    try:
+        entries = parse_ndjson(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(_apply_catalog_changes, entries)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "API:app",
@@ -1,71 +1,436 @@
-import uuid
 import ast
 import os
+import threading
+import time
+import unicodedata
 import pandas as pd
-import requests
+from contextlib import nullcontext
 import json
-from typing import Dict, List, Optional
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+from ProductIndex import ProductIndex, DEFAULT_SORT
+from CatalogWatcher import CatalogSnapshot, CatalogWatcher, file_stat
+from CatalogStore import is_fresh, load_binary_catalog
+from CatalogChanges import ChangeLog, ChangeLogFollower, apply_to_frame, coalesce, resolve
+from TextMatcher import PhraseMatcher
+from InferenceClient import AsyncInferenceClient, CircuitBreaker, LoadShedError, SingleFlight
+from ModelBackend import ModelBackend, create_model_backend
+from ResultCache import create_result_cache, normalize_filter
+from SessionStore import Session, create_session_backend
+from Recommendations import GiftTaxonomy, RecommendationTable
+from Metrics import REGISTRY, span, timed
 
 PROMPT_TEMPLATE = "huggingface_prompt.txt"
 DATABASE = "database.csv"
+# Bundle nhị phân build bởi `python CatalogStore.py`; chỉ dùng khi khớp với database.csv hiện tại
+CATALOG_BINARY = os.getenv("CATALOG_BINARY", "catalog.bin")
+# Backend suy luận cho câu hỏi dạng chuỗi: local (bộ phân loại trong process, không gọi mạng),
+# remote (Hugging Face Inference API) hoặc stub (tất định, cho test/benchmark)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "local")
+MODEL_BATCH_SIZE = int(os.getenv("MODEL_BATCH_SIZE", "32"))
+MODEL_BATCH_WAIT_MS = float(os.getenv("MODEL_BATCH_WAIT_MS", "0"))  # 0 = gom các request đến trong cùng vòng event loop
+MODEL_STUB_RESPONSE = os.getenv("MODEL_STUB_RESPONSE")
 # Hugging Face model - sử dụng model miễn phí không cần auth
 MODEL = "gpt2"
-HF_API_URL = "https://api-inference.huggingface.co/models/gpt2"
+HF_API_URL = os.getenv("HF_API_URL", "https://api-inference.huggingface.co/models/gpt2")
+HF_TIMEOUT = float(os.getenv("HF_TIMEOUT", "10"))
+HF_MAX_CONCURRENCY = int(os.getenv("HF_MAX_CONCURRENCY", "8"))
+# Số câu hỏi khác nhau được chờ LLM cùng lúc (đang gọi + xếp hàng); vượt ngưỡng thì trả kết quả offline ngay
+HF_MAX_BACKLOG = int(os.getenv("HF_MAX_BACKLOG", str(HF_MAX_CONCURRENCY * 2)))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")  # memory | sqlite (dùng chung giữa worker)
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "result_cache.db")
+CATALOG_POLL_INTERVAL = float(os.getenv("CATALOG_POLL_INTERVAL", "2"))  # 0 = tắt hot reload
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_HISTORY = int(os.getenv("SESSION_MAX_HISTORY", "20"))
+SEMANTIC_SEARCH = os.getenv("SEMANTIC_SEARCH", "1") != "0"
+# 0 = dựng chỉ mục ngữ nghĩa ngay khi nạp catalog (Server.py cần để các worker fork ra dùng chung)
+SEMANTIC_BACKGROUND = os.getenv("SEMANTIC_BACKGROUND", "1") != "0"
+# Bảng gợi ý theo người nhận/dịp/giới tính/ngân sách, dựng sẵn từ taxonomy khi nạp catalog
+RECOMMENDATION_TABLES = os.getenv("RECOMMENDATION_TABLES", "1") != "0"
+GIFT_TAXONOMY = os.getenv("GIFT_TAXONOMY", "gift_taxonomy.json")
+# Change log của PATCH /catalog, POST /catalog/bulk (NDJSON, chỉ ghi thêm); rỗng = tắt cập nhật catalog qua API
+CHANGE_LOG = os.getenv("CHANGE_LOG", "catalog_changes.ndjson")
+CHANGE_LOG_FSYNC = os.getenv("CHANGE_LOG_FSYNC", "1") != "0"
+CHANGE_LOG_POLL_INTERVAL = float(os.getenv("CHANGE_LOG_POLL_INTERVAL", "1"))  # worker đọc thay đổi của worker khác
+# Lô thay đổi nhỏ hơn ngưỡng này giữ lại các mục cache không liên quan tới dòng đổi; lớn hơn thì xóa cache
+CHANGE_CACHE_MAX_ROWS = int(os.getenv("CHANGE_CACHE_MAX_ROWS", "256"))
 
+# Map Vietnamese to database categories
+CATEGORY_MAPPING = {
+    'áo sơ mi': 'shirt', 'áo thun': 'shirt', 'áo polo': 'shirt',
+    'quần jeans': 'pants', 'quần tây': 'pants', 'quần jogger': 'pants', 'quần': 'pants',
+    'váy': 'dress', 'đầm': 'dress',
+    'áo khoác': 'jacket', 'áo bomber': 'jacket', 'áo dù': 'jacket',
+    'áo hoodie': 'hoodie', 'áo nỉ': 'hoodie',
+    'quần short': 'shorts', 'quần đùi': 'shorts',
+    'áo len': 'sweater', 'áo cardigan': 'sweater',
+    'quần legging': 'leggings', 'quần bó': 'leggings',
+    'áo vest': 'vest', 'áo gile': 'vest',
+    'đồng hồ': 'watch',
+    'ví': 'wallet', 'ví da': 'wallet',
+    'túi xách': 'bag', 'balo': 'bag', 'cặp': 'bag', 'túi': 'bag',
+    'giày': 'shoes', 'dép': 'shoes', 'sandal': 'shoes',
+    'mũ': 'hat', 'nón': 'hat',
+    'phụ kiện': 'accessory', 'đồ phụ kiện': 'accessory',
+    'thắt lưng': 'belt', 'dây nịt': 'belt',
+    'khăn': 'scarf', 'khăn quàng': 'scarf',
+    'tất': 'socks', 'vớ': 'socks',
+    'kính': 'glasses', 'mắt kính': 'glasses',
+    'nước hoa': 'perfume', 'perfume': 'perfume'
+}
+AVAILABLE_CATEGORIES = ['shirt', 'pants', 'dress', 'jacket', 'hoodie', 'shorts',
+                        'sweater', 'leggings', 'vest', 'watch', 'wallet', 'bag',
+                        'shoes', 'hat', 'accessory', 'belt', 'scarf', 'socks',
+                        'glasses', 'perfume']
+SEX_MAPPING = {
+    **{k: 'male' for k in ['nam', 'male', 'đàn ông', 'anh', 'bố', 'ba', 'cha', 'ông']},
+    **{k: 'female' for k in ['nữ', 'female', 'phụ nữ', 'chị', 'em gái', 'mẹ', 'má', 'bà']},
+    **{k: 'unisex' for k in ['trẻ em', 'bé', 'con']},
+}
 
-class Session:
-    def __init__(self, session_id: Optional[str] = None) -> None:
-        self.session_id = session_id or str(uuid.uuid4())
-        self.history: List[Dict[str, str]] = []
-        self.system_context = ""
+LLM_REQUESTS = REGISTRY.counter(
+    "what2gift_llm_requests_total", "Lời gọi LLM theo kết quả (success, error, invalid_format, unavailable, shed)",
+    ("outcome",)
+)
+LLM_COALESCED = REGISTRY.counter(
+    "what2gift_llm_coalesced_total", "Câu hỏi dùng chung kết quả của lời gọi LLM giống hệt đang chạy"
+)
+CATALOG_CHANGES = REGISTRY.counter(
+    "what2gift_catalog_changes_total", "Sản phẩm thay đổi qua change log theo kết quả (updated, inserted, deleted, ...)",
+    ("result",)
+)
 
-    def add_session(self, role: str, content: str):
-        self.history.append({'role': role, 'content': content})
+# Dựng một lần khi import; tên category tiếng Anh cũng là khóa (ưu tiên thấp hơn tiếng Việt)
+CATEGORY_MATCHER = PhraseMatcher({**CATEGORY_MAPPING, **{c: c for c in AVAILABLE_CATEGORIES if c not in CATEGORY_MAPPING}})
+SEX_MATCHER = PhraseMatcher(SEX_MAPPING)
 
-    def get_context_history(self, max_history: int = 20) -> List[Dict]:
-        if self.system_context:
-            history = [{'role': 'system', 'content': self.system_context}]
-            history.extend(self.history[-max_history:])
-            return history
-        return self.history[-max_history:]
 
-    def set_system_context(self, context: str):
-        self.system_context = context
+def budget_price_range(budget: int) -> Tuple[int, int]:
+    """
+    Khoảng giá theo ngân sách dựa trên database (69k - 7.99M) - NEVER exceed budget
+    """
+    if budget < 200000:
+        return 69000, budget
+    if budget < 500000:
+        return int(budget * 0.5), budget
+    if budget < 1000000:
+        return int(budget * 0.6), budget
+    if budget < 3000000:
+        return int(budget * 0.7), budget
+    # For high budgets, set reasonable range within database limits
+    return 69000, min(budget, 7990000)
 
 
 class AnalysisManager:
     def __init__(self) -> None:
-        self.data = self._load_data()
-        self.categories = self.data.category.unique().tolist()
-        self.sessions: Dict[str, Session] = {}
+        # Snapshot chứa DataFrame, categories và chỉ mục; hot reload thay cả snapshot một lần
+        self.change_log = ChangeLog(CHANGE_LOG, fsync=CHANGE_LOG_FSYNC) if CHANGE_LOG else None
+        self.snapshot = self._load_snapshot(1)
+        self._reload_lock = threading.Lock()
+        self.watcher: Optional[CatalogWatcher] = None
+        self.change_follower: Optional[ChangeLogFollower] = None
+        # Server.py tắt watcher trong worker: process cha tự theo dõi file và khởi động lại worker
+        self.watch_catalog = True
+        self.cache = create_result_cache(
+            RESULT_CACHE_BACKEND, path=RESULT_CACHE_DB, max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL
+        )
+        self._build_semantic(self.snapshot)
+        self.taxonomy = GiftTaxonomy.load(GIFT_TAXONOMY) if RECOMMENDATION_TABLES else None
+        self._build_recommendations(self.snapshot)
+        self.sessions = create_session_backend(
+            SESSION_BACKEND,
+            path=SESSION_DB,
+            max_entries=SESSION_MAX_ENTRIES,
+            idle_ttl=SESSION_IDLE_TTL,
+            max_history=SESSION_MAX_HISTORY,
+        )
 
-        # ✅ Tạo Hugging Face API client
-        self.hf_token = os.getenv("HUGGINGFACE_API_TOKEN", None)
-        try:
-            # Test Hugging Face API connection
-            if self.hf_token:
-                headers = {"Authorization": f"Bearer {self.hf_token}"}
-                response = requests.get("https://api-inference.huggingface.co/models", headers=headers)
-                if response.status_code == 200:
-                    self.hf_available = True
-                    print("Hugging Face API connected successfully")
-                else:
-                    self.hf_available = False
-                    print(f"Hugging Face API error: {response.status_code}")
-            else:
+        self.model = self._create_model_backend()
+        # Request đồng thời cùng câu hỏi chỉ tốn một lời suy luận
+        self.llm_flights = SingleFlight(HF_MAX_BACKLOG)
+
+    def _create_model_backend(self) -> ModelBackend:
+        client = None
+        if MODEL_BACKEND == "remote":
+            # ✅ Tạo Hugging Face API client
+            self.hf_token = os.getenv("HUGGINGFACE_API_TOKEN", None)
+            client = AsyncInferenceClient(
+                HF_API_URL,
+                token=self.hf_token,
+                timeout=HF_TIMEOUT,
+                max_concurrency=HF_MAX_CONCURRENCY,
+                breaker=CircuitBreaker(on_state_change=self._on_circuit_change),
+            )
+            # Không probe mạng khi khởi động (chặn import và lặp lại ở mỗi worker);
+            # circuit breaker tự mở khi các lời gọi thật thất bại
+            if not self.hf_token:
                 # Try without token (limited free tier)
-                self.hf_available = True
                 print("Using Hugging Face API without token (limited)")
-        except Exception as e:
-            print(f"Hugging Face API not available: {e}")
-            self.hf_available = False
+        return create_model_backend(
+            MODEL_BACKEND,
+            prompt_path=PROMPT_TEMPLATE,
+            price_range=budget_price_range,
+            client=client,
+            categories=AVAILABLE_CATEGORIES,
+            stub_response=MODEL_STUB_RESPONSE,
+            max_batch=MODEL_BATCH_SIZE,
+            max_wait=MODEL_BATCH_WAIT_MS / 1000,
+        )
+
+    @property
+    def model_available(self) -> bool:
+        return self.model.available
+
+    async def warmup(self):
+        # Chạy thử model khi khởi động để request đầu không chịu chi phí khởi tạo
+        await self.model.warmup()
+        print(f"Model backend ready: {self.model.name}")
+
+    @staticmethod
+    def _on_circuit_change(state: str):
+        print(f"Hugging Face circuit breaker -> {state}")
 
     def _load_data(self) -> pd.DataFrame:
+        if CATALOG_BINARY and is_fresh(CATALOG_BINARY, DATABASE):
+            try:
+                return load_binary_catalog(CATALOG_BINARY)
+            except Exception as e:
+                print(f"Binary catalog not usable, falling back to CSV: {e}")
         try:
             return pd.read_csv(DATABASE)
         except FileNotFoundError:
             raise FileNotFoundError(f"Database file '{DATABASE}' not found.")
 
+    def _load_snapshot(self, version: int, log_locked: bool = False) -> CatalogSnapshot:
+        """
+        Dựng snapshot đầy đủ: catalog gốc + toàn bộ change log (áp dụng trên DataFrame một lượt trước khi dựng chỉ mục).
+        log_locked: người gọi đã giữ khóa change log (khóa không reentrant)
+        """
+        started = time.perf_counter()
+        stat = file_stat(DATABASE)
+        if self.change_log is None:
+            return CatalogSnapshot(version, self._load_data(), stat, started)
+        # Khóa chia sẻ: `CatalogChanges.py compact` không gộp log vào CSV giữa lúc đọc CSV và đọc log
+        with nullcontext() if log_locked else self.change_log.locked(shared=True):
+            data = self._load_data()
+            generation = self.change_log.generation()
+            entries, offset = self.change_log.read()
+        if entries:
+            data, counts = apply_to_frame(data, entries)
+            print(f"Replayed {len(entries)} catalog changes from {CHANGE_LOG}: "
+                  + ", ".join(f"{k}={v}" for k, v in counts.items() if v))
+        return CatalogSnapshot(version, data, stat, started, log_offset=offset, log_generation=generation)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        return self.snapshot.data
+
+    @property
+    def categories(self) -> List[str]:
+        return self.snapshot.categories
+
+    @property
+    def index(self) -> ProductIndex:
+        return self.snapshot.index
+
+    def _build_semantic(self, snapshot: CatalogSnapshot):
+        if SEMANTIC_SEARCH:
+            snapshot.build_semantic(background=SEMANTIC_BACKGROUND, on_ready=self._on_semantic_ready)
+
+    def _on_semantic_ready(self, snapshot: CatalogSnapshot):
+        with self._reload_lock:
+            current = self.snapshot
+            # Snapshot hiện tại có thể đã được tạo từ snapshot này bằng PATCH /catalog trong lúc dựng
+            is_current = current.data is snapshot.data
+            if is_current and current is not snapshot and current.index.semantic is None:
+                current.index.semantic = snapshot.index.semantic.resized(current.index.size)
+        # Kết quả cache trước khi chỉ mục sẵn sàng đã bỏ qua filter 'query'
+        if is_current:
+            self.cache.clear()
+        print(f"Semantic index ready: version {snapshot.version} "
+              f"in {snapshot.semantic_duration * 1000:.1f} ms")
+
+    def _build_recommendations(self, snapshot: CatalogSnapshot, previous: Optional[CatalogSnapshot] = None):
+        if self.taxonomy is None:
+            return
+        try:
+            if previous is not None and previous.recommendations is not None:
+                # Chỉ dựng lại các nhóm (giới tính, khoảng ngân sách) có sản phẩm thay đổi
+                snapshot.recommendations = previous.recommendations.refresh(snapshot.index, snapshot.data)
+            else:
+                snapshot.recommendations = RecommendationTable(self.taxonomy, snapshot.index, snapshot.data)
+        except Exception as e:
+            print(f"Recommendation table build failed: {e}")
+            return
+        table = snapshot.recommendations
+        print(f"Recommendation table ready: {table.rebuilt_groups}/{len(table.group_keys)} groups rebuilt "
+              f"in {table.build_duration * 1000:.1f} ms")
+
+    def reload_data(self) -> CatalogSnapshot:
+        """
+        Dựng snapshot mới từ database.csv rồi thay thế snapshot cũ;
+        request đang chạy vẫn dùng snapshot cũ cho tới khi xong
+        """
+        with self._reload_lock:
+            snapshot = self._reload_locked()
+        self._finish_reload(snapshot)
+        return snapshot
+
+    def _reload_locked(self, log_locked: bool = False) -> CatalogSnapshot:
+        snapshot = self._load_snapshot(self.snapshot.version + 1, log_locked)
+        self._build_recommendations(snapshot, previous=self.snapshot)
+        self.snapshot = snapshot
+        return snapshot
+
+    def _finish_reload(self, snapshot: CatalogSnapshot):
+        # Ngoài _reload_lock: chỉ mục ngữ nghĩa dựng xong (kể cả dựng ngay) sẽ lấy lại khóa này
+        self.cache.clear()
+        self._build_semantic(snapshot)
+        print(f"Catalog reloaded: version {snapshot.version}, {snapshot.index.count} products "
+              f"in {snapshot.load_duration * 1000:.1f} ms")
+
+    def start_watcher(self, interval: float = CATALOG_POLL_INTERVAL):
+        if not self.watch_catalog or interval <= 0 or (self.watcher is not None and self.watcher.running):
+            return
+        self.watcher = CatalogWatcher(DATABASE, self.reload_data, interval, self.snapshot.source_stat)
+        self.watcher.start()
+
+    def stop_watcher(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+
+    def apply_catalog_changes(self, entries: List[dict]) -> dict:
+        """
+        Áp dụng upsert/delete (đã qua CatalogChanges.parse_entry) lên catalog đang phục vụ: kiểm tra với dữ liệu
+        hiện tại, ghi change log rồi dựng snapshot mới theo phần thay đổi (ProductIndex.apply).
+        ValueError nếu có thay đổi không hợp lệ; khi đó không có gì được ghi
+        """
+        if self.change_log is None:
+            raise RuntimeError("Catalog updates are disabled (CHANGE_LOG is empty)")
+        if not entries:
+            raise ValueError("No catalog changes")
+        started = time.perf_counter()
+        with self._reload_lock:
+            with self.change_log.locked():
+                # Thay đổi do worker khác ghi trước phải được áp dụng trước khi kiểm tra lô này
+                reloaded = self._sync_changes_locked()
+                changes, counts = resolve(self.snapshot.index, coalesce(entries))
+                offset = self.change_log.append(entries) if changes else self.snapshot.log_offset
+            if changes:
+                self._apply_changes_locked(changes, offset, self.snapshot.log_generation)
+            snapshot = self.snapshot
+        if reloaded is not None:
+            self._finish_reload(reloaded)
+        for result, count in counts.items():
+            if count:
+                CATALOG_CHANGES.inc(result, amount=count)
+        return {
+            "version": snapshot.version,
+            "change_log_offset": snapshot.log_offset,
+            "total_products": snapshot.index.count,
+            **counts,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def sync_changes(self):
+        """
+        Áp dụng thay đổi mà process khác đã ghi vào change log (gọi định kỳ bởi ChangeLogFollower)
+        """
+        if self.change_log is None or self._log_unchanged(self.snapshot):
+            return
+        # Khóa chia sẻ: generation và nội dung log đọc được phải cùng một lần gộp log
+        with self._reload_lock, self.change_log.locked(shared=True):
+            reloaded = self._sync_changes_locked()
+        if reloaded is not None:
+            self._finish_reload(reloaded)
+
+    def _log_unchanged(self, snapshot: CatalogSnapshot) -> bool:
+        return (self.change_log.size() == snapshot.log_offset
+                and self.change_log.generation() == snapshot.log_generation)
+
+    def _sync_changes_locked(self) -> Optional[CatalogSnapshot]:
+        """
+        Áp dụng phần log mới kể từ offset của snapshot. Trả về snapshot mới nếu phải dựng lại đầy đủ
+        (người gọi gọi _finish_reload sau khi nhả _reload_lock), None nếu không
+        """
+        snapshot = self.snapshot
+        if self._log_unchanged(snapshot):
+            return None
+        generation = self.change_log.generation()
+        if generation != snapshot.log_generation or self.change_log.size() < snapshot.log_offset:
+            # Log đã được gộp vào catalog gốc (`CatalogChanges.py compact`). Worker chậm có thể chưa áp dụng
+            # hết các dòng của generation cũ, nên không thể chỉ đọc log mới: dựng lại từ CSV đã gộp + log mới
+            return self._reload_locked(log_locked=True)
+        entries, end = self.change_log.read(snapshot.log_offset)
+        if end == snapshot.log_offset:
+            return None
+        changes, counts = resolve(snapshot.index, coalesce(entries), strict=False) if entries else ([], {})
+        self._apply_changes_locked(changes, end, generation)
+        for result, count in counts.items():
+            if count:
+                CATALOG_CHANGES.inc(result, amount=count)
+        return None
+
+    def _apply_changes_locked(self, changes: list, offset: int, generation: Optional[str]) -> CatalogSnapshot:
+        previous = self.snapshot
+        snapshot = previous.apply_changes(changes, offset, generation)
+        kept = self._carry_over_cache(previous, snapshot, changes)
+        self.snapshot = snapshot
+        print(f"Catalog changes applied: version {snapshot.version}, {len(changes)} rows "
+              f"in {snapshot.load_duration * 1000:.1f} ms, {kept} cached results kept")
+        return snapshot
+
+    def _carry_over_cache(self, previous: CatalogSnapshot, snapshot: CatalogSnapshot, changes: list) -> int:
+        """
+        Chuyển kết quả cache sang snapshot mới, trừ kết quả của filter mà dòng đổi (trước hoặc sau khi đổi)
+        có thể khớp; các kết quả còn lại không chứa và không thiếu dòng nào bị đổi nên vẫn đúng
+        """
+        if len(changes) > CHANGE_CACHE_MAX_ROWS:
+            self.cache.clear()
+            return 0
+        old_token, new_token = previous.cache_token, snapshot.cache_token
+        records = [record for _, old, new in changes for record in (old, new) if record is not None]
+
+        def rekey(key):
+            if not (isinstance(key, tuple) and len(key) == 4 and key[0] == 'ordered' and key[1] == old_token):
+                return None
+            filter_dict = dict(key[3])
+            if any(ProductIndex.row_matches(record, filter_dict) for record in records):
+                return None
+            return (key[0], new_token) + key[2:]
+
+        return self.cache.rekey(rekey)
+
+    def start_change_follower(self, interval: float = CHANGE_LOG_POLL_INTERVAL):
+        if self.change_log is None or interval <= 0 or (self.change_follower is not None and self.change_follower.running):
+            return
+        self.change_follower = ChangeLogFollower(self.sync_changes, interval)
+        self.change_follower.start()
+
+    def stop_change_follower(self):
+        if self.change_follower is not None:
+            self.change_follower.stop()
+
+    def catalog_status(self) -> dict:
+        status = self.snapshot.status()
+        status["source"] = DATABASE
+        status["watcher_running"] = self.watcher is not None and self.watcher.running
+        status["last_reload_error"] = self.watcher.last_error if self.watcher else None
+        status["change_log"] = {
+            "path": CHANGE_LOG or None,
+            "size": self.change_log.size() if self.change_log is not None else None,
+            "applied_offset": self.snapshot.log_offset,
+            "applied_generation": self.snapshot.log_generation,
+            "follower_running": self.change_follower is not None and self.change_follower.running,
+            "last_error": self.change_follower.last_error if self.change_follower else None,
+        }
+        return status
+
     def _load_system_prompt(self) -> str:
         try:
             with open(PROMPT_TEMPLATE, 'r', encoding='utf-8') as file:
@@ -81,130 +446,59 @@ class AnalysisManager:
             raise FileNotFoundError("System prompt file 'huggingface_prompt.txt' not found.")
 
     def get_or_create_session(self, session_id: Optional[str] = None):
-        if session_id and session_id in self.sessions:
-            return self.sessions[session_id]
-        new_session = Session(session_id)
-        self.sessions[new_session.session_id] = new_session
-        return new_session
+        if session_id:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                return session
+        # Session mới chỉ được lưu khi có lịch sử (xem _analytical_model),
+        # nên request /products dạng form không làm phình session store
+        return Session(session_id, max_history=SESSION_MAX_HISTORY)
 
     def clear_session(self, session_id: str) -> bool:
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
-        return False
-
-    def _analytical_model(self, session: Session, user_content: str, system_content: Optional[str] = None) -> str:
-        if not self.hf_available:
-            raise Exception("Hugging Face API is not available")
+        return self.sessions.delete(session_id)
+
+    async def _analytical_model(self, session: Session, user_content: str, system_content: Optional[str] = None,
+                                question: Optional[str] = None) -> str:
+        if not self.model_available:
+            LLM_REQUESTS.inc("unavailable")
+            raise Exception(f"Model backend '{self.model.name}' is not available")
             
         if system_content:
             session.set_system_context(system_content)
 
         session.add_session('user', user_content)
         
-        # Tạo prompt tối ưu cho Hugging Face API
-        full_prompt = f"{system_content}\n\nUser Request: {user_content}\nAssistant Response:"
-        
-        # Gọi Hugging Face API với parameters tối ưu
-        headers = {}
-        if self.hf_token:
-            headers["Authorization"] = f"Bearer {self.hf_token}"
-        
-        payload = {
-            "inputs": full_prompt,
-            "parameters": {
-                "max_length": 150,
-                "temperature": 0.3,  # Lower temperature for more consistent output
-                "do_sample": True,
-                "return_full_text": False,
-                "top_p": 0.9,
-                "repetition_penalty": 1.1,
-                "pad_token_id": 50256  # GPT-2 pad token
-            }
-        }
-        
         try:
-            response = requests.post(HF_API_URL, headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    generated_text = result[0].get("generated_text", "")
-                    # Clean up the response to extract only the dictionary
-                    final_response = self._extract_dict_from_response(generated_text)
-                else:
-                    final_response = str(result)
-            else:
-                raise Exception(f"Hugging Face API error: {response.status_code} - {response.text}")
-                
+            with span("llm"):
+                final_response, shared = await self.llm_flights.do(
+                    (system_content, self._question_key(user_content)),
+                    lambda: self.model.generate(question or user_content, system_content or "", user_content)
+                )
+            if shared:
+                LLM_COALESCED.inc()
+        except LoadShedError:
+            LLM_REQUESTS.inc("shed")
+            raise
         except Exception as e:
-            raise Exception(f"Error calling Hugging Face API: {str(e)}")
+            LLM_REQUESTS.inc("error")
+            raise Exception(f"Error calling model backend '{self.model.name}': {str(e)}")
 
         session.add_session('assistant', final_response)
+        self.sessions.put(session)
         return final_response
 
-    def _extract_dict_from_response(self, text: str) -> str:
-        """
-        Extract Python dictionary from Hugging Face response
-        """
-        import re
-        
-        # Look for dictionary pattern in the response
-        dict_pattern = r'\{[^}]*\}'
-        matches = re.findall(dict_pattern, text)
-        
-        if matches:
-            # Return the first valid dictionary found
-            return matches[0]
-        
-        # If no dictionary found, try to clean the text
-        cleaned = text.strip()
-        
-        # Remove common prefixes/suffixes
-        prefixes_to_remove = [
-            "Assistant Response:",
-            "Response:",
-            "Answer:",
-            "Output:",
-            "Result:"
-        ]
-        
-        for prefix in prefixes_to_remove:
-            if cleaned.startswith(prefix):
-                cleaned = cleaned[len(prefix):].strip()
-        
-        return cleaned
+    @staticmethod
+    def _question_key(question: str) -> str:
+        # Khác nhau chỉ ở hoa thường/khoảng trắng/dạng Unicode thì coi là cùng câu hỏi (giữ dấu: 'ba' khác 'bà')
+        return " ".join(unicodedata.normalize("NFC", question).lower().split())
 
+    @timed("filter")
     def _rule_based_filtering_from_database(self, question_data: dict) -> dict:
         """
         Rule-based filtering dựa trên database thực tế - FALLBACK MIỄN PHÍ
         """
         filter_dict = {}
         
-        # Map Vietnamese to database categories
-        category_mapping = {
-            'áo sơ mi': 'shirt', 'áo thun': 'shirt', 'áo polo': 'shirt',
-            'quần jeans': 'pants', 'quần tây': 'pants', 'quần jogger': 'pants', 'quần': 'pants',
-            'váy': 'dress', 'đầm': 'dress',
-            'áo khoác': 'jacket', 'áo bomber': 'jacket', 'áo dù': 'jacket',
-            'áo hoodie': 'hoodie', 'áo nỉ': 'hoodie',
-            'quần short': 'shorts', 'quần đùi': 'shorts',
-            'áo len': 'sweater', 'áo cardigan': 'sweater',
-            'quần legging': 'leggings', 'quần bó': 'leggings',
-            'áo vest': 'vest', 'áo gile': 'vest',
-            'đồng hồ': 'watch',
-            'ví': 'wallet', 'ví da': 'wallet',
-            'túi xách': 'bag', 'balo': 'bag', 'cặp': 'bag', 'túi': 'bag',
-            'giày': 'shoes', 'dép': 'shoes', 'sandal': 'shoes',
-            'mũ': 'hat', 'nón': 'hat',
-            'phụ kiện': 'accessory', 'đồ phụ kiện': 'accessory',
-            'thắt lưng': 'belt', 'dây nịt': 'belt',
-            'khăn': 'scarf', 'khăn quàng': 'scarf',
-            'tất': 'socks', 'vớ': 'socks',
-            'kính': 'glasses', 'mắt kính': 'glasses',
-            'nước hoa': 'perfume', 'perfume': 'perfume'
-        }
-        
         # Extract category from preferences (check both 'preferences' and 'Preferences')
         preferences_key = None
         if 'preferences' in question_data and question_data['preferences']:
@@ -213,103 +507,89 @@ class AnalysisManager:
             preferences_key = 'Preferences'
             
         if preferences_key:
-            pref = question_data[preferences_key].lower().strip()
-            
-            # First try exact match
-            if pref in category_mapping:
-                filter_dict['category'] = category_mapping[pref]
+            # Matcher dựng sẵn: khớp nguyên văn, cụm dài nhất (không phân biệt dấu), rồi phần đầu của khóa
+            category = CATEGORY_MATCHER.resolve(question_data[preferences_key])
+            if category:
+                filter_dict['category'] = category
             else:
-                # Then try partial match
-                for viet, eng in category_mapping.items():
-                    if viet in pref or pref in viet:
-                        filter_dict['category'] = eng
-                        break
-                # If still no match, try direct English category names
-                if 'category' not in filter_dict:
-                    available_categories = ['shirt', 'pants', 'dress', 'jacket', 'hoodie', 'shorts', 
-                                          'sweater', 'leggings', 'vest', 'watch', 'wallet', 'bag', 
-                                          'shoes', 'hat', 'accessory', 'belt', 'scarf', 'socks', 
-                                          'glasses', 'perfume']
-                    for cat in available_categories:
-                        if cat in pref:
-                            filter_dict['category'] = cat
-                            break
+                # Không khớp bảng từ đồng nghĩa -> tìm theo nội dung product_name/description
+                filter_dict['query'] = question_data[preferences_key]
         
         # Map gender
         if 'sex' in question_data:
-            sex = question_data['sex'].lower().strip()
-            if sex in ['nam', 'male', 'đàn ông', 'anh', 'bố', 'ba', 'cha', 'ông']:
-                filter_dict['sex'] = 'male'
-            elif sex in ['nữ', 'female', 'phụ nữ', 'chị', 'em gái', 'mẹ', 'má', 'bà']:
-                filter_dict['sex'] = 'female'
-            elif sex in ['trẻ em', 'bé', 'con']:
-                filter_dict['sex'] = 'unisex'
-            else:
-                # Default to unisex if unclear
-                filter_dict['sex'] = 'unisex'
+            # Default to unisex if unclear
+            filter_dict['sex'] = SEX_MATCHER.lookup(question_data['sex']) or 'unisex'
         
         # Parse budget based on database price range (69k - 7.99M)
         if 'budget' in question_data and question_data['budget']:
             try:
                 budget_str = question_data['budget'].replace('.', '').replace(',', '').replace('đ', '').replace('vnd', '').strip()
-                budget = int(budget_str)
-                
-                # Smart price ranges based on database - NEVER exceed budget
-                if budget < 200000:
-                    filter_dict['min_price'] = 69000
-                    filter_dict['max_price'] = budget  # Don't exceed budget
-                elif budget < 500000:
-                    filter_dict['min_price'] = int(budget * 0.5)
-                    filter_dict['max_price'] = budget  # Don't exceed budget
-                elif budget < 1000000:
-                    filter_dict['min_price'] = int(budget * 0.6)
-                    filter_dict['max_price'] = budget  # Don't exceed budget
-                elif budget < 3000000:
-                    filter_dict['min_price'] = int(budget * 0.7)
-                    filter_dict['max_price'] = budget  # Don't exceed budget
-                else:
-                    # For high budgets, set reasonable range within database limits
-                    filter_dict['min_price'] = 69000
-                    filter_dict['max_price'] = min(budget, 7990000)  # Don't exceed budget or database max
+                filter_dict['min_price'], filter_dict['max_price'] = budget_price_range(int(budget_str))
             except:
                 filter_dict['min_price'] = 69000
                 filter_dict['max_price'] = 500000
-        
+
+        # Filter mở rộng: nhiều category (OR, gộp với category từ Preferences), brand, rating, tồn kho, loại trừ
+        categories = [c for c in (CATEGORY_MATCHER.resolve(str(p)) for p in question_data.get('categories') or []) if c]
+        if categories:
+            merged = list(dict.fromkeys(([filter_dict['category']] if 'category' in filter_dict else []) + categories))
+            filter_dict['category'] = merged[0] if len(merged) == 1 else merged
+        if question_data.get('exclude_categories'):
+            filter_dict['exclude_categories'] = [CATEGORY_MATCHER.resolve(str(c)) or c
+                                                 for c in question_data['exclude_categories']]
+        if question_data.get('brands'):
+            filter_dict['brand'] = list(question_data['brands'])
+        for key in ('exclude_brands', 'exclude_product_ids'):
+            if question_data.get(key):
+                filter_dict[key] = list(question_data[key])
+        if question_data.get('min_rating') is not None:
+            filter_dict['min_rating'] = float(question_data['min_rating'])
+        if question_data.get('in_stock_only'):
+            filter_dict['in_stock_only'] = True
+
         return filter_dict
 
-    def _model_response(self, question: str, session_id: Optional[str] = None) -> tuple:
+    async def _model_response(self, question: str, session_id: Optional[str] = None) -> tuple:
         try:
             session = self.get_or_create_session(session_id)
             
             # ✅ Ưu tiên rule-based filtering vì AI model không ổn định
             if isinstance(question, dict):
                 filter_dict = self._rule_based_filtering_from_database(question)
-                products = self.search_products(filter_dict)
+                products = self.search_products(filter_dict, question)
                 return (products, session.session_id)
             
-            # Try Hugging Face API as fallback for string questions
-            if self.hf_available and isinstance(question, str):
+            # Câu hỏi dạng chuỗi: model backend (mặc định chạy trong process) suy ra filter
+            if self.model_available and isinstance(question, str):
                 try:
                     base_system_prompt = self._load_system_prompt()
                     user_prompt = f"User question: {question}\n\nAvailable categories: {', '.join(self.categories)}"
-                    response = self._analytical_model(session, user_prompt, base_system_prompt)
+                    response = await self._analytical_model(session, user_prompt, base_system_prompt, question)
 
                     # ✅ Chuyển chuỗi AI trả về thành dict (nếu AI format chuẩn)
                     try:
                         parsed = ast.literal_eval(response)
                         if isinstance(parsed, dict):
-                            return (self.search_products(parsed), session.session_id)
+                            LLM_REQUESTS.inc("success")
+                            # Người nhận/dịp nhắc trong câu hỏi dùng được bảng gợi ý khi filter chỉ có giới tính/giá
+                            context = self.taxonomy.extract(question) if self.taxonomy is not None else None
+                            return (self.search_products(parsed, context), session.session_id)
                     except Exception:
                         pass  # fallback nếu không parse được
 
-                    # Nếu không parse được hoặc không hợp lệ
+                    # AI trả về không đúng format -> tìm kiếm ngữ nghĩa offline
+                    LLM_REQUESTS.inc("invalid_format")
+                    products = self.semantic_products(question)
+                    if products is not None:
+                        return (products, session.session_id)
                     return (f"Error occurred: Invalid AI response format -> {response}", session.session_id)
                 except Exception as e:
-                    # AI failed, fallback to all products
-                    return (self.search_products({}), session.session_id)
+                    # AI failed (hoặc backlog đầy: LoadShedError), fallback to semantic search (or all products)
+                    return (self.semantic_products(question) or self.search_products({}), session.session_id)
             else:
-                # If question is string and no AI, return all products
-                return (self.search_products({}), session.session_id)
+                LLM_REQUESTS.inc("unavailable")
+                # If question is string and no AI, search offline by content (or return all products)
+                return (self.semantic_products(question) or self.search_products({}), session.session_id)
 
         except Exception as e:
             if not session_id:
@@ -317,22 +597,203 @@ class AnalysisManager:
                 session_id = session.session_id
             return (f"Error occurred while processing your form: {str(e)}", session_id)
 
-    def search_products(self, filter_dict: dict) -> List[dict]:
-        mask = pd.Series([True] * len(self.data))
-        if 'category' in filter_dict:
-            mask &= self.data['category'] == filter_dict['category']
-        if 'sex' in filter_dict:
-            mask &= self.data['sex'] == filter_dict['sex']
-        if 'min_price' in filter_dict:
-            mask &= self.data['price'] >= filter_dict['min_price']
-        if 'max_price' in filter_dict:
-            mask &= self.data['price'] <= filter_dict['max_price']
-        filtered = self.data[mask].reset_index(drop=True)
-        return filtered.to_dict('records') if not filtered.empty else []
-
-    def get_all_products(self, question, session_id):
-        return self._model_response(question, session_id)
-def handle_question(analysis_manager: AnalysisManager, prompt) -> dict:
+    @timed("search")
+    def search_products(self, filter_dict: dict, question_data: Optional[dict] = None) -> List[dict]:
+        # Cache giữ vị trí đã sắp xếp (nhỏ, pickle nhanh khi cache dùng chung giữa worker), không giữ list dict
+        snapshot = self.snapshot
+        positions = self.recommended_positions(question_data, filter_dict, snapshot)
+        if positions is None:
+            positions = self.match_products(filter_dict, DEFAULT_SORT, snapshot)
+        return snapshot.index.take(positions)
+
+    def recommended_positions(self, question_data: Optional[dict], filter_dict: dict,
+                              snapshot: CatalogSnapshot) -> Optional[np.ndarray]:
+        """
+        Form chỉ có giới tính/ngân sách (không category, query hay filter mở rộng): tra bảng gợi ý dựng sẵn
+        theo người nhận và dịp rồi lọc ngân sách, không chạm tới phần còn lại của catalog (bảng được dựng lại
+        cùng chỉ mục khi catalog đổi nên chỉ chứa sản phẩm còn bán). None nếu không áp dụng được hoặc hàng
+        của bảng còn quá ít sản phẩm (khi đó lọc toàn bộ như cũ).
+        Chỉ trả về phần đầu đã xếp theo bảng (tối đa top của nhóm), không phải toàn bộ sản phẩm khớp filter;
+        thứ tự của bảng khác thứ tự theo sort của phân trang/stream/batch (xem page_positions)
+        """
+        table = snapshot.recommendations
+        if table is None or not question_data or not RecommendationTable.applies(filter_dict):
+            return None
+        return table.lookup(question_data.get('gift_recipient'), question_data.get('occasion'),
+                            filter_dict.get('sex'), filter_dict.get('min_price'), filter_dict.get('max_price'))
+
+    @timed("semantic")
+    def semantic_products(self, question: str, limit: int = 50) -> Optional[List[dict]]:
+        """
+        Thay cho LLM: top sản phẩm liên quan tới câu hỏi theo chỉ mục ngữ nghĩa;
+        None nếu chỉ mục chưa sẵn sàng hoặc không có sản phẩm liên quan
+        """
+        snapshot = self.snapshot
+        if snapshot.index.semantic is None or not question.strip():
+            return None
+        filter_dict = {'query': question}
+        positions = snapshot.index.semantic.restrict(question, snapshot.index.match({}))
+        if len(positions) == 0:
+            return None
+        return snapshot.index.take(snapshot.index.top(positions, limit, DEFAULT_SORT, filter_dict))
+
+    def _ordered_cache_key(self, snapshot: CatalogSnapshot, sort: str, filter_dict: dict):
+        key = normalize_filter(filter_dict)
+        return None if key is None else ('ordered', snapshot.cache_token, sort, key)
+
+    def match_products(self, filter_dict: dict, sort: str = DEFAULT_SORT,
+                       snapshot: Optional[CatalogSnapshot] = None) -> np.ndarray:
+        """
+        Vị trí sản phẩm khớp filter, đã sắp xếp theo sort (có cache)
+        """
+        snapshot = snapshot or self.snapshot
+        cache_key = self._ordered_cache_key(snapshot, sort, filter_dict)
+        ordered = self.cache.get(cache_key) if cache_key is not None else None
+        if ordered is None:
+            ordered = snapshot.index.order(snapshot.index.match(filter_dict), sort, filter_dict)
+            if cache_key is not None:
+                self.cache.put(cache_key, ordered)
+        return ordered
+
+    @timed("facets")
+    def facet_counts(self, filter_dict: dict, fields=('brand', 'category'), sort: str = DEFAULT_SORT) -> dict:
+        """
+        Số sản phẩm khớp filter theo từng giá trị brand/category, đếm trên bitmap của toàn bộ kết quả.
+        Không phụ thuộc thứ tự: dùng danh sách đã sắp xếp nếu có trong cache, không thì chỉ lọc (không sắp xếp)
+        """
+        snapshot = self.snapshot
+        cache_key = self._ordered_cache_key(snapshot, sort, filter_dict)
+        positions = self.cache.get(cache_key) if cache_key is not None else None
+        if positions is None:
+            positions = snapshot.index.match(filter_dict)
+        return snapshot.index.facets(positions, fields)
+
+    def _first_page(self, snapshot: CatalogSnapshot, positions: np.ndarray, filter_dict: dict,
+                    sort: str, limit: int) -> Tuple[np.ndarray, Optional[str]]:
+        # Trang đầu chỉ cần top-k (argpartition), không sắp xếp toàn bộ kết quả
+        top = snapshot.index.top(positions, limit, sort, filter_dict)
+        next_cursor = None
+        if len(positions) > limit and len(top):
+            next_cursor = snapshot.index.cursor_after(top[-1], sort, filter_dict)
+        return top, next_cursor
+
+    @timed("search")
+    def page_positions(self, filter_dict: dict, sort: str = DEFAULT_SORT, limit: int = 20,
+                       cursor: Optional[str] = None) -> Tuple[ProductIndex, np.ndarray, Optional[str], int]:
+        """
+        Phân trang theo cursor; trả về chỉ mục của snapshot đã dùng cùng vị trí của trang
+        để API ghép JSON đã encode sẵn (index.take_json) hoặc lấy dict (index.take).
+        Luôn xếp theo sort, không theo bảng gợi ý (cursor chỉ ổn định trên một khóa sắp xếp);
+        stream_products và batch_products cũng vậy
+        """
+        snapshot = self.snapshot
+        cache_key = self._ordered_cache_key(snapshot, sort, filter_dict)
+        ordered = self.cache.get(cache_key) if cache_key is not None else None
+        if ordered is None and not cursor:
+            positions = snapshot.index.match(filter_dict)
+            top, next_cursor = self._first_page(snapshot, positions, filter_dict, sort, limit)
+            return snapshot.index, top, next_cursor, len(positions)
+        if ordered is None:
+            ordered = self.match_products(filter_dict, sort, snapshot)
+        positions, next_cursor = snapshot.index.page(ordered, sort, limit, cursor, filter_dict)
+        return snapshot.index, positions, next_cursor, len(ordered)
+
+    def page_products(self, filter_dict: dict, sort: str = DEFAULT_SORT, limit: int = 20,
+                      cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str], int]:
+        """
+        Phân trang theo cursor; chỉ materialize đúng `limit` bản ghi
+        """
+        index, positions, next_cursor, total = self.page_positions(filter_dict, sort, limit, cursor)
+        return index.take(positions), next_cursor, total
+
+    @timed("search")
+    def stream_products(self, filter_dict: dict, sort: str = DEFAULT_SORT,
+                        cursor: Optional[str] = None) -> Tuple[Iterator[bytes], int]:
+        """
+        NDJSON sinh dần từ chỉ mục thay vì dựng cả danh sách trong bộ nhớ
+        """
+        snapshot = self.snapshot
+        ordered = self.match_products(filter_dict, sort, snapshot)
+        start = snapshot.index.seek(ordered, sort, cursor, filter_dict)
+        return snapshot.index.iter_ndjson(ordered, start), len(ordered) - start
+
+    @timed("batch")
+    def batch_products(self, questions: List[dict], sort: str = DEFAULT_SORT, limit: int = 20) -> Tuple[List[dict], int]:
+        """
+        Gợi ý cho nhiều GiftPrompt một lượt: gộp các filter trùng nhau và
+        đánh giá các filter còn lại bằng một lần match_many trên chỉ mục
+        """
+        snapshot = self.snapshot
+        index = snapshot.index
+        filters = [self._rule_based_filtering_from_database(q) for q in questions]
+
+        keys = []
+        unique: Dict = {}
+        for i, filter_dict in enumerate(filters):
+            # Filter không hash được thì đánh giá riêng theo vị trí
+            key = normalize_filter(filter_dict)
+            key = key if key is not None else ('unhashable', i)
+            keys.append(key)
+            unique.setdefault(key, filter_dict)
+
+        pages: Dict = {}
+        matched = index.match_many(list(unique.values()))
+        fallback_positions = None
+        for key, filter_dict, positions in zip(unique.keys(), unique.values(), matched):
+            status = "success"
+            if len(positions) == 0:
+                # Giống /products: không có sản phẩm khớp thì trả về toàn bộ catalog
+                if fallback_positions is None:
+                    fallback_positions = index.match({})
+                positions, filter_dict = fallback_positions, {}
+                status = "success_with_fallback"
+            top, next_cursor = self._first_page(snapshot, positions, filter_dict, sort, limit)
+            pages[key] = (status, len(positions), next_cursor, index.take(top))
+
+        results = []
+        for question, filter_dict, key in zip(questions, filters, keys):
+            status, total, next_cursor, products = pages[key]
+            results.append({
+                "status": status,
+                "prompt": question,
+                "filter": filter_dict,
+                "total_products": total,
+                "next_cursor": next_cursor,
+                "products": products,
+            })
+        return results, len(unique)
+
+    def product_positions(self, question_data: dict, session_id: Optional[str] = None):
+        """
+        Như _model_response cho form GiftPrompt (luôn rule-based) nhưng trả về
+        (chỉ mục, vị trí đã xếp hạng, tổng số sản phẩm khớp filter) thay vì list dict; lỗi trả về chuỗi
+        như _model_response. Khi dùng bảng gợi ý, vị trí chỉ là phần đầu của bảng còn tổng đếm trên posting list
+        """
+        session = self.get_or_create_session(session_id)
+        try:
+            filter_dict = self._rule_based_filtering_from_database(question_data)
+            snapshot = self.snapshot
+            with span("search"):
+                positions = self.recommended_positions(question_data, filter_dict, snapshot)
+                if positions is None:
+                    positions = self.match_products(filter_dict, DEFAULT_SORT, snapshot)
+                    total = len(positions)
+                else:
+                    total = snapshot.index.match_count(filter_dict)
+            return (snapshot.index, positions, total), session.session_id
+        except Exception as e:
+            return f"Error occurred while processing your form: {str(e)}", session.session_id
+
+    async def get_all_products(self, question, session_id):
+        return await self._model_response(question, session_id)
+
+    async def aclose(self):
+        self.stop_watcher()
+        self.stop_change_follower()
+        await self.model.aclose()
+
+
+async def handle_question(analysis_manager: AnalysisManager, prompt) -> dict:
     try:
         question_data = prompt.question.strip()
         if not question_data:
@@ -343,7 +804,7 @@ def handle_question(analysis_manager: AnalysisManager, prompt) -> dict:
                 "note": "Prompt trống. Đã trả về toàn bộ sản phẩm.",
                 "products": fallback_products
             }
-        response = analysis_manager.get_all_products(question_data, prompt.session_id)
+        response = await analysis_manager.get_all_products(question_data, prompt.session_id)
         return {
             "status": "success",
             "prompt": question_data,
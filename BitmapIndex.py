@@ -0,0 +1,429 @@
+import copy
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from TextMatcher import normalize_text
+
+FACET_FIELDS = ('brand', 'category', 'sex')
+# Khóa filter mở rộng; filter chỉ có category/sex/giá vẫn đi đường posting list của ProductIndex
+EXTENDED_KEYS = ('brand', 'min_rating', 'min_reviews', 'in_stock_only',
+                 'exclude_brands', 'exclude_categories', 'exclude_product_ids')
+# Giá trị xuất hiện ở ít hơn 1/64 số sản phẩm lưu dạng mảng vị trí thay vì bitmap
+# (giống container array/bitmap của roaring bitmap)
+SPARSE_RATIO = 1 / 64
+RANGE_BUCKETS = 64
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words: np.ndarray, axis: int = -1) -> np.ndarray:
+        return np.bitwise_count(words).sum(axis=axis, dtype=np.int64)
+else:  # numpy < 2.0
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words: np.ndarray, axis: int = -1) -> np.ndarray:
+        bytes_view = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+        return _POPCOUNT8[bytes_view].sum(axis=axis, dtype=np.int64)
+
+
+def n_words(size: int) -> int:
+    return (size + 63) // 64
+
+
+def from_mask(mask: np.ndarray) -> np.ndarray:
+    """
+    Mảng bool -> bitset uint64 (bit i của word i // 64 ứng với sản phẩm i)
+    """
+    packed = np.packbits(mask, bitorder='little')
+    padded = np.zeros(n_words(len(mask)) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def from_positions(positions: np.ndarray, size: int) -> np.ndarray:
+    mask = np.zeros(size, dtype=bool)
+    mask[positions] = True
+    return from_mask(mask)
+
+
+def set_bits(words: np.ndarray, positions: np.ndarray, value: bool = True):
+    """
+    Bật/tắt bit tại các vị trí (dùng cho số ít vị trí, không dựng mask cả catalog)
+    """
+    if len(positions) == 0:
+        return
+    positions = np.asarray(positions, dtype=np.uint64)
+    bits = np.left_shift(np.uint64(1), positions & np.uint64(63))
+    index = (positions >> np.uint64(6)).astype(np.int64)
+    if value:
+        np.bitwise_or.at(words, index, bits)
+    else:
+        np.bitwise_and.at(words, index, ~bits)
+
+
+def resized(words: np.ndarray, size: int) -> np.ndarray:
+    """
+    Bản sao bitset (hoặc ma trận bitset) đủ chỗ cho size sản phẩm, các bit mới bằng 0
+    """
+    extra = n_words(size) - words.shape[-1]
+    if extra <= 0:
+        return words.copy()
+    return np.concatenate([words, np.zeros(words.shape[:-1] + (extra,), dtype=np.uint64)], axis=-1)
+
+
+def to_positions(words: np.ndarray, size: int) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little', count=size))
+
+
+def _as_list(value) -> List:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+def _number(record: Optional[dict], column: str) -> float:
+    value = None if record is None else record.get(column)
+    return np.nan if value is None else float(value)
+
+
+class ValueBitmaps:
+    """
+    Một bitset cho mỗi giá trị của cột phân loại (category, sex, brand).
+    Giá trị phổ biến: hàng của ma trận dense; giá trị hiếm: mảng vị trí
+    """
+
+    def __init__(self, values: np.ndarray, size: int, normalize: bool = False) -> None:
+        self.size = size
+        codes, vocab = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(vocab))
+        self.values: List[str] = [str(v) for v in vocab]
+        self.lookup: Dict[str, int] = {}
+        for code, value in enumerate(self.values):
+            self.lookup.setdefault(value, code)
+            if normalize:
+                self.lookup.setdefault(normalize_text(value), code)
+        self.normalize = normalize
+
+        dense_codes = np.flatnonzero(counts >= max(size * SPARSE_RATIO, 1))
+        self.dense_row = np.full(len(vocab), -1, dtype=np.int64)
+        self.dense_row[dense_codes] = np.arange(len(dense_codes))
+        self.dense = np.zeros((len(dense_codes), n_words(size)), dtype=np.uint64)
+        for row, code in enumerate(dense_codes):
+            self.dense[row] = from_mask(codes == code)
+
+        # Giá trị hiếm: vị trí gom theo giá trị (CSR)
+        sparse = (codes >= 0) & (self.dense_row[np.maximum(codes, 0)] < 0)
+        sparse_positions = np.flatnonzero(sparse)
+        order = np.argsort(codes[sparse_positions], kind='stable')
+        self.sparse_positions = sparse_positions[order]
+        self.sparse_codes = codes[sparse_positions][order]
+        self.sparse_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.sparse_codes, minlength=len(vocab)), out=self.sparse_offsets[1:])
+
+    def code(self, value) -> Optional[int]:
+        if value is None:
+            return None
+        value = str(value)
+        code = self.lookup.get(value)
+        if code is None and self.normalize:
+            code = self.lookup.get(normalize_text(value))
+        return code
+
+    def any_of(self, values: Iterable) -> np.ndarray:
+        """
+        OR các bitmap của những giá trị được chọn; giá trị không có trong catalog bị bỏ qua
+        """
+        result = np.zeros(n_words(self.size), dtype=np.uint64)
+        for value in values:
+            code = self.code(value)
+            if code is None:
+                continue
+            row = self.dense_row[code]
+            if row >= 0:
+                result |= self.dense[row]
+            else:
+                set_bits(result, self.sparse_positions[self.sparse_offsets[code]:self.sparse_offsets[code + 1]])
+        return result
+
+    def counts(self, words: np.ndarray) -> Dict[str, int]:
+        """
+        Số sản phẩm trong bitset theo từng giá trị: AND cả ma trận dense một lượt + kiểm tra bit cho giá trị hiếm
+        """
+        counts = np.zeros(len(self.values), dtype=np.int64)
+        if len(self.dense):
+            dense_codes = np.flatnonzero(self.dense_row >= 0)
+            counts[dense_codes] = popcount(self.dense & words[None, :], axis=1)
+        if len(self.sparse_positions):
+            positions = self.sparse_positions.astype(np.uint64)
+            hit = (words[(positions >> np.uint64(6)).astype(np.int64)] >> (positions & np.uint64(63))) & np.uint64(1)
+            counts += np.bincount(self.sparse_codes, weights=hit, minlength=len(self.values)).astype(np.int64)
+        order = np.argsort(-counts, kind='stable')
+        return {self.values[i]: int(counts[i]) for i in order if counts[i] > 0}
+
+    def _add_value(self, value) -> int:
+        code = len(self.values)
+        self.values.append(str(value))
+        self.lookup.setdefault(self.values[code], code)
+        if self.normalize:
+            self.lookup.setdefault(normalize_text(self.values[code]), code)
+        self.dense_row = np.append(self.dense_row, -1)
+        return code
+
+    def apply(self, size: int, changes: List[Tuple[int, Any, Any]]) -> "ValueBitmaps":
+        """
+        Bản sao sau khi đổi giá trị tại các vị trí (vị trí, giá trị cũ, giá trị mới; None = không có).
+        Giá trị chưa từng gặp được thêm dạng mảng vị trí; phân loại dense/sparse giữ như lúc dựng
+        """
+        new = copy.copy(self)
+        new.size = size
+        new.values = list(self.values)
+        new.lookup = dict(self.lookup)
+        new.dense = resized(self.dense, size)
+        # So khớp nguyên văn như lúc dựng (brand 'Nike' và 'nike ' là hai giá trị, chỉ truy vấn mới chuẩn hóa)
+        exact = {value: code for code, value in enumerate(new.values)}
+        removed, added = [], []
+        for position, old, value in changes:
+            old_code = None if old is None else exact.get(str(old))
+            code = None if value is None else exact.get(str(value))
+            if value is not None and code is None:
+                code = exact[str(value)] = new._add_value(value)
+            if old_code == code:
+                continue
+            if old_code is not None:
+                removed.append((old_code, position))
+            if code is not None:
+                added.append((code, position))
+
+        for entries, value in ((removed, False), (added, True)):
+            for code, position in entries:
+                if new.dense_row[code] >= 0:
+                    set_bits(new.dense[new.dense_row[code]], [position], value)
+
+        positions, codes = self.sparse_positions, self.sparse_codes
+        drop = []
+        for code, position in removed:
+            if new.dense_row[code] < 0:
+                lo, hi = self.sparse_offsets[code], self.sparse_offsets[code + 1]
+                i = lo + int(np.searchsorted(positions[lo:hi], position))
+                if i < hi and positions[i] == position:
+                    drop.append(i)
+        if drop:
+            positions, codes = np.delete(positions, drop), np.delete(codes, drop)
+        insert = sorted((code, position) for code, position in added if new.dense_row[code] < 0)
+        if insert:
+            # Giữ thứ tự (giá trị, vị trí) của CSR: chèn tại vị trí tính trên mảng trước khi chèn
+            offsets = np.zeros(len(new.values) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(codes, minlength=len(new.values)), out=offsets[1:])
+            at = [offsets[code] + int(np.searchsorted(positions[offsets[code]:offsets[code + 1]], position))
+                  for code, position in insert]
+            positions = np.insert(positions, at, [position for _, position in insert])
+            codes = np.insert(codes, at, [code for code, _ in insert])
+        new.sparse_positions, new.sparse_codes = positions, codes
+        new.sparse_offsets = np.zeros(len(new.values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(new.values)), out=new.sparse_offsets[1:])
+        return new
+
+    def nbytes(self) -> int:
+        return self.dense.nbytes + self.sparse_positions.nbytes + self.sparse_codes.nbytes + self.sparse_offsets.nbytes
+
+
+class RangeBitmaps:
+    """
+    Bitmap cộng dồn theo bucket cho cột số (giá, rating, số review): ge[i] = value >= edges[i].
+    Cột ít giá trị khác nhau (rating) có mỗi giá trị một bucket nên chính xác tuyệt đối;
+    bucket ở biên truy vấn được tinh chỉnh bằng mảng đã sắp xếp
+    """
+
+    def __init__(self, values: np.ndarray, buckets: int = RANGE_BUCKETS) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        self.size = len(values)
+        valid = ~np.isnan(values)
+        self.valid = from_mask(valid)
+        self.order = np.flatnonzero(valid)[np.argsort(values[valid], kind='stable')]
+        self.sorted_values = values[self.order]
+        distinct = np.unique(self.sorted_values)
+        if len(distinct) <= buckets:
+            self.edges = distinct
+        else:
+            picks = np.linspace(0, len(self.sorted_values), buckets, endpoint=False).astype(np.int64)
+            self.edges = np.unique(self.sorted_values[picks])
+        self.ge = np.zeros((len(self.edges), n_words(self.size)), dtype=np.uint64)
+        for i, edge in enumerate(self.edges):
+            # Mảng đã sắp xếp: value >= edge là một đoạn đuôi
+            start = int(np.searchsorted(self.sorted_values, edge, side='left'))
+            self.ge[i] = from_positions(self.order[start:], self.size)
+
+    def _tail(self, value: float, side: str) -> np.ndarray:
+        # side='left': value >= v; side='right': value > v
+        i = int(np.searchsorted(self.edges, value, side=side))
+        result = self.ge[i].copy() if i < len(self.edges) else np.zeros(n_words(self.size), dtype=np.uint64)
+        lo = int(np.searchsorted(self.sorted_values, value, side=side))
+        hi = int(np.searchsorted(self.sorted_values, self.edges[i], side='left')) if i < len(self.edges) \
+            else len(self.sorted_values)
+        set_bits(result, self.order[lo:hi])
+        return result
+
+    def at_least(self, value: float) -> np.ndarray:
+        return self._tail(float(value), 'left')
+
+    def at_most(self, value: float) -> np.ndarray:
+        return ~self._tail(float(value), 'right') & self.valid
+
+    def _locate(self, order: np.ndarray, sorted_values: np.ndarray, value: float, position: int) -> int:
+        # Các giá trị bằng nhau xếp theo vị trí tăng dần (argsort stable lúc dựng)
+        lo = int(np.searchsorted(sorted_values, value, side='left'))
+        hi = int(np.searchsorted(sorted_values, value, side='right'))
+        return lo + int(np.searchsorted(order[lo:hi], position))
+
+    def apply(self, size: int, changes: List[Tuple[int, float, float]]) -> "RangeBitmaps":
+        """
+        Bản sao sau khi đổi giá trị tại các vị trí (vị trí, giá trị cũ, giá trị mới; NaN = không có).
+        Biên bucket giữ nguyên, giá trị ngoài các biên vẫn đúng nhờ bước tinh chỉnh bằng mảng đã sắp xếp
+        """
+        new = copy.copy(self)
+        new.size = size
+        new.valid = resized(self.valid, size)
+        new.ge = resized(self.ge, size)
+        drop, insert = [], []
+        for position, old, value in changes:
+            if not np.isnan(old):
+                i = self._locate(self.order, self.sorted_values, old, position)
+                if i < len(self.order) and self.order[i] == position:
+                    drop.append(i)
+            word, bit = position >> 6, np.uint64(1) << np.uint64(position & 63)
+            new.ge[:, word] &= ~bit
+            if np.isnan(value):
+                new.valid[word] &= ~bit
+                continue
+            new.valid[word] |= bit
+            new.ge[:int(np.searchsorted(self.edges, value, side='right')), word] |= bit
+            insert.append((value, position))
+        order = np.delete(self.order, drop)
+        sorted_values = np.delete(self.sorted_values, drop)
+        insert.sort()
+        at = [self._locate(order, sorted_values, value, position) for value, position in insert]
+        new.order = np.insert(order, at, [position for _, position in insert]).astype(np.int64)
+        new.sorted_values = np.insert(sorted_values, at, [value for value, _ in insert])
+        return new
+
+    def nbytes(self) -> int:
+        return self.ge.nbytes + self.valid.nbytes + self.order.nbytes + self.sorted_values.nbytes
+
+
+class BitmapIndex:
+    """
+    Bitset dựng một lần khi nạp catalog để đánh giá filter nhiều trường bằng phép AND/OR/NOT trên uint64:
+    - category / sex / brand: một bitmap mỗi giá trị (brand không phân biệt hoa thường, dấu)
+    - giá / rating / số review: bitmap cộng dồn theo bucket
+    - còn hàng (stock > 0)
+    """
+
+    def __init__(self, data: pd.DataFrame, product_id: np.ndarray, price: np.ndarray, rating: np.ndarray) -> None:
+        self.size = len(data)
+        self.all = from_mask(np.ones(self.size, dtype=bool))
+        self.fields: Dict[str, ValueBitmaps] = {
+            'category': ValueBitmaps(data['category'].to_numpy(dtype=object), self.size),
+            'sex': ValueBitmaps(data['sex'].to_numpy(dtype=object), self.size),
+            'brand': ValueBitmaps(data['brand'].to_numpy(dtype=object), self.size, normalize=True),
+        }
+        self.price = RangeBitmaps(price)
+        self.rating = RangeBitmaps(rating)
+        self.reviews = RangeBitmaps(data['num_reviews'].to_numpy(dtype=np.float64))
+        self.in_stock = from_mask(np.nan_to_num(data['stock'].to_numpy(dtype=np.float64)) > 0)
+        self._id_order = np.argsort(product_id, kind='stable')
+        self._sorted_ids = product_id[self._id_order]
+
+    def apply(self, size: int, changes: List[Tuple[int, Optional[dict], Optional[dict]]]) -> "BitmapIndex":
+        """
+        Bản sao đã cập nhật theo các dòng thay đổi (vị trí, bản ghi cũ, bản ghi mới): None cũ = dòng thêm,
+        None mới = dòng bị xóa. Chỉ bit/mảng của các vị trí đó được sửa, bitmap không đổi dùng chung
+        """
+        new = copy.copy(self)
+        new.size = size
+        new.all = resized(self.all, size)
+        new.in_stock = resized(self.in_stock, size)
+        for position, old, record in changes:
+            set_bits(new.all, [position], record is not None)
+            set_bits(new.in_stock, [position], record is not None and _number(record, 'stock') > 0)
+
+        new.fields = dict(self.fields)
+        for field, bitmaps in self.fields.items():
+            diff = [(p, (old or {}).get(field), (record or {}).get(field)) for p, old, record in changes]
+            diff = [d for d in diff if d[1] != d[2]]
+            if diff or size != self.size:
+                new.fields[field] = bitmaps.apply(size, diff)
+        for attr, column in (('price', 'price'), ('rating', 'rating'), ('reviews', 'num_reviews')):
+            diff = [(p, _number(old, column), _number(record, column)) for p, old, record in changes]
+            diff = [d for d in diff if not (d[1] == d[2] or (np.isnan(d[1]) and np.isnan(d[2])))]
+            if diff or size != self.size:
+                setattr(new, attr, getattr(self, attr).apply(size, diff))
+
+        removed = [old['product_id'] for _, old, record in changes if old is not None and record is None]
+        added = sorted((record['product_id'], p) for p, old, record in changes if old is None and record is not None)
+        if removed or added:
+            keep = ~np.isin(self._sorted_ids, np.asarray(removed, dtype=np.int64))
+            ids, order = self._sorted_ids[keep], self._id_order[keep]
+            at = np.searchsorted(ids, [product_id for product_id, _ in added])
+            new._sorted_ids = np.insert(ids, at, [product_id for product_id, _ in added]).astype(np.int64)
+            new._id_order = np.insert(order, at, [p for _, p in added]).astype(np.int64)
+        return new
+
+    @staticmethod
+    def needed(filter_dict: dict) -> bool:
+        """
+        Filter có trường mở rộng hoặc nhiều category thì không đi được đường posting list
+        """
+        if any(filter_dict.get(key) not in (None, False, [], ()) for key in EXTENDED_KEYS):
+            return True
+        return isinstance(filter_dict.get('category'), (list, tuple, set, frozenset))
+
+    def positions_of_ids(self, ids) -> np.ndarray:
+        try:
+            if isinstance(ids, np.ndarray):
+                ids = ids.astype(np.int64, copy=False)
+            else:
+                ids = np.asarray([int(i) for i in _as_list(ids)], dtype=np.int64)
+        except (TypeError, ValueError):
+            raise ValueError("product ids must be integers")
+        if len(self._sorted_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self._sorted_ids, ids), len(self._sorted_ids) - 1)
+        return self._id_order[found[self._sorted_ids[found] == ids]]
+
+    def evaluate(self, filter_dict: dict) -> np.ndarray:
+        result = self.all.copy()
+        for field in ('category', 'sex', 'brand'):
+            if filter_dict.get(field) is not None:
+                result &= self.fields[field].any_of(_as_list(filter_dict[field]))
+        if filter_dict.get('min_price') is not None:
+            result &= self.price.at_least(filter_dict['min_price'])
+        if filter_dict.get('max_price') is not None:
+            result &= self.price.at_most(filter_dict['max_price'])
+        if filter_dict.get('min_rating') is not None:
+            result &= self.rating.at_least(filter_dict['min_rating'])
+        if filter_dict.get('min_reviews') is not None:
+            result &= self.reviews.at_least(filter_dict['min_reviews'])
+        if filter_dict.get('in_stock_only'):
+            result &= self.in_stock
+        if filter_dict.get('exclude_categories'):
+            result &= ~self.fields['category'].any_of(_as_list(filter_dict['exclude_categories']))
+        if filter_dict.get('exclude_brands'):
+            result &= ~self.fields['brand'].any_of(_as_list(filter_dict['exclude_brands']))
+        if filter_dict.get('exclude_product_ids'):
+            set_bits(result, self.positions_of_ids(filter_dict['exclude_product_ids']), False)
+        return result & self.all
+
+    def match(self, filter_dict: dict) -> np.ndarray:
+        return to_positions(self.evaluate(filter_dict), self.size)
+
+    def facets(self, positions: np.ndarray, fields: Iterable[str] = ('brand', 'category')) -> Dict[str, Dict[str, int]]:
+        """
+        Số sản phẩm khớp theo từng brand/category/sex, tính trên cùng một bitset kết quả
+        """
+        words = from_positions(positions, self.size)
+        return {field: self.fields[field].counts(words) for field in fields if field in self.fields}
+
+    def nbytes(self) -> int:
+        total = sum(f.nbytes() for f in self.fields.values())
+        total += self.price.nbytes() + self.rating.nbytes() + self.reviews.nbytes()
+        return total + self.in_stock.nbytes + self.all.nbytes
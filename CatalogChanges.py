@@ -0,0 +1,399 @@
+"""
+Cập nhật catalog từng phần (PATCH /catalog, POST /catalog/bulk) và change log dạng NDJSON.
+
+Mỗi dòng của change log là một thay đổi, chỉ ghi thêm vào cuối file:
+    {"op": "upsert", "product": {"product_id": 12, "stock": 0, "price": 199000}, "ts": 1700000000.0}
+    {"op": "delete", "product_id": 13, "ts": 1700000000.0}
+Upsert sản phẩm đã có chỉ cần các trường thay đổi; sản phẩm mới cần đủ REQUIRED_COLUMNS.
+Khi khởi động/nạp lại, log được áp dụng lên catalog gốc (database.csv / catalog.bin) trước khi dựng chỉ mục.
+
+Gộp log vào CSV (và build lại bundle nhị phân nếu có) rồi làm rỗng log; log mới bắt đầu bằng dòng generation
+để worker đang theo dõi biết offset cũ không còn dùng được:
+    {"generation": "3f2a..."}
+
+    python CatalogChanges.py compact database.csv catalog_changes.ndjson [catalog.bin]
+"""
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from CatalogStore import DICTIONARY_COLUMNS, NUMERIC_COLUMNS, TEXT_COLUMNS, build_binary_catalog
+from JsonCodec import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, chỉ an toàn khi một process ghi log
+    fcntl = None
+
+OPS = ('upsert', 'delete')
+SEXES = ('male', 'female', 'unisex')
+# Sản phẩm mới phải có các trường này; product_id và các trường này cũng không được đặt về null
+REQUIRED_COLUMNS = ('category', 'product_name', 'brand', 'price', 'stock', 'sex')
+DEFAULTS = {'num_reviews': 0}
+# Cột của catalog (CatalogStore); trường khác bị từ chối trước khi kiểm tra kiểu
+COLUMNS = tuple(NUMERIC_COLUMNS) + DICTIONARY_COLUMNS + TEXT_COLUMNS
+
+# Thay đổi đã gộp theo product_id: (thao tác, các trường). Thao tác: upsert (sửa hoặc thêm),
+# delete, replace (xóa rồi thêm lại trong cùng lô -> phải đủ trường như sản phẩm mới)
+Coalesced = Dict[int, Tuple[str, Optional[dict]]]
+
+
+def _field(column: str, value):
+    if value is None:
+        if column == 'product_id' or column in REQUIRED_COLUMNS:
+            raise ValueError(f"'{column}' cannot be null")
+        return None
+    if column in NUMERIC_COLUMNS:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"'{column}' must be a number")
+        if NUMERIC_COLUMNS[column] is np.int64:
+            if value != int(value):
+                raise ValueError(f"'{column}' must be an integer")
+            value = int(value)
+        else:
+            value = float(value)
+        if column == 'price' and value < 0:
+            raise ValueError("'price' must not be negative")
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"'{column}' must be a string")
+    if column == 'sex' and value not in SEXES:
+        raise ValueError(f"'sex' must be one of {', '.join(SEXES)}")
+    return value
+
+
+def parse_entry(entry) -> dict:
+    """
+    Kiểm tra và chuẩn hóa một thay đổi (chưa so với catalog); ValueError nếu sai format
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("change must be a JSON object")
+    op = entry.get('op')
+    if op == 'delete':
+        return {'op': 'delete', 'product_id': _field('product_id', entry.get('product_id'))}
+    if op == 'upsert':
+        product = entry.get('product')
+        if not isinstance(product, dict) or 'product_id' not in product:
+            raise ValueError("upsert needs a 'product' object with 'product_id'")
+        unknown = [str(k) for k in product if str(k) not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown column(s) for product {product['product_id']}: {', '.join(unknown)}")
+        return {'op': 'upsert', 'product': {str(k): _field(str(k), v) for k, v in product.items()}}
+    raise ValueError(f"Unknown change op: {op} (expected {', '.join(OPS)})")
+
+
+def changes_from_patch(upserts: List[dict], deletes: List[int]) -> List[dict]:
+    """
+    Body của PATCH /catalog -> danh sách thay đổi (upsert trước, delete sau)
+    """
+    entries = [{'op': 'upsert', 'product': product} for product in upserts]
+    entries += [{'op': 'delete', 'product_id': product_id} for product_id in deletes]
+    return [parse_entry(entry) for entry in entries]
+
+
+def parse_ndjson(body: bytes) -> List[dict]:
+    """
+    Body của POST /catalog/bulk: mỗi dòng một thay đổi, lỗi báo kèm số dòng
+    """
+    entries = []
+    for number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(parse_entry(loads(line)))
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}")
+    return entries
+
+
+def coalesce(entries: List[dict]) -> Coalesced:
+    """
+    Gộp các thay đổi theo product_id theo đúng thứ tự: upsert sau upsert gộp trường, delete xóa hết trước đó
+    """
+    result: Coalesced = {}
+    for entry in entries:
+        if entry['op'] == 'delete':
+            result[entry['product_id']] = ('delete', None)
+            continue
+        fields = entry['product']
+        product_id = fields['product_id']
+        previous = result.get(product_id)
+        if previous is None:
+            result[product_id] = ('upsert', dict(fields))
+        elif previous[0] == 'delete':
+            result[product_id] = ('replace', dict(fields))
+        else:
+            result[product_id] = (previous[0], {**previous[1], **fields})
+    return result
+
+
+def resolve_record(columns: List[str], product_id: int, op: str, fields: Optional[dict],
+                   old: Optional[dict]) -> Optional[dict]:
+    """
+    Bản ghi sau thay đổi (None = không còn sản phẩm). Sửa sản phẩm đã có chỉ ghi đè các trường gửi lên;
+    sản phẩm mới (hoặc replace) lấy giá trị mặc định cho trường không gửi
+    """
+    if op == 'delete':
+        return None
+    unknown = [column for column in fields if column not in columns]
+    if unknown:
+        raise ValueError(f"Unknown column(s) for product {product_id}: {', '.join(unknown)}")
+    if op == 'upsert' and old is not None:
+        return {**old, **fields}
+    missing = [column for column in REQUIRED_COLUMNS if column in columns and fields.get(column) is None]
+    if missing:
+        raise ValueError(f"New product {product_id} is missing: {', '.join(missing)}")
+    return {column: fields.get(column, DEFAULTS.get(column)) for column in columns}
+
+
+def resolve(index, coalesced: Coalesced, strict: bool = True) -> Tuple[list, Dict[str, int]]:
+    """
+    So thay đổi với chỉ mục hiện tại -> các dòng (vị trí, bản ghi cũ, bản ghi mới) cho ProductIndex.apply
+    và số sản phẩm theo kết quả. strict=False (phát lại log của worker khác) bỏ qua thay đổi lỗi thay vì raise
+    """
+    ids = list(coalesced)
+    positions = index.positions_of(ids)
+    found = dict(zip(index.product_id[positions].tolist(), positions.tolist()))
+    counts = {'updated': 0, 'inserted': 0, 'deleted': 0, 'unchanged': 0, 'missing': 0, 'invalid': 0}
+    changes = []
+    next_position = index.size
+    for product_id, (op, fields) in coalesced.items():
+        position = found.get(product_id)
+        old = index.records[position] if position is not None else None
+        try:
+            record = resolve_record(index.columns, product_id, op, fields, old)
+        except ValueError as e:
+            if strict:
+                raise
+            print(f"Skipping catalog change: {e}")
+            counts['invalid'] += 1
+            continue
+        if record is None:
+            if old is None:
+                counts['missing'] += 1
+                continue
+            counts['deleted'] += 1
+        elif old is None:
+            counts['inserted'] += 1
+            position, next_position = next_position, next_position + 1
+        elif record == old:
+            counts['unchanged'] += 1
+            continue
+        else:
+            counts['updated'] += 1
+        changes.append((position, old, record))
+    return changes, counts
+
+
+def apply_to_frame(data: pd.DataFrame, entries: List[dict]) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Áp dụng thay đổi lên DataFrame catalog (lúc khởi động/nạp lại, một lượt cho cả log):
+    dòng bị sửa/xóa bị bỏ, bản ghi sau thay đổi được thêm ở cuối
+    """
+    coalesced = coalesce(entries)
+    columns = [str(c) for c in data.columns]
+    touched = np.isin(data['product_id'].to_numpy(dtype=np.int64), np.fromiter(coalesced, dtype=np.int64))
+    existing = {}
+    for record in data[touched].to_dict('records'):
+        existing[record['product_id']] = {
+            key: None if isinstance(value, float) and math.isnan(value) else value for key, value in record.items()
+        }
+    counts = {'updated': 0, 'inserted': 0, 'deleted': 0, 'missing': 0, 'invalid': 0}
+    rows = []
+    for product_id, (op, fields) in coalesced.items():
+        old = existing.get(product_id)
+        try:
+            record = resolve_record(columns, product_id, op, fields, old)
+        except ValueError as e:
+            print(f"Skipping catalog change: {e}")
+            counts['invalid'] += 1
+            if old is not None:
+                rows.append(old)
+            continue
+        if record is not None:
+            rows.append(record)
+        counts['missing' if old is None and record is None else
+               'deleted' if record is None else 'inserted' if old is None else 'updated'] += 1
+    kept = data[~touched]
+    if not rows:
+        return kept.reset_index(drop=True), counts
+    return pd.concat([kept, pd.DataFrame(rows, columns=data.columns)], ignore_index=True), counts
+
+
+class ChangeLog:
+    """
+    File NDJSON chỉ ghi thêm. Ghi bằng một lần write() dưới flock nên các worker ghi cùng file không
+    xen kẽ nhau; người đọc chỉ lấy các dòng đã kết thúc bằng '\\n' (bỏ qua dòng đang ghi dở).
+    Offset chỉ có nghĩa trong một generation (dòng đầu của log, đổi mỗi lần gộp log)
+    """
+
+    def __init__(self, path: str, fsync: bool = True) -> None:
+        self.path = path
+        self.fsync = fsync
+
+    @contextmanager
+    def locked(self, shared: bool = False) -> Iterator[None]:
+        """
+        Khóa file giữa các process (không reentrant: không lồng hai lần trong cùng process)
+        """
+        with open(self.path, 'ab') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def generation(self) -> Optional[str]:
+        """
+        Generation của log hiện tại; None nếu log chưa từng được gộp (không có dòng generation)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                line = f.readline()
+        except FileNotFoundError:
+            return None
+        header = self._header(line) if line.endswith(b"\n") else None
+        return header['generation'] if header is not None else None
+
+    @staticmethod
+    def _header(line: bytes) -> Optional[dict]:
+        if not line.startswith(b'{"generation"'):
+            return None
+        try:
+            header = loads(line)
+        except ValueError:
+            return None
+        return header if isinstance(header, dict) and 'op' not in header else None
+
+    def append(self, entries: List[dict]) -> int:
+        """
+        Ghi các thay đổi (gọi trong locked()); trả về offset cuối file sau khi ghi
+        """
+        ts = time.time()
+        payload = b"".join(dumps({**entry, 'ts': ts}) + b"\n" for entry in entries)
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            return f.tell()
+
+    def read(self, offset: int = 0) -> Tuple[List[dict], int]:
+        """
+        Các thay đổi từ offset tới dòng hoàn chỉnh cuối cùng, kèm offset để đọc tiếp
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b"\n") + 1
+        entries = []
+        for line in data[:end].splitlines():
+            if not line.strip() or self._header(line) is not None:
+                continue
+            try:
+                entries.append(parse_entry(loads(line)))
+            except ValueError as e:
+                print(f"Skipping corrupt change log line: {e}")
+        return entries, offset + end
+
+    def truncate(self) -> str:
+        """
+        Làm rỗng log (gọi trong locked()) sau khi đã gộp vào catalog gốc, bắt đầu generation mới.
+        Log mới có thể lại dài hơn offset cũ nên người đọc so generation chứ không chỉ so kích thước
+        """
+        generation = uuid.uuid4().hex
+        with open(self.path, 'r+b') as f:
+            f.truncate(0)
+            f.write(dumps({'generation': generation}) + b"\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        return generation
+
+
+class ChangeLogFollower:
+    """
+    Thread nền gọi on_poll định kỳ để mỗi worker áp dụng thay đổi do worker khác ghi vào log
+    """
+
+    def __init__(self, on_poll: Callable[[], None], interval: float = 1.0) -> None:
+        self.on_poll = on_poll
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-log-follower", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.on_poll()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Change log sync failed: {e}")
+
+
+def compact(csv_path: str, log_path: str, binary_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Gộp change log vào CSV (ghi file tạm rồi đổi tên) và làm rỗng log, giữ khóa log suốt quá trình
+    để không mất thay đổi ghi vào giữa chừng
+    """
+    log = ChangeLog(log_path)
+    with log.locked():
+        entries, _ = log.read()
+        data, counts = apply_to_frame(pd.read_csv(csv_path), entries)
+        tmp_path = csv_path + ".tmp"
+        data.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+        if binary_path:
+            build_binary_catalog(csv_path, binary_path)
+        log.truncate()
+    counts['entries'] = len(entries)
+    counts['rows'] = len(data)
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python CatalogChanges.py compact [database.csv] [catalog_changes.ndjson] [catalog.bin]")
+        sys.exit(1)
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else "database.csv"
+    log_path = sys.argv[3] if len(sys.argv) > 3 else "catalog_changes.ndjson"
+    binary_path = sys.argv[4] if len(sys.argv) > 4 else None
+    info = compact(csv_path, log_path, binary_path)
+    print(f"Compacted {info['entries']} changes into {csv_path}: {info['rows']} rows "
+          f"({info['updated']} updated, {info['inserted']} inserted, {info['deleted']} deleted)")
@@ -0,0 +1,166 @@
+"""
+Định dạng catalog nhị phân dạng cột (bundle .npy) để các worker memory-map thay vì parse CSV.
+
+Build:
+    python CatalogStore.py database.csv catalog.bin
+"""
+import json
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+
+NUMERIC_COLUMNS = {
+    'product_id': np.int64,
+    'price': np.int64,
+    'stock': np.int64,
+    'rating': np.float64,
+    'num_reviews': np.int64,
+}
+# Cột ít giá trị khác nhau -> mã hóa từ điển (codes + vocab)
+DICTIONARY_COLUMNS = ('category', 'sex', 'brand')
+# Cột chuỗi dài -> một blob UTF-8 + mảng offset theo ký tự,
+# trừ khi cột lặp nhiều (ví dụ description) thì cũng mã hóa từ điển
+TEXT_COLUMNS = ('product_name', 'description', 'image_url', 'product_link')
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def _codes_dtype(size: int):
+    # Cùng kiểu mà pandas dùng cho Categorical.codes, để không phải copy khi mmap
+    if size < np.iinfo(np.int8).max:
+        return np.int8
+    if size < np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+def source_stat(path: str) -> Optional[list]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def build_binary_catalog(csv_path: str, out_dir: str) -> dict:
+    """
+    Chuyển CSV thành bundle .npy; ghi vào thư mục tạm rồi đổi tên để worker không đọc bản dở dang
+    """
+    stat = source_stat(csv_path)
+    data = pd.read_csv(csv_path)
+    tmp_dir = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "rows": len(data),
+        "columns": list(data.columns),
+        "source": os.path.abspath(csv_path),
+        "source_stat": stat,
+        "encodings": {},
+        "dictionaries": {},
+        "text_nulls": {},
+    }
+
+    for column, dtype in NUMERIC_COLUMNS.items():
+        np.save(os.path.join(tmp_dir, f"{column}.npy"), data[column].to_numpy(dtype=dtype))
+
+    for column in DICTIONARY_COLUMNS + TEXT_COLUMNS:
+        codes, vocab = pd.factorize(data[column], use_na_sentinel=True)
+        if column in TEXT_COLUMNS and len(vocab) > DICTIONARY_MAX_RATIO * max(len(data), 1):
+            continue
+        np.save(os.path.join(tmp_dir, f"{column}.codes.npy"), codes.astype(_codes_dtype(len(vocab))))
+        manifest["dictionaries"][column] = [str(v) for v in vocab]
+        manifest["encodings"][column] = "dictionary"
+
+    for column in TEXT_COLUMNS:
+        if column in manifest["encodings"]:
+            continue
+        manifest["encodings"][column] = "text"
+        values = data[column]
+        nulls = values.isna().to_numpy()
+        strings = values.fillna("").astype(str).tolist()
+        lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+        offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        blob = np.frombuffer("".join(strings).encode("utf-8"), dtype=np.uint8)
+        np.save(os.path.join(tmp_dir, f"{column}.offsets.npy"), offsets)
+        np.save(os.path.join(tmp_dir, f"{column}.blob.npy"), blob)
+        if nulls.any():
+            np.save(os.path.join(tmp_dir, f"{column}.null.npy"), nulls)
+            manifest["text_nulls"][column] = True
+
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+def read_manifest(catalog_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(catalog_dir, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("format_version") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def is_fresh(catalog_dir: str, csv_path: str) -> bool:
+    """
+    Bundle dùng được khi nó được build từ đúng phiên bản CSV hiện tại (hoặc không còn CSV)
+    """
+    manifest = read_manifest(catalog_dir)
+    if manifest is None:
+        return False
+    stat = source_stat(csv_path)
+    return stat is None or manifest.get("source_stat") == stat
+
+
+def load_binary_catalog(catalog_dir: str) -> pd.DataFrame:
+    """
+    Memory-map bundle: cột số và codes dùng chung page cache giữa các worker,
+    chỉ cột chuỗi dài được giải mã vào bộ nhớ của từng process
+    """
+    manifest = read_manifest(catalog_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"Binary catalog '{catalog_dir}' not found or outdated.")
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(catalog_dir, name), mmap_mode='r')
+
+    columns = {}
+    for column in NUMERIC_COLUMNS:
+        columns[column] = load(f"{column}.npy")
+    for column, encoding in manifest["encodings"].items():
+        if encoding == "dictionary":
+            columns[column] = pd.Categorical.from_codes(
+                load(f"{column}.codes.npy"), categories=manifest["dictionaries"][column], validate=False
+            )
+            continue
+        offsets = load(f"{column}.offsets.npy").tolist()
+        text = load(f"{column}.blob.npy").tobytes().decode("utf-8")
+        values = [text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        if manifest["text_nulls"].get(column):
+            for i in np.flatnonzero(load(f"{column}.null.npy")):
+                values[i] = None
+        columns[column] = pd.array(values, dtype=object)
+
+    ordered = {column: columns[column] for column in manifest["columns"] if column in columns}
+    return pd.DataFrame(ordered, copy=False)
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "database.csv"
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "catalog.bin"
+    info = build_binary_catalog(csv_path, out_dir)
+    print(f"Built {out_dir}: {info['rows']} rows from {csv_path}")
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+import zlib
+import pandas as pd
+from typing import Callable, List, Optional, Tuple
+from ProductIndex import ProductIndex
+from SemanticIndex import SemanticIndex
+
+
+class CatalogSnapshot:
+    """
+    Phiên bản bất biến của catalog: DataFrame, danh sách category và chỉ mục.
+    Request giữ tham chiếu tới một snapshot nên luôn thấy dữ liệu nhất quán.
+    Snapshot tạo bởi apply_changes() (PATCH /catalog) dùng chung DataFrame gốc; dữ liệu hiện hành nằm trong chỉ mục
+    """
+    __slots__ = ('version', 'data', 'categories', 'index', 'source_stat', 'loaded_at', 'load_duration',
+                 'semantic_duration', 'semantic_error', 'recommendations', 'log_offset', 'log_generation',
+                 'delta_chain', 'changed_rows')
+
+    def __init__(self, version: int, data: pd.DataFrame, source_stat: Optional[Tuple[int, int]] = None,
+                 load_started: Optional[float] = None, log_offset: int = 0,
+                 log_generation: Optional[str] = None) -> None:
+        started = load_started if load_started is not None else time.perf_counter()
+        self.version = version
+        self.data = data
+        self.categories: List[str] = data.category.unique().tolist()
+        self.index = ProductIndex(data)
+        self.source_stat = source_stat
+        self.loaded_at = time.time()
+        self.load_duration = time.perf_counter() - started
+        self.semantic_duration: Optional[float] = None
+        self.semantic_error: Optional[str] = None
+        # Bảng gợi ý dựng sẵn (Recommendations.py); None nếu tắt hoặc dựng lỗi
+        self.recommendations = None
+        # Offset change log đã áp dụng; delta_chain định danh chuỗi lô thay đổi áp dụng từ lần dựng đầy đủ
+        # (vị trí sản phẩm phụ thuộc cách chia lô, nên cache dùng chung chỉ khớp khi chuỗi giống nhau)
+        self.log_offset = log_offset
+        self.log_generation = log_generation
+        self.delta_chain = 0
+        self.changed_rows = 0
+
+    def apply_changes(self, changes: list, log_offset: int, log_generation: Optional[str]) -> "CatalogSnapshot":
+        """
+        Snapshot mới từ các dòng thay đổi (xem ProductIndex.apply): chỉ mục, category và bảng gợi ý
+        được cập nhật theo phần thay đổi thay vì dựng lại
+        """
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot.__new__(CatalogSnapshot)
+        for name in self.__slots__:
+            setattr(snapshot, name, getattr(self, name))
+        snapshot.version = self.version + 1
+        snapshot.index = self.index.apply(changes)
+        groups = snapshot.index.groups
+        categories = [c for c in self.categories if (c, None) in groups]
+        for _, _, record in changes:
+            category = record.get('category') if record is not None else None
+            if category is not None and category not in categories and (category, None) in groups:
+                categories.append(category)
+        snapshot.categories = categories
+        if self.recommendations is not None:
+            snapshot.recommendations = self.recommendations.apply(snapshot.index, changes)
+        snapshot.log_offset = log_offset
+        snapshot.log_generation = log_generation
+        snapshot.delta_chain = zlib.crc32(f"{log_generation}:{log_offset}".encode(), self.delta_chain)
+        snapshot.changed_rows = self.changed_rows + len(changes)
+        snapshot.loaded_at = time.time()
+        snapshot.load_duration = time.perf_counter() - started
+        return snapshot
+
+    def build_semantic(self, background: bool = True, on_ready: Optional[Callable[["CatalogSnapshot"], None]] = None):
+        """
+        Dựng chỉ mục ngữ nghĩa (vài giây với catalog lớn) ở thread nền để không chặn khởi động/reload;
+        trong lúc đó filter 'query' bị bỏ qua
+        """
+        def build():
+            started = time.perf_counter()
+            try:
+                self.index.semantic = SemanticIndex(ProductIndex.semantic_texts(self.data))
+            except Exception as e:
+                self.semantic_error = str(e)
+                print(f"Semantic index build failed: {e}")
+                return
+            self.semantic_duration = time.perf_counter() - started
+            if on_ready is not None:
+                on_ready(self)
+
+        if not background:
+            build()
+            return
+        threading.Thread(target=build, name=f"semantic-index-v{self.version}", daemon=True).start()
+
+    @property
+    def cache_token(self) -> tuple:
+        # Khóa cache: số version chỉ có nghĩa trong một process, kèm stat file để cache dùng chung
+        # giữa nhiều worker không trộn kết quả của hai phiên bản catalog; thêm offset change log và chuỗi lô
+        # thay đổi vì kết quả cache là vị trí trong chỉ mục
+        return (self.version,) + tuple(self.source_stat or ()) + (self.log_offset, self.delta_chain)
+
+    def status(self) -> dict:
+        semantic = self.index.semantic
+        return {
+            "version": self.version,
+            "total_products": self.index.count,
+            "categories": len(self.categories),
+            "loaded_at": self.loaded_at,
+            "load_duration_ms": round(self.load_duration * 1000, 2),
+            "semantic_index": {
+                "ready": semantic is not None,
+                "build_duration_ms": round(self.semantic_duration * 1000, 2) if self.semantic_duration else None,
+                "memory_mb": round(semantic.nbytes() / 1e6, 2) if semantic is not None else None,
+                "error": self.semantic_error,
+            },
+            "recommendation_table": self.recommendations.status() if self.recommendations is not None else None,
+            "change_log_offset": self.log_offset,
+            "change_log_generation": self.log_generation,
+            "changed_rows": self.changed_rows,
+        }
+
+
+def file_stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class CatalogWatcher:
+    """
+    Thread nền theo dõi file catalog; khi file đổi và đã ghi xong
+    (stat không đổi giữa hai lần poll) thì gọi on_change để dựng snapshot mới
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], None], interval: float = 2.0,
+                 initial_stat: Optional[Tuple[int, int]] = None) -> None:
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._last_stat = initial_stat if initial_stat is not None else file_stat(path)
+        self._pending: Optional[Tuple[int, int]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self) -> bool:
+        """
+        Một chu kỳ kiểm tra; gọi on_change khi file đã đổi và đứng yên qua hai lần poll.
+        Server.py gọi trực tiếp từ vòng giám sát thay vì chạy thread
+        """
+        current = file_stat(self.path)
+        if current is None or current == self._last_stat:
+            self._pending = None
+            return False
+        if current != self._pending:
+            # File vừa đổi, đợi thêm một chu kỳ để chắc chắn đã ghi xong
+            self._pending = current
+            return False
+        changed = False
+        try:
+            self.on_change()
+            self.last_error = None
+            changed = True
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Catalog reload failed, keeping previous version: {e}")
+        self._last_stat = current
+        self._pending = None
+        return changed
@@ -0,0 +1,224 @@
+import asyncio
+import random
+import time
+import weakref
+import httpx
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class InferenceError(Exception):
+    def __init__(self, message: str, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(InferenceError):
+    pass
+
+
+class LoadShedError(InferenceError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho upstream inference:
+    - closed: gọi bình thường, đếm lỗi liên tiếp
+    - open: từ chối ngay, sau reset_timeout cho phép một probe
+    - half_open: một probe đang chạy; thành công -> closed, lỗi -> open lại
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 on_state_change: Optional[Callable[[str], None]] = None) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            if self.on_state_change:
+                self.on_state_change(state)
+
+    @property
+    def available(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return False  # half_open: probe đang chạy
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+            return
+        raise CircuitOpenError("Inference circuit is open")
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        self.opened_at = time.monotonic()
+        self._set_state(self.OPEN)
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi async đồng thời có cùng khóa: lời gọi đầu chạy, các lời gọi sau chờ và dùng chung kết quả
+    (kể cả exception). Số khóa khác nhau đang chạy bị giới hạn bởi max_pending; vượt ngưỡng thì lời gọi mới
+    bị từ chối ngay bằng LoadShedError để caller trả kết quả dự phòng thay vì xếp hàng chờ upstream
+    """
+
+    def __init__(self, max_pending: int = 16) -> None:
+        self.max_pending = max_pending
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+        self.shed = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Trả về (kết quả, shared); shared=True nếu dùng chung lời gọi đang chạy của request khác
+        """
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        shared = task is not None and task.get_loop() is loop
+        if shared:
+            self.shared += 1
+        else:
+            if len(self._tasks) >= self.max_pending:
+                self.shed += 1
+                raise LoadShedError(f"Inference backlog full ({len(self._tasks)} pending)")
+            self.started += 1
+            task = loop.create_task(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: request đầu bị hủy (client ngắt kết nối) không hủy lời gọi mà request khác đang chờ
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # đánh dấu đã đọc lỗi khi mọi request chờ đều đã bị hủy
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self.pending, "max_pending": self.max_pending,
+                "started": self.started, "shared": self.shared, "shed": self.shed}
+
+
+class AsyncInferenceClient:
+    """
+    Client bất đồng bộ cho Hugging Face Inference API:
+    connection pool dùng chung, deadline mỗi lần gọi, giới hạn số request đồng thời,
+    retry với exponential backoff và circuit breaker
+    """
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 10.0,
+                 max_concurrency: int = 8, max_connections: int = 20, max_retries: int = 2,
+                 backoff: float = 0.5, breaker: Optional[CircuitBreaker] = None) -> None:
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        # httpx.AsyncClient và Semaphore gắn với event loop: mỗi loop một cặp. Client của loop khác không bị thay
+        # (loop đó có thể vẫn đang dùng); client của loop đã đóng không aclose được nữa, được giải phóng cùng loop
+        self._clients = weakref.WeakKeyDictionary()  # loop -> (client, semaphore)
+
+    def _ensure_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            client = httpx.AsyncClient(
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+            entry = self._clients[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+        return entry
+
+    async def aclose(self):
+        """
+        Đóng client của event loop đang chạy (gọi khi app tắt, trước khi loop đóng)
+        """
+        entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+    async def _post_once(self, client: httpx.AsyncClient, payload: Dict[str, Any], deadline: float) -> Any:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise InferenceError("Inference deadline exceeded", retryable=True)
+        response = await client.post(self.url, json=payload, timeout=remaining)
+        if response.status_code == 200:
+            try:
+                return response.json()
+            except ValueError:
+                raise InferenceError(f"Invalid JSON from Hugging Face API: {response.text[:200]}")
+        raise InferenceError(f"Hugging Face API error: {response.status_code} - {response.text}",
+                             retryable=response.status_code in self.RETRY_STATUS)
+
+    async def generate(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        self.breaker.before_call()
+        try:
+            client, semaphore = self._ensure_client()
+            deadline = time.monotonic() + (timeout or self.timeout)
+            async with semaphore:
+                return await self._attempts(client, payload, deadline)
+        except (httpx.TimeoutException, httpx.TransportError, InferenceError):
+            raise  # đã ghi nhận theo từng lần thử
+        except BaseException:
+            # Lỗi khác (request bị hủy, DecodingError, TooManyRedirects...) cũng phải kết thúc probe half_open,
+            # nếu không breaker kẹt ở half_open và từ chối mọi lời gọi
+            self.breaker.record_failure()
+            raise
+
+    async def _attempts(self, client: httpx.AsyncClient, payload: Dict[str, Any], deadline: float) -> Any:
+        attempt = 0
+        while True:
+            try:
+                result = await self._post_once(client, payload, deadline)
+            except (httpx.TimeoutException, httpx.TransportError, InferenceError) as e:
+                retryable = e.retryable if isinstance(e, InferenceError) else True
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # Upstream vẫn phản hồi (lỗi 4xx) nên không tính là sự cố
+                    self.breaker.record_success()
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                attempt += 1
+                if (not retryable or attempt > self.max_retries
+                        or self.breaker.state == CircuitBreaker.OPEN
+                        or time.monotonic() + delay >= deadline):
+                    if isinstance(e, InferenceError):
+                        raise
+                    raise InferenceError(f"{type(e).__name__}: {e}") from e
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
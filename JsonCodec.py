@@ -0,0 +1,56 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn; thiếu thì dùng json chuẩn (chậm hơn, cùng output)
+    orjson = None
+
+
+def _default(value: Any):
+    # Giá trị numpy lọt vào payload (ví dụ filter dựng từ mảng giá)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    JSON dạng bytes (UTF-8, không escape tiếng Việt, không khoảng trắng thừa)
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dumps_with_fragment(envelope: dict, key: str, fragment: bytes) -> bytes:
+    """
+    Ghép envelope với một giá trị JSON đã encode sẵn (ví dụ mảng sản phẩm) mà không decode lại:
+    {"status": ..., <key>: <fragment>}
+    """
+    head = dumps(envelope)
+    separator = b"," if len(head) > 2 else b""
+    return head[:-1] + separator + dumps(key) + b":" + fragment + b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encode bằng orjson (nếu có)
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(JSONResponse):
+    """
+    Body là bytes JSON đã ghép sẵn, không encode lại
+    """
+
+    def render(self, content: bytes) -> bytes:
+        return content
@@ -0,0 +1,306 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Tắt bằng METRICS_ENABLED=0: span trở thành no-op, counter/histogram không ghi gì
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Request gửi header này (giá trị bất kỳ khác rỗng/0) sẽ nhận Server-Timing với thời gian từng giai đoạn
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "x-profile").lower()
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {_number(total)}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram kiểu Prometheus: đếm theo bucket cố định (lưu không cộng dồn, cộng dồn khi render)
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [đếm từng bucket (+Inf ở cuối), tổng, số lần]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        if not METRICS_ENABLED:
+            return
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, (list(s[0]), s[1], s[2])) for values, s in self._series.items())
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Gauge/counter đọc giá trị lúc scrape (ví dụ thống kê cache, số session)
+    """
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Dict[LabelValues, float]],
+                 labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.label_names = tuple(labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} collection failed: {e}")
+            return lines
+        for label_values, value in sorted(values.items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Import lại module (ví dụ uvicorn reload) trả về metric đã đăng ký
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge_callback(self, name: str, help: str, fn: Callable[[], Dict[LabelValues, float]],
+                       labels: Sequence[str] = ()) -> CallbackMetric:
+        with self._lock:
+            # Callback luôn thay bằng bản mới nhất (gắn với instance hiện tại)
+            metric = self._metrics[name] = CallbackMetric(name, help, "gauge", fn, labels)
+        return metric
+
+    def counter_callback(self, name: str, help: str, fn: Callable[[], Dict[LabelValues, float]],
+                         labels: Sequence[str] = ()) -> CallbackMetric:
+        with self._lock:
+            metric = self._metrics[name] = CallbackMetric(name, help, "counter", fn, labels)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "what2gift_stage_duration_seconds", "Thời gian từng giai đoạn xử lý request", ("stage",)
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "what2gift_http_request_duration_seconds", "Thời gian xử lý HTTP request", ("route", "method", "status")
+)
+
+
+class Trace:
+    """
+    Thời gian các giai đoạn của một request (chỉ tạo khi client bật profiling)
+    """
+    __slots__ = ('stages',)
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        items = list(self.stages.items())
+        if total is not None:
+            items.append(("total", total))
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in items)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("what2gift_trace", default=None)
+
+
+class _Span:
+    __slots__ = ('name', 'trace', 'started')
+
+    def __init__(self, name: str, trace: Optional[Trace]) -> None:
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.name)
+        if self.trace is not None:
+            self.trace.add(self.name, elapsed)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """
+    `with span('search'): ...` - ghi vào histogram giai đoạn và trace của request hiện tại
+    """
+    trace = _current_trace.get()
+    if not METRICS_ENABLED and trace is None:
+        return _NULL_SPAN
+    return _Span(name, trace)
+
+
+def timed(name: str):
+    """
+    Decorator cho hàm sync: toàn bộ lời gọi là một span
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: đo thời gian từng request theo route và, khi request có PROFILE_HEADER,
+    trả về header Server-Timing với thời gian từng giai đoạn
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = self._wants_profile(scope)
+        if not METRICS_ENABLED and not profile:
+            return await self.app(scope, receive, send)
+
+        trace = Trace() if profile else None
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if trace is not None:
+                    headers = list(message.get("headers", []))
+                    timing = trace.server_timing(time.perf_counter() - started)
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            endpoint = scope.get("endpoint")
+            route = getattr(endpoint, "__name__", None) or "unmatched"
+            HTTP_SECONDS.observe(time.perf_counter() - started, route, scope.get("method", ""), str(status[0]))
+
+    @staticmethod
+    def _wants_profile(scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER.encode("latin-1"):
+                return value not in (b"", b"0", b"false")
+        return False
@@ -0,0 +1,395 @@
+import asyncio
+import re
+import time
+import zlib
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from InferenceClient import AsyncInferenceClient
+from TextMatcher import PhraseMatcher, normalize_text
+
+SEXES = ("male", "female", "unisex")
+# Dòng ánh xạ trong prompt: - 'áo sơ mi', 'áo thun', 'áo polo' → 'shirt'
+_MAPPING_LINE = re.compile(r"^\s*-\s*((?:'[^']+'\s*,?\s*)+)→\s*'(\w+)'\s*$")
+# Dòng danh sách category: - 'shirt' (áo sơ mi, áo thun, áo polo)
+_CATEGORY_LINE = re.compile(r"^\s*-\s*'(\w+)'\s*\(([^)]*)\)\s*$")
+_QUOTED = re.compile(r"'([^']+)'")
+# Số tiền trên text đã bỏ dấu: '500k', '1,5 trieu', '2tr', '500.000d', '300 nghin'
+_AMOUNT = re.compile(r"(?<![\w.,])(\d+(?:[.,]\d+)*)\s*(trieu|tr|cu|m|nghin|ngan|k|dong|vnd|d)?(?![a-z0-9])")
+_MILLION = {"trieu", "tr", "cu", "m"}
+_THOUSAND = {"nghin", "ngan", "k"}
+MIN_AMOUNT = 10000  # số không có đơn vị nhỏ hơn ngưỡng này là tuổi, ngày (8/3), số lượng... không phải giá
+
+
+def extract_dict(text: str) -> str:
+    """
+    Lấy dictionary Python đầu tiên trong text sinh ra bởi model
+    """
+    matches = re.findall(r'\{[^}]*\}', text)
+    if matches:
+        return matches[0]
+
+    cleaned = text.strip()
+    for prefix in ("Assistant Response:", "Response:", "Answer:", "Output:", "Result:"):
+        if cleaned.startswith(prefix):
+            cleaned = cleaned[len(prefix):].strip()
+    return cleaned
+
+
+def parse_amounts(text: str) -> List[int]:
+    """
+    Các số tiền (VND) trong câu hỏi theo thứ tự xuất hiện
+    """
+    amounts = []
+    for number, unit in _AMOUNT.findall(normalize_text(text)):
+        if unit in _MILLION or unit in _THOUSAND:
+            # '1,5 triệu' / '1.5tr': dấu phân cách là phần thập phân
+            try:
+                value = float(number.replace(",", ".")) if number.count(",") + number.count(".") <= 1 \
+                    else float(re.sub(r"[.,]", "", number))
+            except ValueError:
+                continue
+            value *= 1_000_000 if unit in _MILLION else 1000
+        else:
+            # '500.000đ' / '500,000': dấu phân cách hàng nghìn
+            value = float(re.sub(r"[.,]", "", number))
+            if value < MIN_AMOUNT:
+                continue
+        amounts.append(int(value))
+    return amounts
+
+
+class ModelBackend:
+    """
+    Giao diện chung cho backend suy luận: nhận câu hỏi (kèm system prompt) và trả về
+    chuỗi dictionary filter theo format của huggingface_prompt.txt
+    """
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    async def warmup(self):
+        pass
+
+    async def generate(self, question: str, system_prompt: str, user_content: str) -> str:
+        raise NotImplementedError
+
+    def status(self) -> dict:
+        return {"backend": self.name, "available": self.available}
+
+    async def aclose(self):
+        pass
+
+
+class RemoteBackend(ModelBackend):
+    """
+    Gọi Hugging Face Inference API qua AsyncInferenceClient (pool, deadline, retry, circuit breaker)
+    """
+    name = "remote"
+
+    def __init__(self, client: AsyncInferenceClient) -> None:
+        self.client = client
+
+    @property
+    def available(self) -> bool:
+        # Circuit breaker tự tắt khi upstream lỗi và bật lại sau khi probe thành công
+        return self.client.breaker.available
+
+    async def generate(self, question: str, system_prompt: str, user_content: str) -> str:
+        payload = {
+            "inputs": f"{system_prompt}\n\nUser Request: {user_content}\nAssistant Response:",
+            "parameters": {
+                "max_length": 150,
+                "temperature": 0.3,  # Lower temperature for more consistent output
+                "do_sample": True,
+                "return_full_text": False,
+                "top_p": 0.9,
+                "repetition_penalty": 1.1,
+                "pad_token_id": 50256  # GPT-2 pad token
+            }
+        }
+        result = await self.client.generate(payload)
+        if isinstance(result, list) and len(result) > 0:
+            return extract_dict(result[0].get("generated_text", ""))
+        return str(result)
+
+    def status(self) -> dict:
+        status = super().status()
+        status.update({"url": self.client.url, "circuit": self.client.breaker.state})
+        return status
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class MicroBatcher:
+    """
+    Gom các lời gọi đồng thời thành một batch: lời gọi đầu hẹn flush sau max_wait giây
+    (0 = vòng lặp kế tiếp của event loop), đủ max_batch thì flush ngay.
+    predict_batch nhận list input và trả list kết quả cùng thứ tự
+    """
+
+    def __init__(self, predict_batch: Callable[[List], List], max_batch: int = 32, max_wait: float = 0.0) -> None:
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[object, asyncio.Future]] = []
+        self._handle: Optional[asyncio.Handle] = None
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._handle is None:
+            self._handle = (loop.call_later(self.max_wait, self._flush) if self.max_wait > 0
+                            else loop.call_soon(self._flush))
+        return await future
+
+    def _flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        batch, self._pending = self._pending, []
+        # Request bị hủy trong lúc chờ thì không cần tính
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest = max(self.largest, len(batch))
+        try:
+            results = self.predict_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {"batches": self.batches, "items": self.items, "largest_batch": self.largest,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
+
+
+class LocalIntentBackend(ModelBackend):
+    """
+    Bộ phân loại ý định chạy trong process (CPU, không gọi mạng), học từ huggingface_prompt.txt:
+    - category: cụm từ trong bảng ánh xạ của prompt (khớp cụm dài nhất), không khớp thì
+      so độ tương đồng n-gram ký tự (trọng số idf) của từng cụm 1-3 từ trong câu hỏi với các cụm đã học,
+      chịu được lỗi gõ/viết liền ('quan jean', 'dongho', 'thắt lung')
+    - sex: bảng từ chỉ giới tính của prompt, mặc định 'unisex'
+    - giá: số tiền trong câu hỏi ('500k', '1,5 triệu'); hai số -> khoảng, một số -> price_range(budget)
+    Các request đồng thời được gom batch và chấm điểm bằng một phép nhân ma trận
+    """
+    name = "local"
+    NGRAM = 3
+    MAX_WINDOW = 3
+
+    def __init__(self, prompt_path: str, price_range: Callable[[int], Tuple[int, int]],
+                 min_score: float = 0.6, max_batch: int = 32, max_wait: float = 0.0) -> None:
+        started = time.perf_counter()
+        self.prompt_path = prompt_path
+        self.price_range = price_range
+        self.min_score = min_score
+        categories, sexes = self._parse_prompt(prompt_path)
+        if not categories:
+            raise ValueError(f"No category mapping found in {prompt_path}")
+        self.category_matcher = PhraseMatcher(categories)
+        self.sex_matcher = PhraseMatcher(sexes)
+        self.labels = sorted(set(categories.values()))
+        self._train(categories)
+        self.batcher = MicroBatcher(self.predict_batch, max_batch=max_batch, max_wait=max_wait)
+        self.train_duration = time.perf_counter() - started
+        self.warmup_duration: Optional[float] = None
+
+    @staticmethod
+    def _parse_prompt(path: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        categories: Dict[str, str] = {}
+        sexes: Dict[str, str] = {}
+        with open(path, "r", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        for line in lines:
+            mapping = _MAPPING_LINE.match(line)
+            if mapping:
+                target = sexes if mapping.group(2) in SEXES else categories
+                for phrase in _QUOTED.findall(mapping.group(1)):
+                    target.setdefault(phrase.lower(), mapping.group(2))
+                continue
+            listed = _CATEGORY_LINE.match(line)
+            if listed:
+                category = listed.group(1)
+                categories.setdefault(category, category)
+                for phrase in listed.group(2).split(","):
+                    if phrase.strip():
+                        categories.setdefault(phrase.strip().lower(), category)
+        return categories, sexes
+
+    def _grams(self, text: str) -> List[str]:
+        padded = f" {text} "
+        return [padded[i:i + self.NGRAM] for i in range(len(padded) - self.NGRAM + 1)]
+
+    def _train(self, phrases: Dict[str, str]):
+        normalized: Dict[str, str] = {}
+        for phrase, label in phrases.items():
+            normalized.setdefault(normalize_text(phrase), label)
+            # Dạng viết liền ('dongho') là một cụm riêng cùng nhãn
+            normalized.setdefault(normalize_text(phrase).replace(" ", ""), label)
+        vocab: Dict[str, int] = {}
+        rows = [[vocab.setdefault(g, len(vocab)) for g in set(self._grams(phrase))] for phrase in normalized]
+        present = np.zeros((len(rows), len(vocab)), dtype=np.float32)
+        for i, cols in enumerate(rows):
+            present[i, cols] = 1.0
+        df = present.sum(axis=0)
+        self.vocab = vocab
+        self.idf = (np.log((1 + len(rows)) / (1 + df)) + 1.0).astype(np.float32)
+        self.phrase_vectors = present * self.idf
+        self.phrase_weights = self.phrase_vectors.sum(axis=1)
+        label_ids = {label: i for i, label in enumerate(self.labels)}
+        self.phrase_labels = np.array([label_ids[label] for label in normalized.values()], dtype=np.int32)
+
+    def _windows(self, text: str) -> List[str]:
+        words = normalize_text(text).split()
+        windows = []
+        for size in range(1, self.MAX_WINDOW + 1):
+            for start in range(len(words) - size + 1):
+                window = " ".join(words[start:start + size])
+                if len(window) >= self.NGRAM:
+                    windows.append(window)
+        return windows
+
+    def _classify(self, questions: List[str]) -> List[Optional[str]]:
+        """
+        Category theo độ tương đồng n-gram cho cả batch: Jaccard có trọng số idf giữa tập n-gram của
+        từng cụm trong câu hỏi và của cụm đã học (cụm chỉ trùng một phần như 'dong' với 'dong ho' bị loại);
+        mỗi câu hỏi lấy cụm có điểm cao nhất
+        """
+        owners: List[int] = []
+        rows: List[int] = []
+        cols: List[int] = []
+        unknown: List[float] = []
+        n_windows = 0
+        for q, question in enumerate(questions):
+            for window in self._windows(question):
+                missing = 0
+                for gram in set(self._grams(window)):
+                    col = self.vocab.get(gram)
+                    if col is None:
+                        missing += 1
+                    else:
+                        rows.append(n_windows)
+                        cols.append(col)
+                owners.append(q)
+                unknown.append(missing)
+                n_windows += 1
+        result: List[Optional[str]] = [None] * len(questions)
+        if not rows:
+            return result
+        present = np.zeros((n_windows, len(self.vocab)), dtype=np.float32)
+        present[np.asarray(rows), np.asarray(cols)] = 1.0
+        # n-gram chưa từng gặp có trọng số idf lớn nhất
+        window_weights = present @ self.idf + np.asarray(unknown, dtype=np.float32) * self.idf.max()
+        shared = present @ self.phrase_vectors.T
+        scores = shared / (window_weights[:, None] + self.phrase_weights[None, :] - shared)
+        best_phrase = scores.argmax(axis=1)
+        best_score = scores[np.arange(n_windows), best_phrase]
+        owners_arr = np.asarray(owners)
+        for q in range(len(questions)):
+            mine = np.flatnonzero(owners_arr == q)
+            if len(mine):
+                top = mine[best_score[mine].argmax()]
+                if best_score[top] >= self.min_score:
+                    result[q] = self.labels[self.phrase_labels[best_phrase[top]]]
+        return result
+
+    def predict_batch(self, questions: List[str]) -> List[dict]:
+        categories = [self.category_matcher.match(q) for q in questions]
+        unresolved = [i for i, category in enumerate(categories) if category is None]
+        if unresolved:
+            for i, category in zip(unresolved, self._classify([questions[i] for i in unresolved])):
+                categories[i] = category
+
+        results = []
+        for question, category in zip(questions, categories):
+            filter_dict = {}
+            if category:
+                filter_dict['category'] = category
+            filter_dict['sex'] = self.sex_matcher.match(question) or 'unisex'
+            amounts = parse_amounts(question)
+            if len(amounts) >= 2:
+                filter_dict['min_price'], filter_dict['max_price'] = min(amounts), max(amounts)
+            elif amounts:
+                filter_dict['min_price'], filter_dict['max_price'] = self.price_range(amounts[0])
+            results.append(filter_dict)
+        return results
+
+    def predict(self, question: str) -> dict:
+        return self.predict_batch([question])[0]
+
+    async def warmup(self):
+        # Đi qua batcher như request thật để khởi động cả đường gom batch
+        started = time.perf_counter()
+        await asyncio.gather(*(self.batcher.submit(question) for question in (
+            "Mua quà sinh nhật cho bố, nam, áo sơ mi, 500000đ", "quà tặng bạn gái dưới 1 triệu")))
+        self.warmup_duration = time.perf_counter() - started
+
+    async def generate(self, question: str, system_prompt: str, user_content: str) -> str:
+        return repr(await self.batcher.submit(question))
+
+    def status(self) -> dict:
+        status = super().status()
+        status.update({
+            "prompt": self.prompt_path,
+            "phrases": len(self.phrase_labels),
+            "train_ms": round(self.train_duration * 1000, 2),
+            "warmup_ms": round(self.warmup_duration * 1000, 2) if self.warmup_duration is not None else None,
+            **self.batcher.stats(),
+        })
+        return status
+
+
+class StubBackend(ModelBackend):
+    """
+    Backend tất định cho test/benchmark: trả response cố định nếu có,
+    không thì chọn category/sex theo checksum của câu hỏi
+    """
+    name = "stub"
+
+    def __init__(self, categories: List[str], response: Optional[str] = None) -> None:
+        if not categories and response is None:
+            raise ValueError("Stub backend needs categories or a fixed response")
+        self.categories = list(categories)
+        self.response = response
+        self.calls = 0
+
+    async def generate(self, question: str, system_prompt: str, user_content: str) -> str:
+        self.calls += 1
+        if self.response is not None:
+            return self.response
+        checksum = zlib.crc32(question.encode("utf-8"))
+        return repr({'category': self.categories[checksum % len(self.categories)],
+                     'sex': SEXES[checksum % len(SEXES)]})
+
+    def status(self) -> dict:
+        status = super().status()
+        status["calls"] = self.calls
+        return status
+
+
+def create_model_backend(kind: str = "local", prompt_path: str = "huggingface_prompt.txt",
+                         price_range: Optional[Callable[[int], Tuple[int, int]]] = None,
+                         client: Optional[AsyncInferenceClient] = None,
+                         categories: Optional[List[str]] = None, stub_response: Optional[str] = None,
+                         max_batch: int = 32, max_wait: float = 0.0) -> ModelBackend:
+    if kind == "local":
+        return LocalIntentBackend(prompt_path, price_range, max_batch=max_batch, max_wait=max_wait)
+    if kind == "remote":
+        return RemoteBackend(client)
+    if kind == "stub":
+        return StubBackend(categories or [], response=stub_response)
+    raise ValueError(f"Unknown model backend: {kind}")
@@ -0,0 +1,448 @@
+import base64
+import copy
+import json
+import math
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from Ranking import RankingWeights, budget_scores, static_scores, top_k
+from SemanticIndex import SemanticIndex
+from BitmapIndex import BitmapIndex
+from JsonCodec import dumps
+from TextMatcher import normalize_text
+
+# Khóa nhóm: (category, sex); None nghĩa là không lọc theo trường đó
+GroupKey = Tuple[Optional[str], Optional[str]]
+# Một dòng thay đổi: (vị trí, bản ghi cũ hoặc None nếu thêm mới, bản ghi mới hoặc None nếu xóa)
+RowChange = Tuple[int, Optional[dict], Optional[dict]]
+
+# Khóa sắp xếp hỗ trợ cho phân trang; tiền tố '-' là giảm dần.
+# 'score' là điểm xếp hạng (rating, số review, độ gần ngân sách, còn hàng,
+# độ liên quan với filter 'query' nếu có), cao nhất trước
+SORT_KEYS = ('score', 'product_id', 'price', '-price', 'rating', '-rating')
+DEFAULT_SORT = 'score'
+
+
+class PostingList:
+    """
+    Danh sách vị trí sản phẩm của một nhóm (category, sex), sắp xếp theo giá
+    """
+    __slots__ = ('prices', 'positions')
+
+    def __init__(self, prices: np.ndarray, positions: np.ndarray) -> None:
+        self.prices = prices
+        self.positions = positions
+
+    def price_range(self, min_price=None, max_price=None) -> np.ndarray:
+        lo = 0 if min_price is None else int(np.searchsorted(self.prices, min_price, side='left'))
+        hi = len(self.prices) if max_price is None else int(np.searchsorted(self.prices, max_price, side='right'))
+        if hi <= lo:
+            return self.positions[:0]
+        return self.positions[lo:hi]
+
+
+class ProductIndex:
+    """
+    Chỉ mục dựng một lần khi nạp catalog:
+    - posting list theo (category, sex) với mảng giá đã sắp xếp
+    - bitmap theo category/sex/brand và bucket giá/rating cho filter nhiều trường (brand, min_rating,
+      in_stock_only, danh sách loại trừ, nhiều category) và facet
+    - bản ghi sản phẩm đã serialize sẵn để không phải to_dict mỗi request,
+      kèm JSON bytes của từng sản phẩm (một blob + offset) để ghép response không cần encode lại
+    - phần điểm xếp hạng không phụ thuộc truy vấn
+    - chỉ mục ngữ nghĩa (gắn sau khi dựng xong ở thread nền, None trước đó)
+    Thay đổi nhỏ (PATCH /catalog) tạo chỉ mục mới bằng apply(): vị trí cũ giữ nguyên,
+    sản phẩm mới thêm ở cuối, sản phẩm bị xóa chỉ bị gỡ khỏi posting list và bitmap
+    """
+
+    def __init__(self, data: pd.DataFrame, weights: Optional[RankingWeights] = None) -> None:
+        self.size = len(data)
+        self.deleted = 0
+        self.weights = weights or RankingWeights.from_env()
+        self.columns: List[str] = [str(c) for c in data.columns]
+        self.product_id = data['product_id'].to_numpy(dtype=np.int64)
+        self.price = data['price'].to_numpy(dtype=np.float64)
+        self.rating = data['rating'].to_numpy(dtype=np.float64)
+        reviews = data['num_reviews'].to_numpy(dtype=np.float64)
+        self.reviews_max = float(np.log1p(np.clip(np.nan_to_num(reviews), 0, None)).max()) if self.size else 0.0
+        self.base_score = static_scores(
+            self.rating,
+            reviews,
+            data['stock'].to_numpy(dtype=np.float64),
+            self.weights,
+            self.reviews_max,
+        )
+        self.records: List[dict] = self._serialize_records(data)
+        self.json_blob, self.json_offsets = self._encode_records(self.records)
+        # JSON của các dòng sửa/thêm sau khi dựng (vị trí -> bytes), ưu tiên hơn blob
+        self.json_overrides: Dict[int, bytes] = {}
+        self.groups: Dict[GroupKey, PostingList] = self._build_groups(data)
+        self.bitmaps = BitmapIndex(data, self.product_id, self.price, self.rating)
+        self.semantic: Optional[SemanticIndex] = None
+
+    @property
+    def count(self) -> int:
+        """
+        Số sản phẩm còn trong catalog (size gồm cả vị trí của sản phẩm đã xóa)
+        """
+        return self.size - self.deleted
+
+    @staticmethod
+    def semantic_texts(data: pd.DataFrame) -> List[str]:
+        return (data['product_name'].fillna('').astype(str) + ' ' +
+                data['description'].fillna('').astype(str)).tolist()
+
+    def _query(self, filter_dict: Optional[dict]) -> Optional[str]:
+        # Filter 'query' chỉ có hiệu lực khi chỉ mục ngữ nghĩa đã sẵn sàng
+        query = (filter_dict or {}).get('query')
+        if self.semantic is None or not isinstance(query, str) or not query.strip():
+            return None
+        return query
+
+    def _restrict(self, positions: np.ndarray, filter_dict: dict) -> np.ndarray:
+        """
+        Thu hẹp theo 'query'; không có sản phẩm nào liên quan thì bỏ qua query
+        (như trước đây khi Preferences không khớp category)
+        """
+        query = self._query(filter_dict)
+        if query is None or len(positions) == 0:
+            return positions
+        related = self.semantic.restrict(query, positions)
+        return related if len(related) else positions
+
+    @staticmethod
+    def _serialize_records(data: pd.DataFrame) -> List[dict]:
+        records = data.to_dict('records')
+        # NaN không hợp lệ trong JSON (ví dụ product_link trống) -> None
+        for record in records:
+            for key, value in record.items():
+                if isinstance(value, float) and math.isnan(value):
+                    record[key] = None
+        return records
+
+    @staticmethod
+    def _encode_records(records: List[dict]) -> Tuple[bytes, np.ndarray]:
+        encoded = [dumps(record) for record in records]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        return b"".join(encoded), offsets
+
+    @staticmethod
+    def _build_groups(data: pd.DataFrame) -> Dict[GroupKey, PostingList]:
+        prices = data['price'].to_numpy(dtype=np.float64)
+        categories = data['category'].to_numpy(dtype=object)
+        sexes = data['sex'].to_numpy(dtype=object)
+
+        # Sắp xếp toàn bộ catalog theo giá một lần, các nhóm giữ nguyên thứ tự đó
+        order = np.argsort(prices, kind='stable')
+        groups: Dict[GroupKey, PostingList] = {
+            (None, None): PostingList(prices[order], order)
+        }
+        keys = pd.DataFrame({'category': categories[order], 'sex': sexes[order]})
+        for columns in (['category', 'sex'], ['category'], ['sex']):
+            for value, idx in keys.groupby(columns, sort=False).indices.items():
+                if not isinstance(value, tuple):
+                    value = (value,)
+                named = dict(zip(columns, value))
+                positions = order[idx]
+                groups[(named.get('category'), named.get('sex'))] = PostingList(prices[positions], positions)
+        return groups
+
+    @staticmethod
+    def _group_keys(record: dict) -> set:
+        category, sex = record.get('category'), record.get('sex')
+        return {(None, None), (category, None), (None, sex), (category, sex)}
+
+    def _apply_groups(self, changes: List[RowChange], price: np.ndarray) -> Dict[GroupKey, PostingList]:
+        """
+        Chỉ sửa posting list của các nhóm có dòng đổi: gỡ vị trí cũ, chèn vị trí mới theo (giá, vị trí)
+        để giữ đúng thứ tự như khi dựng từ đầu
+        """
+        removed: Dict[GroupKey, List[int]] = {}
+        added: Dict[GroupKey, List[int]] = {}
+        for position, old, record in changes:
+            for key in self._group_keys(old) if old is not None else ():
+                removed.setdefault(key, []).append(position)
+            for key in self._group_keys(record) if record is not None else ():
+                added.setdefault(key, []).append(position)
+
+        groups = dict(self.groups)
+        empty = PostingList(np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64))
+        for key in set(removed) | set(added):
+            posting = groups.get(key, empty)
+            prices, positions = posting.prices, posting.positions
+            if key in removed:
+                keep = ~np.isin(positions, removed[key])
+                prices, positions = prices[keep], positions[keep]
+            if key in added:
+                inserted = sorted(added[key], key=lambda p: (price[p], p))
+                at = []
+                for p in inserted:
+                    lo = int(np.searchsorted(prices, price[p], side='left'))
+                    hi = int(np.searchsorted(prices, price[p], side='right'))
+                    at.append(lo + int(np.searchsorted(positions[lo:hi], p)))
+                prices = np.insert(prices, at, price[inserted])
+                positions = np.insert(positions, at, inserted).astype(np.int64)
+            if len(positions):
+                groups[key] = PostingList(prices, positions)
+            else:
+                groups.pop(key, None)
+        return groups
+
+    def apply(self, changes: List[RowChange]) -> "ProductIndex":
+        """
+        Chỉ mục mới sau khi áp dụng các dòng thay đổi (sản phẩm thêm mới có vị trí size, size + 1, ...).
+        Công việc theo từng dòng tỉ lệ với số dòng đổi; mảng cột được sao chép (memcpy) để request
+        đang đọc chỉ mục cũ không thấy dữ liệu nửa chừng. Vector ngữ nghĩa của dòng đổi giữ như cũ tới lần dựng lại
+        """
+        new = copy.copy(self)
+        inserted = sum(1 for _, old, _ in changes if old is None)
+        new.size = self.size + inserted
+        new.deleted = self.deleted + sum(1 for _, old, record in changes if old is not None and record is None)
+        live = [(position, record) for position, _, record in changes if record is not None]
+        at = np.array([position for position, _ in live], dtype=np.int64)
+
+        def column(name: str) -> np.ndarray:
+            return np.array([np.nan if r.get(name) is None else r[name] for _, r in live], dtype=np.float64)
+
+        def grown(values: np.ndarray, fill) -> np.ndarray:
+            return np.concatenate([values, np.full(new.size - self.size, fill, dtype=values.dtype)])
+
+        new.product_id = grown(self.product_id, -1)
+        new.product_id[at] = [r['product_id'] for _, r in live]
+        new.price = grown(self.price, np.nan)
+        new.price[at] = column('price')
+        new.rating = grown(self.rating, np.nan)
+        new.rating[at] = column('rating')
+        new.base_score = grown(self.base_score, 0.0)
+        new.base_score[at] = static_scores(new.rating[at], column('num_reviews'), column('stock'),
+                                           self.weights, self.reviews_max)
+
+        new.records = self.records + [None] * inserted
+        new.json_overrides = dict(self.json_overrides)
+        for position, record in live:
+            new.records[position] = record
+            new.json_overrides[position] = dumps(record)
+        new.groups = self._apply_groups(changes, new.price)
+        new.bitmaps = self.bitmaps.apply(new.size, changes)
+        if self.semantic is not None and new.size != self.size:
+            new.semantic = self.semantic.resized(new.size)
+        return new
+
+    @staticmethod
+    def row_matches(record: Dict[str, Any], filter_dict: dict) -> bool:
+        """
+        Sản phẩm có thể nằm trong kết quả của filter không. Dùng để giữ lại cache khi catalog đổi một phần
+        nên trả về True khi không chắc ('query', khóa lạ, giá trị sai kiểu)
+        """
+        def values(value) -> set:
+            items = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            return {normalize_text(str(item)) for item in items}
+
+        def number(column: str) -> float:
+            value = record.get(column)
+            return np.nan if value is None else float(value)
+
+        try:
+            for key, value in filter_dict.items():
+                if value is None or value is False or value in ([], ()):
+                    continue
+                if key in ('category', 'sex', 'brand'):
+                    if record.get(key) is None or normalize_text(str(record[key])) not in values(value):
+                        return False
+                elif key in ('exclude_categories', 'exclude_brands'):
+                    column = 'category' if key == 'exclude_categories' else 'brand'
+                    if record.get(column) is not None and normalize_text(str(record[column])) in values(value):
+                        return False
+                elif key == 'exclude_product_ids':
+                    items = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+                    if int(record['product_id']) in {int(item) for item in items}:
+                        return False
+                elif key in ('min_price', 'max_price', 'min_rating', 'min_reviews'):
+                    column = {'min_price': 'price', 'max_price': 'price', 'min_rating': 'rating',
+                              'min_reviews': 'num_reviews'}[key]
+                    current = number(column)
+                    if np.isnan(current) or (current > float(value) if key == 'max_price' else current < float(value)):
+                        return False
+                elif key == 'in_stock_only':
+                    if not number('stock') > 0:
+                        return False
+                else:
+                    return True
+        except (TypeError, ValueError, KeyError):
+            return True
+        return True
+
+    def match(self, filter_dict: dict) -> np.ndarray:
+        """
+        Trả về vị trí các sản phẩm khớp filter, theo thứ tự trong catalog
+        """
+        if BitmapIndex.needed(filter_dict):
+            return self._restrict(self.bitmaps.match(filter_dict), filter_dict)
+        key = (filter_dict.get('category'), filter_dict.get('sex'))
+        posting = self.groups.get(key)
+        if posting is None:
+            return np.empty(0, dtype=np.int64)
+        positions = posting.price_range(filter_dict.get('min_price'), filter_dict.get('max_price'))
+        return self._restrict(np.sort(positions), filter_dict)
+
+    def match_count(self, filter_dict: dict) -> int:
+        """
+        Số sản phẩm khớp filter; filter chỉ có category/sex/giá đếm thẳng trên posting list
+        (hai lần searchsorted, không tạo/sắp xếp mảng vị trí)
+        """
+        if BitmapIndex.needed(filter_dict) or self._query(filter_dict) is not None:
+            return len(self.match(filter_dict))
+        posting = self.groups.get((filter_dict.get('category'), filter_dict.get('sex')))
+        if posting is None:
+            return 0
+        return len(posting.price_range(filter_dict.get('min_price'), filter_dict.get('max_price')))
+
+    def match_many(self, filter_dicts: List[dict]) -> List[np.ndarray]:
+        """
+        Đánh giá nhiều filter một lượt: gom theo (category, sex) rồi
+        searchsorted cả mảng min/max giá trên posting list của nhóm
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(filter_dicts)
+        by_group: Dict[GroupKey, List[int]] = {}
+        for i, filter_dict in enumerate(filter_dicts):
+            if BitmapIndex.needed(filter_dict):
+                results[i] = self.match(filter_dict)
+                continue
+            by_group.setdefault((filter_dict.get('category'), filter_dict.get('sex')), []).append(i)
+
+        empty = np.empty(0, dtype=np.int64)
+        for key, members in by_group.items():
+            posting = self.groups.get(key)
+            if posting is None:
+                for i in members:
+                    results[i] = empty
+                continue
+            mins = np.array([filter_dicts[i].get('min_price', -np.inf) for i in members], dtype=np.float64)
+            maxs = np.array([filter_dicts[i].get('max_price', np.inf) for i in members], dtype=np.float64)
+            los = np.searchsorted(posting.prices, mins, side='left')
+            his = np.searchsorted(posting.prices, maxs, side='right')
+            for i, lo, hi in zip(members, los, his):
+                results[i] = self._restrict(posting.positions[lo:hi], filter_dicts[i]) if hi > lo else empty
+        return results
+
+    def positions_of(self, product_ids) -> np.ndarray:
+        """
+        Vị trí của các product_id trong catalog (id không còn tồn tại bị bỏ qua)
+        """
+        return self.bitmaps.positions_of_ids(product_ids)
+
+    def facets(self, positions: np.ndarray, fields=('brand', 'category')) -> Dict[str, Dict[str, int]]:
+        return self.bitmaps.facets(positions, fields)
+
+    def take(self, positions) -> List[dict]:
+        records = self.records
+        return [records[i] for i in positions]
+
+    def _json_fragments(self, positions) -> List[bytes]:
+        blob = self.json_blob
+        positions = np.asarray(positions, dtype=np.int64)
+        overrides = self.json_overrides
+        if not overrides:
+            starts = self.json_offsets[positions].tolist()
+            ends = self.json_offsets[positions + 1].tolist()
+            return [blob[start:end] for start, end in zip(starts, ends)]
+        # Vị trí thêm sau khi dựng nằm ngoài blob: cắt thành đoạn rỗng rồi thay bằng bytes của override
+        last = len(self.json_offsets) - 1
+        starts = self.json_offsets[np.minimum(positions, last)].tolist()
+        ends = self.json_offsets[np.minimum(positions + 1, last)].tolist()
+        return [overrides.get(p) or blob[start:end] for p, start, end in zip(positions.tolist(), starts, ends)]
+
+    def take_json(self, positions) -> bytes:
+        """
+        Mảng JSON của các sản phẩm, ghép từ bytes đã encode sẵn
+        """
+        return b"[" + b",".join(self._json_fragments(positions)) + b"]"
+
+    def search(self, filter_dict: dict) -> List[dict]:
+        return self.take(self.order(self.match(filter_dict), DEFAULT_SORT, filter_dict))
+
+    def scores(self, positions: np.ndarray, filter_dict: Optional[dict] = None) -> np.ndarray:
+        scores = self.base_score[positions]
+        budget = budget_scores(self.price[positions], filter_dict or {}, self.weights)
+        if budget is not None:
+            scores = scores + budget
+        query = self._query(filter_dict)
+        if query is not None and self.weights.semantic:
+            scores = scores + self.weights.semantic * self.semantic.similarity(query)[positions]
+        return scores
+
+    def key_values(self, positions: np.ndarray, sort: str, filter_dict: Optional[dict] = None) -> np.ndarray:
+        """
+        Giá trị khóa sắp xếp (tăng dần) của các vị trí; 'score' được đảo dấu để điểm cao đứng trước.
+        Giá trị thiếu (rating null sau PATCH /catalog) là +inf: luôn đứng cuối, top-k và cursor so sánh được
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        if sort == 'score':
+            values = -self.scores(positions, filter_dict)
+        else:
+            column = getattr(self, sort.lstrip('-'))[positions]
+            values = -column if sort.startswith('-') else column
+        return np.where(np.isnan(values), np.inf, values) if values.dtype.kind == 'f' else values
+
+    def order(self, positions: np.ndarray, sort: str = DEFAULT_SORT, filter_dict: Optional[dict] = None) -> np.ndarray:
+        """
+        Sắp xếp vị trí theo (sort key, product_id) để cursor luôn ổn định
+        """
+        values = self.key_values(positions, sort, filter_dict)
+        return positions[np.lexsort((self.product_id[positions], values))]
+
+    def top(self, positions: np.ndarray, k: int, sort: str = DEFAULT_SORT,
+            filter_dict: Optional[dict] = None) -> np.ndarray:
+        """
+        k vị trí đứng đầu theo cùng thứ tự với order(), dùng argpartition thay vì sort toàn bộ
+        """
+        values = self.key_values(positions, sort, filter_dict)
+        return positions[top_k(values, self.product_id[positions], k)]
+
+    @staticmethod
+    def encode_cursor(value: float, product_id: int) -> str:
+        raw = json.dumps([value, product_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[float, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, product_id = json.loads(raw)
+            return float(value), int(product_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def seek(self, ordered: np.ndarray, sort: str, cursor: Optional[str], filter_dict: Optional[dict] = None) -> int:
+        """
+        Vị trí bắt đầu trong danh sách đã sắp xếp, ngay sau phần tử của cursor
+        """
+        if not cursor:
+            return 0
+        value, product_id = self.decode_cursor(cursor)
+        values = self.key_values(ordered, sort, filter_dict)
+        lo = int(np.searchsorted(values, value, side='left'))
+        hi = int(np.searchsorted(values, value, side='right'))
+        return lo + int(np.searchsorted(self.product_id[ordered[lo:hi]], product_id, side='right'))
+
+    def cursor_after(self, position: int, sort: str, filter_dict: Optional[dict] = None) -> str:
+        value = self.key_values(np.array([position]), sort, filter_dict)[0]
+        return self.encode_cursor(float(value), int(self.product_id[position]))
+
+    def page(self, ordered: np.ndarray, sort: str, limit: int, cursor: Optional[str] = None,
+             filter_dict: Optional[dict] = None) -> Tuple[np.ndarray, Optional[str]]:
+        start = self.seek(ordered, sort, cursor, filter_dict)
+        positions = ordered[start:start + limit]
+        next_cursor = None
+        if start + limit < len(ordered) and len(positions):
+            next_cursor = self.cursor_after(positions[-1], sort, filter_dict)
+        return positions, next_cursor
+
+    def iter_ndjson(self, ordered: np.ndarray, start: int = 0, chunk_size: int = 256) -> Iterator[bytes]:
+        """
+        Sinh NDJSON theo từng khối, ghép từ JSON bytes đã encode sẵn
+        """
+        for offset in range(start, len(ordered), chunk_size):
+            yield b'\n'.join(self._json_fragments(ordered[offset:offset + chunk_size])) + b'\n'
@@ -0,0 +1,95 @@
+import os
+import numpy as np
+from typing import Dict, Optional
+
+
+class RankingWeights:
+    """
+    Trọng số điểm xếp hạng sản phẩm; cấu hình qua biến môi trường
+    RANKING_WEIGHTS="rating=0.4,reviews=0.2,budget=0.25,stock=0.15,semantic=1.0"
+    """
+    __slots__ = ('rating', 'reviews', 'budget', 'stock', 'semantic')
+
+    DEFAULTS = {'rating': 0.4, 'reviews': 0.2, 'budget': 0.25, 'stock': 0.15, 'semantic': 1.0}
+
+    def __init__(self, rating: float = DEFAULTS['rating'], reviews: float = DEFAULTS['reviews'],
+                 budget: float = DEFAULTS['budget'], stock: float = DEFAULTS['stock'],
+                 semantic: float = DEFAULTS['semantic']) -> None:
+        self.rating = rating
+        self.reviews = reviews
+        self.budget = budget
+        self.stock = stock
+        self.semantic = semantic
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> "RankingWeights":
+        values: Dict[str, float] = dict(cls.DEFAULTS)
+        for part in (spec or "").split(","):
+            if not part.strip():
+                continue
+            name, _, value = part.partition("=")
+            name = name.strip()
+            if name not in values:
+                raise ValueError(f"Unknown ranking weight: {name}")
+            values[name] = float(value)
+        return cls(**values)
+
+    @classmethod
+    def from_env(cls) -> "RankingWeights":
+        return cls.parse(os.getenv("RANKING_WEIGHTS"))
+
+    def to_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def static_scores(rating: np.ndarray, num_reviews: np.ndarray, stock: np.ndarray,
+                  weights: RankingWeights, reviews_max: Optional[float] = None) -> np.ndarray:
+    """
+    Phần điểm không phụ thuộc truy vấn, tính một lần khi dựng chỉ mục.
+    reviews_max: mốc chuẩn hóa số review (log) của catalog khi chỉ tính lại vài dòng; mặc định lấy max của mảng
+    """
+    rating_score = np.clip(np.nan_to_num(rating) / 5.0, 0.0, 1.0)
+    reviews = np.log1p(np.clip(np.nan_to_num(num_reviews), 0, None))
+    if reviews_max is None:
+        reviews_max = reviews.max() if len(reviews) else 0.0
+    reviews_score = np.minimum(reviews / reviews_max, 1.0) if reviews_max > 0 else reviews
+    stock_score = (np.nan_to_num(stock) > 0).astype(np.float64)
+    return weights.rating * rating_score + weights.reviews * reviews_score + weights.stock * stock_score
+
+
+def budget_scores(prices: np.ndarray, filter_dict: dict, weights: RankingWeights) -> Optional[np.ndarray]:
+    """
+    Giá càng gần ngân sách (max_price) điểm càng cao; None nếu truy vấn không có ngân sách
+    """
+    budget = filter_dict.get('max_price')
+    if budget is None or weights.budget == 0:
+        return None
+    try:
+        budget = float(budget)
+    except (TypeError, ValueError):
+        return None
+    if budget <= 0:
+        return None
+    closeness = 1.0 - np.abs(prices - budget) / budget
+    return weights.budget * np.clip(closeness, 0.0, 1.0)
+
+
+def top_k(values: np.ndarray, tiebreak: np.ndarray, k: int) -> np.ndarray:
+    """
+    Chỉ số của k phần tử nhỏ nhất theo (values, tiebreak) mà không sắp xếp toàn bộ mảng.
+    Trùng giá trị ở biên được chọn theo tiebreak để khớp đúng với kết quả sort đầy đủ.
+    NaN được xếp cuối như +inf (so sánh với kth là NaN không chọn được phần tử nào)
+    """
+    n = len(values)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    values = np.where(np.isnan(values), np.inf, values)
+    if k < n:
+        kth = np.partition(values, k - 1)[k - 1]
+        less = np.flatnonzero(values < kth)
+        equal = np.flatnonzero(values == kth)
+        equal = equal[np.argsort(tiebreak[equal], kind='stable')][:k - len(less)]
+        selected = np.concatenate([less, equal])
+    else:
+        selected = np.arange(n)
+    return selected[np.lexsort((tiebreak[selected], values[selected]))]
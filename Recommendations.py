@@ -0,0 +1,358 @@
+"""
+Bảng gợi ý dựng sẵn theo (người nhận, dịp, giới tính, khoảng ngân sách) từ taxonomy cấu hình
+(gift_taxonomy.json). Request dạng form không có Preferences chỉ cần tra bảng rồi lọc theo ngân sách.
+
+    python Recommendations.py database.csv   # dựng bảng, in thời gian và vài dòng mẫu
+"""
+import copy
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from ProductIndex import ProductIndex
+from Ranking import top_k
+from TextMatcher import PhraseMatcher
+
+ANY = '*'  # người nhận/dịp không khớp taxonomy
+NO_BUDGET = -1
+# Filter chỉ gồm các khóa này mới dùng bảng (có category/query/filter mở rộng thì lọc như cũ)
+TABLE_FILTER_KEYS = frozenset(('sex', 'min_price', 'max_price'))
+# Các cột ảnh hưởng tới nhóm và điểm xếp hạng; đổi tên/mô tả/ảnh không cần dựng lại ô nào
+RANK_COLUMNS = ['category', 'sex', 'price', 'rating', 'num_reviews', 'stock']
+
+TableKey = Tuple[str, str, str, int]  # (recipient, occasion, sex, band)
+GroupKey = Tuple[str, int]  # (sex, band): các ô cùng nhóm dùng chung tập ứng viên
+
+
+class GiftTaxonomy:
+    """
+    Người nhận và dịp (cụm từ nhận diện + độ phù hợp theo category), các mốc ngân sách và tham số xếp hạng
+    """
+
+    def __init__(self, spec: dict) -> None:
+        self.recipients: Dict[str, Dict[str, float]] = {
+            name: dict(entry.get('categories', {})) for name, entry in spec.get('recipients', {}).items()
+        }
+        self.occasions: Dict[str, Dict[str, float]] = {
+            name: dict(entry.get('categories', {})) for name, entry in spec.get('occasions', {}).items()
+        }
+        self.recipient_matcher = PhraseMatcher({
+            phrase: name for name, entry in spec.get('recipients', {}).items() for phrase in entry.get('phrases', [])
+        })
+        self.occasion_matcher = PhraseMatcher({
+            phrase: name for name, entry in spec.get('occasions', {}).items() for phrase in entry.get('phrases', [])
+        })
+        self.budget_edges: List[float] = sorted(float(edge) for edge in spec.get('budget_bands', []))
+        self.sexes: Tuple[str, ...] = tuple(spec.get('sexes', ('male', 'female', 'unisex')))
+        self.top_k = int(spec.get('top_k', 200))
+        self.min_results = int(spec.get('min_results', 5))
+        self.default_affinity = float(spec.get('default_affinity', 0.3))
+        self.affinity_weight = float(spec.get('affinity_weight', 1.5))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["GiftTaxonomy"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            print(f"Gift taxonomy '{path}' not found, recommendation tables disabled")
+            return None
+
+    def recipient(self, text: Optional[str]) -> str:
+        # Nhận cả cụm từ trong form lẫn tên nhóm đã trích (extract)
+        if text in self.recipients:
+            return text
+        return (self.recipient_matcher.resolve(text) if text else None) or ANY
+
+    def occasion(self, text: Optional[str]) -> str:
+        if text in self.occasions:
+            return text
+        return (self.occasion_matcher.resolve(text) if text else None) or ANY
+
+    def extract(self, question: str) -> dict:
+        """
+        Người nhận và dịp được nhắc trong câu hỏi tự do (tên nhóm, None nếu không nhắc tới),
+        cùng khóa với form GiftPrompt để tra bảng gợi ý
+        """
+        return {
+            'gift_recipient': self.recipient_matcher.match(question),
+            'occasion': self.occasion_matcher.match(question),
+        }
+
+    def sex(self, value: Optional[str]) -> str:
+        return value if value in self.sexes else 'unisex'
+
+    @property
+    def bands(self) -> List[int]:
+        return [NO_BUDGET] + list(range(len(self.budget_edges) + 1))
+
+    def band(self, budget) -> int:
+        if budget is None:
+            return NO_BUDGET
+        try:
+            return int(np.searchsorted(self.budget_edges, float(budget), side='left'))
+        except (TypeError, ValueError):
+            return NO_BUDGET
+
+    def window(self, band: int) -> Tuple[float, float]:
+        """
+        Khoảng giá ứng viên của một band: từ mốc dưới của band liền trước tới mốc trên của band,
+        để ngân sách ở đầu band vẫn còn đủ sản phẩm sau khi lọc
+        """
+        if band == NO_BUDGET:
+            return 0.0, np.inf
+        edges = [0.0] + self.budget_edges + [np.inf]
+        return edges[max(band - 1, 0)], edges[band + 1]
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return [(r, o) for r in list(self.recipients) + [ANY] for o in list(self.occasions) + [ANY]]
+
+    def affinity(self, recipient: str, occasion: str, categories: List[str]) -> np.ndarray:
+        """
+        Độ phù hợp của từng category: trung bình của người nhận và dịp (bỏ qua phần không khớp taxonomy)
+        """
+        tables = [t for t in (self.recipients.get(recipient), self.occasions.get(occasion)) if t is not None]
+        if not tables:
+            return np.full(len(categories), self.default_affinity)
+        return np.array([np.mean([t.get(c, self.default_affinity) for t in tables]) for c in categories])
+
+
+class RecommendationTable:
+    """
+    Mỗi ô (recipient, occasion, sex, band) giữ tối đa top_k vị trí sản phẩm đã xếp hạng
+    (điểm tĩnh của chỉ mục + affinity_weight * độ phù hợp category), gói trong một mảng + offset.
+    Khi catalog đổi chỉ dựng lại các nhóm (sex, band) có dòng bị thêm/sửa/xóa
+    """
+
+    def __init__(self, taxonomy: GiftTaxonomy, index: ProductIndex, data: pd.DataFrame,
+                 previous: Optional["RecommendationTable"] = None) -> None:
+        started = time.perf_counter()
+        self.taxonomy = taxonomy
+        self.pairs = taxonomy.pairs()
+        self.group_keys: List[GroupKey] = [(s, b) for s in taxonomy.sexes for b in taxonomy.bands]
+        self._sex = data['sex'].to_numpy(dtype=object)
+        self._cat_codes, categories = pd.factorize(data['category'].astype(str))
+        self._categories: List[str] = list(categories)
+        self._affinity = np.array([taxonomy.affinity(r, o, self._categories) for r, o in self.pairs])
+
+        # Hash từng dòng theo product_id để so với catalog lần sau
+        self._ids = index.product_id
+        sorted_ids = np.sort(self._ids)
+        self._unique_ids = bool((sorted_ids[1:] != sorted_ids[:-1]).all())
+        self._hash = pd.util.hash_pandas_object(data[RANK_COLUMNS], index=False).to_numpy()
+        self._price = index.price
+        reviews = np.log1p(np.clip(np.nan_to_num(data['num_reviews'].to_numpy(dtype=np.float64)), 0, None))
+        self._review_scale = float(reviews.max()) if len(reviews) else 0.0
+
+        affected = self._affected_groups(previous)
+        # product_id (không phải vị trí: vị trí đổi giữa các phiên bản catalog) theo thứ tự self.pairs
+        self._group_ids: Dict[GroupKey, List[np.ndarray]] = {}
+        if affected:
+            # Sắp xếp một lần theo (category, điểm tĩnh giảm dần, product_id); mỗi nhóm là một dãy con
+            ranked = np.lexsort((index.product_id, -index.base_score, self._cat_codes))
+            prices, sex_masks = index.price[ranked], self._sex_masks(self._sex[ranked])
+        for group in self.group_keys:
+            if group in affected:
+                positions = ranked[self._in_group(prices, sex_masks, group)]
+                self._group_ids[group] = [index.product_id[p] for p in self._rank_group(index, positions)]
+            else:
+                self._group_ids[group] = previous._group_ids[group]
+        self._pack(index)
+        self._patched_groups: set = set()
+        self.rebuilt_groups = len(affected)
+        self.build_duration = time.perf_counter() - started
+
+    def refresh(self, index: ProductIndex, data: pd.DataFrame) -> "RecommendationTable":
+        """
+        Bảng cho phiên bản catalog mới, dùng lại các nhóm không có dòng nào thay đổi
+        """
+        return RecommendationTable(self.taxonomy, index, data, previous=self)
+
+    def apply(self, index: ProductIndex, changes: list) -> "RecommendationTable":
+        """
+        Bảng cho chỉ mục vừa áp dụng thay đổi nhỏ (PATCH /catalog, xem ProductIndex.apply): dựng lại các nhóm
+        (sex, band) chứa phiên bản cũ hoặc mới của dòng đổi cột xếp hạng, ứng viên lấy từ posting list theo giới tính.
+        Dữ liệu để so sánh khi refresh vẫn là của lần dựng đầy đủ; các nhóm đã dựng lại ở đây được ghi nhận
+        để lần refresh kế tiếp cũng dựng lại chúng
+        """
+        started = time.perf_counter()
+        rows = [(position, old, record) for position, old, record in changes
+                if old is None or record is None or any(old.get(c) != record.get(c) for c in RANK_COLUMNS)]
+        versions = [r for _, old, record in rows for r in (old, record) if r is not None]
+        prices = np.array([np.nan if r.get('price') is None else r['price'] for r in versions], dtype=np.float64)
+        sex_masks = self._sex_masks(np.array([r.get('sex') for r in versions], dtype=object))
+        affected = [group for group in self.group_keys if self._in_group(prices, sex_masks, group).any()]
+        table = copy.copy(self)
+        table.rebuilt_groups = len(affected)
+        if not affected:
+            table.build_duration = time.perf_counter() - started
+            return table
+
+        # Mã category theo vị trí của chỉ mục mới (sản phẩm thêm mới nằm ở cuối, có thể có category mới)
+        table._categories = list(self._categories)
+        codes = {category: code for code, category in enumerate(table._categories)}
+        table._cat_codes = np.concatenate([self._cat_codes, np.full(index.size - len(self._cat_codes), -1, dtype=np.int64)])
+        for position, _, record in rows:
+            if record is not None:
+                category = str(record.get('category'))
+                if category not in codes:
+                    codes[category] = len(table._categories)
+                    table._categories.append(category)
+                table._cat_codes[position] = codes[category]
+        if len(table._categories) > len(self._categories):
+            table._affinity = np.array([self.taxonomy.affinity(r, o, table._categories) for r, o in self.pairs])
+
+        table._group_ids = dict(self._group_ids)
+        ranked: Dict[GroupKey, List[np.ndarray]] = {}
+        empty = np.empty(0, dtype=np.int64)
+        for sex, band in affected:
+            posting = index.groups.get((None, sex))
+            candidates = posting.price_range(*self.taxonomy.window(band)) if posting is not None else empty
+            candidates = candidates[np.lexsort((index.product_id[candidates], -index.base_score[candidates],
+                                                table._cat_codes[candidates]))]
+            ranked[(sex, band)] = table._rank_group(index, candidates)
+            table._group_ids[(sex, band)] = [index.product_id[p] for p in ranked[(sex, band)]]
+
+        # Nhóm không đổi giữ nguyên vị trí (ProductIndex.apply không dời vị trí của dòng cũ)
+        table.slots = {}
+        chunks: List[np.ndarray] = []
+        offset = 0
+        for group in self.group_keys:
+            for i, pair in enumerate(self.pairs):
+                key = pair + group
+                if group in ranked:
+                    positions = ranked[group][i]
+                else:
+                    start, end = self.slots[key]
+                    positions = self.positions[start:end]
+                table.slots[key] = (offset, offset + len(positions))
+                chunks.append(positions)
+                offset += len(positions)
+        table.positions = np.concatenate(chunks).astype(np.int64) if chunks else empty
+        table.prices = index.price[table.positions]
+        table._patched_groups = self._patched_groups | set(affected)
+        table.build_duration = time.perf_counter() - started
+        return table
+
+    def _affected_groups(self, previous: Optional["RecommendationTable"]) -> set:
+        if (previous is None or previous.taxonomy is not self.taxonomy
+                or previous._review_scale != self._review_scale  # điểm review chuẩn hóa theo max -> đổi toàn bộ
+                or not (self._unique_ids and previous._unique_ids)):
+            return set(self.group_keys)
+
+        _, old_i, new_i = np.intersect1d(previous._ids, self._ids, assume_unique=True, return_indices=True)
+        same = previous._hash[old_i] == self._hash[new_i]
+        unchanged_old = np.zeros(len(previous._ids), dtype=bool)
+        unchanged_old[old_i[same]] = True
+        unchanged_new = np.zeros(len(self._ids), dtype=bool)
+        unchanged_new[new_i[same]] = True
+
+        # Cả phiên bản cũ (bị xóa/sửa) lẫn mới (thêm/sửa) của dòng thay đổi đều có thể đổi nhóm chứa nó
+        prices = np.concatenate([previous._price[~unchanged_old], self._price[~unchanged_new]])
+        sex_masks = self._sex_masks(np.concatenate([previous._sex[~unchanged_old], self._sex[~unchanged_new]]))
+        # Nhóm đã dựng lại theo PATCH (apply) có thể chứa sản phẩm mà catalog mới chưa/không có
+        return previous._patched_groups | {
+            group for group in self.group_keys if self._in_group(prices, sex_masks, group).any()}
+
+    def _sex_masks(self, sexes: np.ndarray) -> Dict[str, np.ndarray]:
+        # Khớp đúng giới tính như filter 'sex' của chỉ mục (unisex chỉ gồm sản phẩm unisex)
+        return {sex: sexes == sex for sex in self.taxonomy.sexes}
+
+    def _in_group(self, prices: np.ndarray, sex_masks: Dict[str, np.ndarray], group: GroupKey) -> np.ndarray:
+        sex, band = group
+        lo, hi = self.taxonomy.window(band)
+        return (prices >= lo) & (prices <= hi) & sex_masks[sex]
+
+    def _rank_group(self, index: ProductIndex, positions: np.ndarray) -> List[np.ndarray]:
+        """
+        Top-k của mọi cặp (recipient, occasion) trong một nhóm (positions đã xếp theo category, điểm tĩnh).
+        Độ phù hợp chỉ phụ thuộc category nên top-k của cặp nằm trong hợp các top-k theo điểm tĩnh
+        của từng category: chỉ xếp hạng danh sách ngắn đó
+        """
+        k = self.taxonomy.top_k
+        codes = self._cat_codes[positions]
+        base = index.base_score[positions]
+        shortlist = np.arange(len(codes)) - np.searchsorted(codes, codes, side='left') < k
+        positions, codes, base = positions[shortlist], codes[shortlist], base[shortlist]
+        product_ids = index.product_id[positions]
+
+        ranked = []
+        for affinity in self._affinity:
+            score = base + self.taxonomy.affinity_weight * affinity[codes]
+            ranked.append(positions[top_k(-score, product_ids, k)])
+        return ranked
+
+    def _pack(self, index: ProductIndex):
+        # Một mảng vị trí + một mảng giá cho toàn bảng; slot -> (start, end)
+        self.slots: Dict[TableKey, Tuple[int, int]] = {}
+        chunks: List[np.ndarray] = []
+        offset = 0
+        for sex, band in self.group_keys:
+            for (recipient, occasion), ids in zip(self.pairs, self._group_ids[(sex, band)]):
+                self.slots[(recipient, occasion, sex, band)] = (offset, offset + len(ids))
+                chunks.append(ids)
+                offset += len(ids)
+        ids = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+        # Nhóm được dùng lại giữ product_id của dòng không đổi nên đều còn trong catalog mới
+        self.positions = index.positions_of(ids)
+        if len(self.positions) != len(ids):
+            raise RuntimeError("Recommendation table refers to products missing from the catalog")
+        self.prices = index.price[self.positions]
+
+    def lookup(self, recipient: Optional[str], occasion: Optional[str], sex: Optional[str],
+               min_price=None, max_price=None) -> Optional[np.ndarray]:
+        """
+        Vị trí sản phẩm đã xếp hạng cho prompt, lọc theo ngân sách;
+        None nếu còn ít hơn min_results sản phẩm (để lọc theo cách cũ)
+        """
+        taxonomy = self.taxonomy
+        key = (taxonomy.recipient(recipient), taxonomy.occasion(occasion), taxonomy.sex(sex), taxonomy.band(max_price))
+        start, end = self.slots.get(key, (0, 0))
+        positions, prices = self.positions[start:end], self.prices[start:end]
+        mask = np.ones(len(positions), dtype=bool)
+        if min_price is not None:
+            mask &= prices >= float(min_price)
+        if max_price is not None:
+            mask &= prices <= float(max_price)
+        positions = positions[mask]
+        return positions if len(positions) >= max(taxonomy.min_results, 1) else None
+
+    @staticmethod
+    def applies(filter_dict: dict) -> bool:
+        return 'sex' in filter_dict and set(filter_dict) <= TABLE_FILTER_KEYS
+
+    def nbytes(self) -> int:
+        return self.positions.nbytes + self.prices.nbytes + sum(
+            ids.nbytes for group in self._group_ids.values() for ids in group)
+
+    def status(self) -> dict:
+        return {
+            "slots": len(self.slots),
+            "groups_rebuilt": self.rebuilt_groups,
+            "groups_total": len(self.group_keys),
+            "build_duration_ms": round(self.build_duration * 1000, 2),
+            "memory_mb": round(self.nbytes() / 1e6, 2),
+        }
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "database.csv"
+    taxonomy = GiftTaxonomy.load(os.getenv("GIFT_TAXONOMY", "gift_taxonomy.json"))
+    if taxonomy is None:
+        sys.exit(1)
+    data = pd.read_csv(path)
+    index = ProductIndex(data)
+    table = RecommendationTable(taxonomy, index, data)
+    print(json.dumps(table.status(), indent=2))
+    for recipient, occasion in (("bố", "sinh nhật"), ("người yêu", "valentine"), ("bạn thân", "giáng sinh")):
+        for sex in taxonomy.sexes[:2]:
+            positions = table.lookup(recipient, occasion, sex, max_price=1000000)
+            names = [] if positions is None else [index.records[i]['product_name'] for i in positions[:3]]
+            print(f"{recipient} / {occasion} / {sex} / <=1.000.000: {names}")
+
+
+if __name__ == "__main__":
+    main()
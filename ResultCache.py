@@ -0,0 +1,236 @@
+import ast
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+def normalize_filter(filter_dict: dict) -> Optional[Hashable]:
+    """
+    Chuẩn hóa filter thành khóa cache; trả về None nếu filter không hash được.
+    Chuỗi giữ nguyên văn: category/sex được so khớp phân biệt hoa thường nên 'Shirt' và 'shirt'
+    là hai filter khác nhau, không được dùng chung kết quả
+    """
+    def value(v):
+        if isinstance(v, (list, tuple, set, frozenset)):
+            # Danh sách (brand, nhiều category, loại trừ) không phụ thuộc thứ tự
+            return tuple(sorted((value(item) for item in v), key=repr))
+        return v
+
+    try:
+        key = tuple(sorted((k, value(v)) for k, v in filter_dict.items()))
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
+class ResultCache:
+    """
+    LRU cache có TTL cho kết quả /products, kèm bộ đếm hit/miss
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                self.evictions += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def rekey(self, fn: Callable[[Hashable], Optional[Hashable]]) -> int:
+        """
+        Chuyển mọi mục sang khóa fn(key), bỏ mục có fn(key) là None (giữ hạn và thứ tự LRU).
+        Dùng khi catalog chỉ đổi vài dòng: kết quả không liên quan tới các dòng đó vẫn đúng với phiên bản mới.
+        Trả về số mục được giữ
+        """
+        with self._lock:
+            entries = OrderedDict()
+            for key, entry in self._entries.items():
+                new_key = fn(key)
+                if new_key is not None:
+                    entries[new_key] = entry
+            self.evictions += len(self._entries) - len(entries)
+            self._entries = entries
+            return len(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SqliteResultCache:
+    """
+    Cache kết quả trong file SQLite cục bộ, dùng chung giữa các worker (cùng interface với ResultCache).
+    Hit không ghi gì vào DB; hết hạn/quá số lượng được dọn theo lô, mục cũ nhất bị bỏ trước.
+    Bộ đếm hit/miss là của từng worker
+    """
+    EVICT_EVERY = 64
+    # Kết quả quá lớn (ví dụ toàn bộ catalog) tính lại còn rẻ hơn pickle qua SQLite
+    MAX_VALUE_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, path: str, max_size: int = 1024, ttl: float = 300.0) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connect().execute("CREATE INDEX IF NOT EXISTS idx_results_expires_at ON results(expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # Connection không dùng lại được sau fork -> mỗi thread/process mở connection riêng
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        # Khóa là tuple các giá trị nguyên thủy (xem normalize_filter) nên repr ổn định giữa các process
+        return repr(key)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key is None:
+            return default
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM results WHERE key = ?", (self._key(key),)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key: Hashable, value: Any):
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(raw) > self.MAX_VALUE_BYTES:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+            (self._key(key), raw, now + self.ttl),
+        )
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute("DELETE FROM results WHERE expires_at < ?", (now,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        ).rowcount
+        self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM results")
+
+    def rekey(self, fn: Callable[[Hashable], Optional[Hashable]]) -> int:
+        """
+        Như ResultCache.rekey nhưng chép sang khóa mới thay vì đổi tên: worker chưa áp dụng
+        thay đổi catalog vẫn dùng được khóa cũ tới khi hết hạn
+        """
+        conn = self._connect()
+        rows = conn.execute("SELECT key, value, expires_at FROM results WHERE expires_at >= ?",
+                            (time.time(),)).fetchall()
+        copied = []
+        for key, value, expires_at in rows:
+            try:
+                new_key = fn(ast.literal_eval(key))
+            except (ValueError, SyntaxError):
+                continue
+            if new_key is not None:
+                copied.append((self._key(new_key), value, expires_at))
+        if copied:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)", copied)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(copied)
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "size": len(self),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def create_result_cache(kind: str = "memory", path: str = "result_cache.db", max_size: int = 1024,
+                        ttl: float = 300.0):
+    if kind == "sqlite":
+        return SqliteResultCache(path, max_size=max_size, ttl=ttl)
+    if kind == "memory":
+        return ResultCache(max_size=max_size, ttl=ttl)
+    raise ValueError(f"Unknown result cache backend: {kind}")
@@ -0,0 +1,189 @@
+import copy
+import os
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from TextMatcher import normalize_text
+
+# Sản phẩm có cosine thấp hơn ngưỡng này coi như không liên quan tới truy vấn
+MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.15"))
+
+# Hash từ (âm tiết) và cặp từ liên tiếp vào không gian 2^20 chiều;
+# va chạm hash chấp nhận được ở quy mô catalog
+N_FEATURES = 1 << 20
+_P = 1000003
+_P_INV = pow(_P, -1, 1 << 64)
+_BIGRAM = np.uint64(0x9E3779B97F4A7C15)
+_SPACE = ord(" ")
+_WHITESPACE_CODES = np.array([ord(c) for c in "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f\x85\xa0"], dtype=np.uint32)
+
+
+def _powers(base: int, n: int) -> np.ndarray:
+    # base^0..base^(n-1) mod 2^64 (phép nhân uint64 của numpy tự tràn theo mod 2^64)
+    powers = np.full(n, base, dtype=np.uint64)
+    powers[0] = 1
+    return np.cumprod(powers, dtype=np.uint64)
+
+
+def _word_hashes(codes: np.ndarray, docs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash đa thức của từng từ (chuỗi ký tự liền nhau không có khoảng trắng), vector hóa:
+    H[i] = P^i * cumsum(c_j * P^-j) nên hash(a..b) = H[b] - H[a-1] * P^(b-a+1) (mod 2^64)
+    Trả về (hash, doc id) theo thứ tự xuất hiện
+    """
+    n = len(codes)
+    if n == 0:
+        empty = np.empty(0, dtype=np.uint64)
+        return empty, empty.astype(np.int64)
+    pow_p = _powers(_P, n + 1)
+    prefix = np.zeros(n + 1, dtype=np.uint64)
+    prefix[1:] = pow_p[1:] * np.cumsum(codes.astype(np.uint64) * _powers(_P_INV, n + 1)[1:], dtype=np.uint64)
+    is_word = codes != _SPACE
+    edges = np.diff(np.concatenate([[False], is_word, [False]]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    hashes = prefix[ends] - prefix[starts] * pow_p[ends - starts]
+    return hashes, docs[starts]
+
+
+def _encode(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chuẩn hóa cả lô văn bản trực tiếp trên mảng code point (lower + NFD, bỏ dấu, đ -> d,
+    khoảng trắng -> ' ', thêm khoảng trắng hai đầu) và trả về kèm doc id cho từng ký tự.
+    Tương đương normalize_text nhưng không chạy regex trên từng ký tự
+    """
+    joined = "\x00".join(f" {t.replace(chr(0), ' ')} " for t in texts)
+    decomposed = unicodedata.normalize("NFD", joined.lower())
+    codes = np.frombuffer(decomposed.encode("utf-32-le"), dtype=np.uint32)
+    codes = codes[(codes < 0x300) | (codes > 0x36f)]
+    codes = np.where(codes == ord("đ"), ord("d"), codes)
+    codes = np.where(np.isin(codes, _WHITESPACE_CODES), _SPACE, codes).astype(np.uint32)
+    is_separator = codes == 0
+    docs = np.cumsum(is_separator)
+    return codes[~is_separator], docs[~is_separator]
+
+
+def _doc_features(codes: np.ndarray, docs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cặp (doc, feature, số lần xuất hiện) cho từ đơn và cặp từ liên tiếp trong cùng văn bản
+    """
+    words, word_docs = _word_hashes(codes, docs)
+    same_doc = word_docs[:-1] == word_docs[1:]
+    bigrams = (words[:-1] * _BIGRAM + words[1:])[same_doc]
+    features = (np.concatenate([words, bigrams]) % np.uint64(N_FEATURES)).astype(np.int64)
+    feature_docs = np.concatenate([word_docs, word_docs[:-1][same_doc]])
+    pairs, counts = np.unique(feature_docs * N_FEATURES + features, return_counts=True)
+    return pairs // N_FEATURES, pairs % N_FEATURES, counts
+
+
+class SemanticIndex:
+    """
+    Tìm kiếm ngữ nghĩa offline: vector TF-IDF trên từ và cặp từ (đã bỏ dấu) của
+    product_name + description, lưu dạng inverted index (CSC) bằng NumPy.
+    Truy vấn = cosine top-k, chạy hoàn toàn trong process
+    """
+
+    def __init__(self, texts: List[str], max_df: float = 0.2, query_cache_size: int = 32,
+                 chunk_size: int = 20000) -> None:
+        self.size = len(texts)
+        # Dựng theo lô để mảng trung gian (một phần tử mỗi ký tự) không phình theo cả catalog
+        parts = []
+        for start in range(0, self.size, chunk_size):
+            codes, docs = _encode(texts[start:start + chunk_size])
+            doc_ids, features, counts = _doc_features(codes, docs)
+            parts.append((doc_ids + start, features, counts.astype(np.int32)))
+        if parts:
+            doc_ids, features, counts = (np.concatenate(p) for p in zip(*parts))
+        else:
+            doc_ids = features = counts = np.empty(0, dtype=np.int64)
+
+        df = np.bincount(features, minlength=N_FEATURES)
+        self.idf = (np.log((self.size + 1) / (df + 1)) + 1.0).astype(np.float32)
+        # Từ xuất hiện ở quá nhiều sản phẩm gần như không phân biệt được sản phẩm
+        # nhưng chiếm phần lớn bộ nhớ và thời gian truy vấn -> bỏ
+        keep = df[features] <= max(max_df * self.size, 1)
+        doc_ids, features, counts = doc_ids[keep], features[keep], counts[keep]
+
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self.idf[features]
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights.astype(np.float64) ** 2, minlength=self.size))
+        weights /= np.maximum(norms[doc_ids], 1e-12).astype(np.float32)
+
+        order = np.argsort(features.astype(np.int32))
+        self.indices = doc_ids[order].astype(np.int32)
+        self.data = weights[order]
+        self.indptr = np.zeros(N_FEATURES + 1, dtype=np.int64)
+        np.cumsum(np.bincount(features, minlength=N_FEATURES), out=self.indptr[1:])
+
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._lock = threading.Lock()
+
+    def resized(self, size: int) -> "SemanticIndex":
+        """
+        Dùng chung vector với chỉ mục này cho catalog có thêm sản phẩm ở cuối (cập nhật qua PATCH /catalog):
+        sản phẩm mới có độ liên quan 0 tới lần dựng lại kế tiếp
+        """
+        new = copy.copy(self)
+        new.size = max(size, self.size)
+        new._query_cache = OrderedDict()
+        new._lock = threading.Lock()
+        return new
+
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.data.nbytes + self.indptr.nbytes + self.idf.nbytes
+
+    def _query_vector(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        codes, docs = _encode([query])
+        _, features, counts = _doc_features(codes, docs)
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self.idf[features]
+        norm = float(np.sqrt(np.sum(weights.astype(np.float64) ** 2)))
+        return features, weights / max(norm, 1e-12)
+
+    def similarity(self, query: str) -> np.ndarray:
+        """
+        Cosine giữa truy vấn và mọi sản phẩm (mảng theo vị trí trong catalog), có cache theo truy vấn
+        """
+        key = normalize_text(query)
+        with self._lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                return cached
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        features, weights = self._query_vector(query)
+        for feature, weight in zip(features, weights):
+            lo, hi = self.indptr[feature], self.indptr[feature + 1]
+            if hi > lo:
+                # Mỗi doc chỉ xuất hiện một lần trong một posting list nên cộng trực tiếp được
+                scores[self.indices[lo:hi]] += weight * self.data[lo:hi]
+
+        with self._lock:
+            self._query_cache[key] = scores
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return scores
+
+    def search(self, query: str, k: int = 20, positions: Optional[np.ndarray] = None,
+               min_score: float = MIN_SCORE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k vị trí theo cosine (tùy chọn giới hạn trong tập positions)
+        """
+        scores = self.similarity(query)
+        candidates = np.arange(self.size) if positions is None else positions
+        candidate_scores = scores[candidates]
+        mask = candidate_scores >= min_score
+        candidates, candidate_scores = candidates[mask], candidate_scores[mask]
+        if len(candidates) > k:
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+            candidates, candidate_scores = candidates[top], candidate_scores[top]
+        order = np.argsort(-candidate_scores, kind='stable')
+        return candidates[order], candidate_scores[order]
+
+    def restrict(self, query: str, positions: np.ndarray, min_score: float = MIN_SCORE) -> np.ndarray:
+        """
+        Giữ các vị trí liên quan tới truy vấn (giữ nguyên thứ tự); rỗng nếu không có
+        """
+        return positions[self.similarity(query)[positions] >= min_score]
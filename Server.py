@@ -0,0 +1,180 @@
+"""
+Launcher production (pre-fork): nạp catalog + chỉ mục một lần ở process cha rồi fork N worker uvicorn
+dùng chung bộ nhớ đó theo copy-on-write, cùng nghe trên một socket.
+
+    python Server.py --workers 4 --port 8000
+
+- Session và cache kết quả nằm trong SQLite cục bộ (SESSION_DB, RESULT_CACHE_DB) để mọi worker thấy chung
+- Process cha theo dõi database.csv; khi đổi thì nạp lại một lần rồi thay lần lượt từng worker
+- Worker chết được fork lại
+Chỉ chạy trên hệ POSIX (os.fork).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+RESPAWN_DELAY = 1.0
+
+
+class PreforkServer:
+    def __init__(self, host: str, port: int, workers: int, log_level: str = "info") -> None:
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.log_level = log_level
+        self.children: Dict[int, float] = {}  # pid -> thời điểm fork
+        self.stopping = False
+        self.sock = None
+        self.app = None
+        self.manager = None
+
+    def preload(self):
+        # Chỉ mục ngữ nghĩa dựng đồng bộ để worker fork ra dùng chung; state dùng chung qua SQLite
+        os.environ.setdefault("SEMANTIC_BACKGROUND", "0")
+        os.environ.setdefault("SESSION_BACKEND", "sqlite")
+        os.environ.setdefault("RESULT_CACHE_BACKEND", "sqlite")
+        started = time.perf_counter()
+        import API
+        self.app = API.app
+        self.manager = API.analysis_manager
+        # Worker không chạy watcher riêng (mỗi worker nạp lại sẽ mất phần bộ nhớ dùng chung)
+        self.manager.watch_catalog = False
+        print(f"Preloaded catalog: {self.manager.index.size} products "
+              f"in {time.perf_counter() - started:.2f} s")
+
+    def bind(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+
+    def spawn(self) -> int:
+        # Đưa các object đã nạp vào vùng "permanent" của GC để GC ở worker không ghi lên trang nhớ chung
+        gc.collect()
+        gc.freeze()
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+        code = 0
+        try:
+            self._run_worker()
+        except BaseException as e:
+            print(f"Worker {os.getpid()} crashed: {e!r}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _run_worker(self):
+        import uvicorn
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        config = uvicorn.Config(self.app, log_level=self.log_level, access_log=False, lifespan="on")
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            if started is not None and not self.stopping:
+                print(f"Worker {pid} exited with status {status}, respawning")
+                if time.monotonic() - started < RESPAWN_DELAY:
+                    # Worker chết ngay khi khởi động: tránh vòng fork liên tục
+                    time.sleep(RESPAWN_DELAY)
+                self.spawn()
+
+    def _wait_exit(self, pid: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            time.sleep(0.05)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+    def rolling_restart(self):
+        """
+        Thay từng worker cũ bằng worker fork từ snapshot mới; luôn giữ đủ số worker đang nhận request
+        """
+        for pid in list(self.children):
+            self.spawn()
+            self.children.pop(pid, None)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            self._wait_exit(pid, GRACEFUL_TIMEOUT)
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def run(self):
+        self.preload()
+        from AnalysisManager import CATALOG_POLL_INTERVAL, DATABASE
+        from CatalogWatcher import CatalogWatcher
+
+        self.bind()
+        print(f"Listening on http://{self.host}:{self.port} with {self.workers} workers")
+        for _ in range(self.workers):
+            self.spawn()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        watcher = None
+        if CATALOG_POLL_INTERVAL > 0:
+            # Poll ngay trong vòng giám sát (không dùng thread): fork từ process nhiều thread không an toàn
+            watcher = CatalogWatcher(DATABASE, self.manager.reload_data, CATALOG_POLL_INTERVAL,
+                                     self.manager.snapshot.source_stat)
+        next_poll = time.monotonic() + CATALOG_POLL_INTERVAL
+        while not self.stopping:
+            time.sleep(0.2)
+            self.reap()
+            if watcher is not None and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + CATALOG_POLL_INTERVAL
+                if watcher.poll():
+                    self.rolling_restart()
+
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.children):
+            self._wait_exit(pid, GRACEFUL_TIMEOUT)
+        self.children.clear()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        sys.exit("Server.py requires os.fork (Linux/macOS); use `uvicorn API:app` instead.")
+    PreforkServer(args.host, args.port, args.workers, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+
+class Session:
+    __slots__ = ('session_id', 'history', 'system_context', 'last_access')
+
+    def __init__(self, session_id: Optional[str] = None, max_history: int = 20) -> None:
+        self.session_id = session_id or str(uuid.uuid4())
+        # Ring buffer: chỉ giữ max_history lượt hội thoại gần nhất
+        self.history: deque = deque(maxlen=max_history)
+        self.system_context = ""
+        self.last_access = time.time()
+
+    def add_session(self, role: str, content: str):
+        self.history.append({'role': role, 'content': content})
+
+    def get_context_history(self, max_history: int = 20) -> List[Dict]:
+        recent = list(self.history)[-max_history:]
+        if self.system_context:
+            return [{'role': 'system', 'content': self.system_context}] + recent
+        return recent
+
+    def set_system_context(self, context: str):
+        self.system_context = context
+
+    def touch(self):
+        self.last_access = time.time()
+
+    def memory_usage(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.history) + sys.getsizeof(self.system_context)
+        for entry in self.history:
+            size += sys.getsizeof(entry) + sum(sys.getsizeof(v) for v in entry.values())
+        return size
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'session_id': self.session_id,
+            'history': list(self.history),
+            'system_context': self.system_context,
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str, max_history: int = 20) -> "Session":
+        payload = json.loads(raw)
+        session = cls(payload['session_id'], max_history=max_history)
+        session.history.extend(payload.get('history', []))
+        session.system_context = payload.get('system_context', "")
+        return session
+
+
+class SessionBackend:
+    """
+    Interface lưu session; AnalysisManager chỉ dùng get/put/delete/stats
+    """
+
+    def __init__(self, max_entries: int = 10000, idle_ttl: float = 1800.0, max_history: int = 20) -> None:
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.max_history = max_history
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        raise NotImplementedError
+
+    def put(self, session: Session):
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def memory_usage(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "idle_ttl": self.idle_ttl,
+            "max_history": self.max_history,
+            "evictions": self.evictions,
+            "memory_bytes": self.memory_usage(),
+        }
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    Lưu session trong RAM của worker, giới hạn số lượng (LRU) và thời gian rảnh (TTL)
+    """
+
+    def __init__(self, max_entries: int = 10000, idle_ttl: float = 1800.0, max_history: int = 20) -> None:
+        super().__init__(max_entries, idle_ttl, max_history)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float):
+        # Session cũ nhất nằm đầu OrderedDict nên dừng ngay khi gặp session còn hạn
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            now = time.time()
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def put(self, session: Session):
+        with self._lock:
+            session.touch()
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            self._evict_expired(session.last_access)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sys.getsizeof(self._sessions) + sum(s.memory_usage() for s in self._sessions.values())
+
+
+class SqliteSessionBackend(SessionBackend):
+    """
+    Lưu session trong file SQLite cục bộ, dùng chung giữa các worker uvicorn
+    """
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str, max_entries: int = 10000, idle_ttl: float = 1800.0, max_history: int = 20) -> None:
+        super().__init__(max_entries, idle_ttl, max_history)
+        self.path = path
+        self._local = threading.local()
+        self._puts = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # Mỗi thread/process một connection; WAL cho phép nhiều worker đọc ghi đồng thời
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.idle_ttl,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            "SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT data, last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.idle_ttl:
+            self.delete(session_id)
+            self.evictions += 1
+            return None
+        conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return Session.from_json(row[0], max_history=self.max_history)
+
+    def put(self, session: Session):
+        conn = self._connect()
+        session.touch()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, last_access) VALUES (?, ?, ?)",
+            (session.session_id, session.to_json(), session.last_access),
+        )
+        # Dọn session hết hạn/quá số lượng theo lô để put không tốn O(n) mỗi lần
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self._evict(conn, session.last_access)
+
+    def delete(self, session_id: str) -> bool:
+        conn = self._connect()
+        return conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def memory_usage(self) -> int:
+        conn = self._connect()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+
+def create_session_backend(kind: str = "memory", path: str = "sessions.db", max_entries: int = 10000,
+                           idle_ttl: float = 1800.0, max_history: int = 20) -> SessionBackend:
+    if kind == "sqlite":
+        return SqliteSessionBackend(path, max_entries=max_entries, idle_ttl=idle_ttl, max_history=max_history)
+    if kind == "memory":
+        return MemorySessionBackend(max_entries=max_entries, idle_ttl=idle_ttl, max_history=max_history)
+    raise ValueError(f"Unknown session backend: {kind}")
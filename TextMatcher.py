@@ -0,0 +1,203 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+# Dấu tiếng Việt sau khi tách NFD đều nằm trong khối Combining Diacritical Marks
+_COMBINING = re.compile("[\u0300-\u036f]")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hóa để so khớp không phân biệt dấu: 'Áo Khoác' -> 'ao khoac'
+    """
+    text = _COMBINING.sub("", unicodedata.normalize("NFD", text.lower()))
+    text = text.replace("đ", "d")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def fold_text(text: str) -> Tuple[str, str]:
+    """
+    Như normalize_text, kèm ký tự gốc (chữ thường, còn dấu) của từng ký tự trong kết quả
+    để so lại dấu của đoạn đã khớp: 'Vợ' -> ('vo', 'vợ')
+    """
+    written = unicodedata.normalize("NFC", text.lower())
+    plain = normalize_text(written)
+    if len(plain) == len(written):
+        return plain, written
+    # Có khoảng trắng bị gộp/cắt: dựng lại từng ký tự
+    chars: List[str] = []
+    sources: List[str] = []
+    for source in written:
+        for ch in _COMBINING.sub("", unicodedata.normalize("NFD", source)).replace("đ", "d"):
+            if ch.isspace():
+                if not chars or chars[-1] == " ":
+                    continue
+                ch = source = " "
+            chars.append(ch)
+            sources.append(source)
+    if chars and chars[-1] == " ":
+        chars.pop()
+        sources.pop()
+    return "".join(chars), "".join(sources)
+
+
+def _accents_agree(written: str, key: str, plain: str) -> bool:
+    # Mỗi chữ viết đúng dấu của khóa hoặc không dấu ('khoac' khớp 'khoác', 'vợ' không khớp 'vớ')
+    return all(w == k or w == p or p == " " for w, k, p in zip(written, key, plain))
+
+
+def _is_boundary(text: str, i: int) -> bool:
+    return i < 0 or i >= len(text) or not text[i].isalnum()
+
+
+class PhraseMatcher:
+    """
+    Bộ so khớp cụm từ dựng một lần (Aho-Corasick trên khóa đã bỏ dấu):
+    - match(): khóa dài nhất xuất hiện trọn từ trong text (longest-match-wins)
+    - prefix(): text là phần đầu của một từ/cụm trong khóa (ví dụ 'sơ mi' -> 'áo sơ mi')
+    Đoạn khớp sau khi bỏ dấu còn phải khớp dấu với khóa ở những chữ có viết dấu: 'vợ' không khớp 'vớ',
+    'bà' chọn khóa 'bà' chứ không phải 'ba'. Text không dấu trùng nhiều khóa thì khóa khai báo trước được giữ
+    """
+
+    def __init__(self, mapping: Dict[str, str], min_prefix: int = 2) -> None:
+        self.min_prefix = min_prefix
+        self.exact: Dict[str, str] = {}
+        for key, value in mapping.items():
+            self.exact.setdefault(key.lower().strip(), value)
+        self.normalized: Dict[str, str] = {}
+        # Các khóa (dạng có dấu, giá trị) cùng dạng bỏ dấu, theo thứ tự khai báo
+        self.variants: Dict[str, List[Tuple[str, str]]] = {}
+        for key, value in mapping.items():
+            plain, sources = fold_text(key)
+            self.normalized.setdefault(plain, value)
+            self.variants.setdefault(plain, []).append((sources, value))
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]  # (độ dài, khóa đã bỏ dấu) kết thúc tại node
+        for key in self.normalized:
+            self._insert(key)
+        self._build_links()
+
+        self._prefix_goto: List[Dict[str, int]] = [{}]
+        self._prefix_value: List[Optional[str]] = [None]
+        for key, value in self.normalized.items():
+            for start in self._word_starts(key):
+                self._insert_prefix(key[start:], value)
+
+    def __len__(self) -> int:
+        return len(self.normalized)
+
+    @staticmethod
+    def _word_starts(key: str) -> Iterable[int]:
+        yield 0
+        for i, ch in enumerate(key):
+            if ch == " ":
+                yield i + 1
+
+    def _insert(self, key: str):
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(key), key))
+
+    def _build_links(self):
+        # BFS: fail link trỏ tới hậu tố dài nhất cũng là tiền tố của một khóa
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        for outputs in self._out:
+            outputs.sort(key=lambda item: -item[0])
+
+    def _insert_prefix(self, key: str, value: str):
+        node = 0
+        for ch in key:
+            nxt = self._prefix_goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._prefix_goto)
+                self._prefix_goto[node][ch] = nxt
+                self._prefix_goto.append({})
+                self._prefix_value.append(value)
+            node = nxt
+
+    def _pick(self, key: str, written: str) -> Optional[str]:
+        """
+        Giá trị của khóa (đã bỏ dấu) cho đoạn text gốc: khóa trùng dấu trước, rồi khóa đầu tiên hợp dấu
+        """
+        variants = self.variants[key]
+        for sources, value in variants:
+            if sources == written:
+                return value
+        for sources, value in variants:
+            if _accents_agree(written, sources, key):
+                return value
+        return None
+
+    def lookup(self, text: str) -> Optional[str]:
+        """
+        Khớp nguyên văn (có dấu trước, rồi bỏ dấu)
+        """
+        value = self.exact.get(text.lower().strip())
+        if value is None:
+            plain, written = fold_text(text)
+            if plain in self.variants:
+                value = self._pick(plain, written)
+        return value
+
+    def match(self, text: str) -> Optional[str]:
+        text, written = fold_text(text)
+        best: Optional[Tuple[int, int, str]] = None  # (length, -start, value)
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node] or not _is_boundary(text, i + 1):
+                continue
+            for length, key in out[node]:
+                start = i - length + 1
+                if not _is_boundary(text, start - 1):
+                    continue
+                value = self._pick(key, written[start:i + 1])
+                if value is not None:
+                    candidate = (length, -start, value)
+                    if best is None or candidate[:2] > best[:2]:
+                        best = candidate
+                    break
+        return best[2] if best else None
+
+    def prefix(self, text: str) -> Optional[str]:
+        text = normalize_text(text)
+        if len(text) < self.min_prefix:
+            return None
+        node = 0
+        for ch in text:
+            node = self._prefix_goto[node].get(ch)
+            if node is None:
+                return None
+        return self._prefix_value[node]
+
+    def resolve(self, text: str) -> Optional[str]:
+        """
+        Thứ tự: khớp nguyên văn -> cụm dài nhất trong text -> text là phần đầu của một khóa
+        """
+        return self.lookup(text) or self.match(text) or self.prefix(text)
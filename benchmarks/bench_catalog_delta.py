@@ -0,0 +1,75 @@
+"""
+So sánh áp dụng thay đổi catalog theo phần thay đổi (ProductIndex.apply) với dựng lại chỉ mục từ đầu.
+
+    python benchmarks/bench_catalog_delta.py --rows 500000 --batches 1,100,1000
+
+Mỗi lô gồm cập nhật giá/tồn kho, một ít sản phẩm mới và sản phẩm bị xóa. In kết quả dạng JSON (ms).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CatalogChanges import apply_to_frame, coalesce, parse_entry, resolve  # noqa: E402
+from ProductIndex import ProductIndex  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+
+def changes(data, size: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(data["product_id"].to_numpy(), size=size, replace=False)
+    entries = []
+    for i, product_id in enumerate(ids.tolist()):
+        if i % 10 == 9:
+            entries.append({"op": "delete", "product_id": product_id})
+        else:
+            entries.append({"op": "upsert", "product": {
+                "product_id": product_id, "price": int(rng.integers(69, 8000)) * 1000, "stock": int(rng.integers(0, 50))}})
+    new_id = int(data["product_id"].max()) + 1
+    for i in range(max(size // 20, 1)):
+        entries.append({"op": "upsert", "product": {
+            "product_id": new_id + i, "category": "watch", "product_name": f"New #{i}", "brand": "Casio",
+            "price": 990000, "stock": 3, "sex": "unisex", "rating": 4.5}})
+    return [parse_entry(entry) for entry in entries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--batches", default="1,100,1000")
+    args = parser.parse_args()
+
+    data = synthetic_catalog(args.rows)
+    started = time.perf_counter()
+    index = ProductIndex(data)
+    result = {"rows": args.rows, "full_build_ms": round((time.perf_counter() - started) * 1000, 1), "delta": {}}
+
+    for size in [int(s) for s in args.batches.split(",") if s.strip()]:
+        entries = changes(data, size, seed=size)
+        started = time.perf_counter()
+        rows, _ = resolve(index, coalesce(entries))
+        resolved = time.perf_counter()
+        updated = index.apply(rows)
+        applied = time.perf_counter()
+        rebuilt, _ = apply_to_frame(data, entries)
+        replayed = time.perf_counter()
+        fresh = ProductIndex(rebuilt)
+        rebuilt_at = time.perf_counter()
+        assert updated.count == fresh.size
+        result["delta"][size] = {
+            "rows_changed": len(rows),
+            "resolve_ms": round((resolved - started) * 1000, 2),
+            "apply_ms": round((applied - resolved) * 1000, 2),
+            "replay_frame_ms": round((replayed - applied) * 1000, 2),
+            "rebuild_ms": round((rebuilt_at - replayed) * 1000, 1),
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+So sánh cold start giữa CSV và bundle nhị phân memory-map.
+
+    python benchmarks/bench_catalog_load.py --rows 300000 --workers 4
+
+Mỗi lần đo chạy trong một process mới (giống một worker uvicorn vừa khởi động)
+và in kết quả dạng JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CatalogStore import build_binary_catalog  # noqa: E402
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+if {mode!r} == "csv":
+    import pandas as pd
+    data = pd.read_csv({csv!r})
+else:
+    from CatalogStore import load_binary_catalog
+    data = load_binary_catalog({bundle!r})
+loaded = time.perf_counter()
+from ProductIndex import ProductIndex
+ProductIndex(data)
+indexed = time.perf_counter()
+
+def smaps():
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            return {{line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[-1] == "kB"}}
+    except OSError:
+        return {{}}
+
+mem = smaps()
+print(json.dumps({{
+    "load_ms": (loaded - started) * 1000,
+    "load_and_index_ms": (indexed - started) * 1000,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "rss_kb": mem.get("Rss"),
+    "pss_kb": mem.get("Pss"),
+    "shared_kb": (mem.get("Shared_Clean", 0) + mem.get("Shared_Dirty", 0)) or None,
+}}))
+"""
+
+
+def synthetic_csv(path: str, rows: int):
+    base = pd.read_csv(os.path.join(ROOT, "database.csv"))
+    repeats = int(np.ceil(rows / len(base)))
+    data = pd.concat([base] * repeats, ignore_index=True).iloc[:rows].copy()
+    data["product_id"] = np.arange(1, rows + 1)
+    # Tên và link duy nhất như catalog thật, tránh việc parser CSV gộp chuỗi trùng
+    suffix = " #" + data["product_id"].astype(str)
+    data["product_name"] = data["product_name"] + suffix
+    data["image_url"] = data["image_url"] + "&sku=" + data["product_id"].astype(str)
+    data.to_csv(path, index=False)
+
+
+def run_child(mode: str, csv: str, bundle: str) -> dict:
+    code = CHILD.format(root=ROOT, mode=mode, csv=csv, bundle=bundle)
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run_concurrent(mode: str, csv: str, bundle: str, workers: int) -> list:
+    # Nhiều worker cùng lúc để thấy PSS giảm khi các page mmap được chia sẻ
+    code = CHILD.format(root=ROOT, mode=mode, csv=csv, bundle=bundle).replace(
+        "print(json.dumps(", "import time as _t; _t.sleep(1.0); print(json.dumps(")
+    procs = [subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+    return [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+
+
+def summarize(samples: list) -> dict:
+    keys = samples[0].keys()
+    return {k: round(float(np.median([s[k] for s in samples if s[k] is not None])), 2)
+            for k in keys if any(s[k] is not None for s in samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv = os.path.join(tmp, "catalog.csv")
+        bundle = os.path.join(tmp, "catalog.bin")
+        synthetic_csv(csv, args.rows)
+        started = time.perf_counter()
+        build_binary_catalog(csv, bundle)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        result = {"rows": args.rows, "build_ms": round(build_ms, 2)}
+        for mode in ("csv", "binary"):
+            result[mode] = {
+                "cold_start": summarize([run_child(mode, csv, bundle) for _ in range(args.repeat)]),
+                f"concurrent_{args.workers}_workers": summarize(run_concurrent(mode, csv, bundle, args.workers)),
+            }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
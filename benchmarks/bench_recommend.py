@@ -0,0 +1,311 @@
+"""
+Benchmark luồng gợi ý sản phẩm trên catalog giả lập 1k / 100k / 1M dòng.
+
+    python benchmarks/bench_recommend.py --sizes 1000,100000,1000000 --output bench.json
+    python benchmarks/bench_recommend.py --sizes 100000 --compare bench.json
+
+Mỗi kích thước chạy trong một process mới (cwd là thư mục tạm chứa database.csv giả lập) và đo:
+- micro: _rule_based_filtering_from_database, search_products / page_products (cache lạnh và nóng),
+  nhánh câu hỏi dạng chuỗi qua LLM stub (benchmarks/llm_stub.py) và qua backend local trong process
+- end-to-end: POST /products qua ASGI client trong process (httpx.ASGITransport),
+  throughput và p50/p95/p99
+Kết quả in ra dạng JSON (kèm commit, phiên bản thư viện) để so sánh giữa các commit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from synthetic import gift_prompts, write_catalog  # noqa: E402
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {"count": 0}
+    values = np.asarray(samples_ms)
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4),
+        "max_ms": round(float(values.max()), 4),
+    }
+
+
+def measure(fn: Callable, items: list) -> Dict[str, float]:
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+async def measure_async(fn, items: list) -> Dict[str, float]:
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        await fn(item)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+async def load_test(app, path: str, payloads: List[dict], requests: int, concurrency: int,
+                    max_seconds: float) -> dict:
+    """
+    `concurrency` client đồng thời gửi POST liên tục tới khi đủ `requests` hoặc hết `max_seconds`
+    """
+    import httpx
+
+    samples: List[float] = []
+    statuses: Dict[str, int] = {}
+    body_statuses: Dict[str, int] = {}
+    response_bytes = 0
+    counter = iter(range(requests))
+    deadline = time.perf_counter() + max_seconds
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=None) as client:
+        async def worker():
+            nonlocal response_bytes
+            for i in counter:
+                if time.perf_counter() > deadline:
+                    return
+                started = time.perf_counter()
+                response = await client.post(path, json=payloads[i % len(payloads)])
+                samples.append((time.perf_counter() - started) * 1000)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+                response_bytes += len(response.content)
+                if response.headers.get("content-type", "").startswith("application/json"):
+                    status = str(response.json().get("status"))
+                    body_statuses[status] = body_statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = percentiles(samples)
+    result.update({
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "avg_response_kb": round(response_bytes / max(len(samples), 1) / 1024, 2),
+        "http_status": statuses,
+        "body_status": body_statuses,
+    })
+    return result
+
+
+def run_child(args) -> dict:
+    """
+    Chạy trong thư mục tạm chứa database.csv giả lập; AnalysisManager đọc file theo đường dẫn tương đối
+    """
+    from llm_stub import LLMStub
+
+    stub = LLMStub(latency=args.llm_latency_ms / 1000, seed=args.seed).start()
+    os.environ.update({
+        "MODEL_BACKEND": "remote",
+        "HF_API_URL": stub.url,
+        "CATALOG_POLL_INTERVAL": "0",
+        "CATALOG_BINARY": "",
+        "SESSION_BACKEND": "memory",
+    })
+    os.environ.pop("HUGGINGFACE_API_TOKEN", None)
+
+    started = time.perf_counter()
+    import API
+    startup_s = time.perf_counter() - started
+    manager = API.analysis_manager
+
+    # Chờ chỉ mục ngữ nghĩa (dựng ở thread nền) để đo đúng trạng thái ổn định
+    semantic_wait = time.perf_counter()
+    while manager.index.semantic is None and manager.snapshot.semantic_error is None:
+        if time.perf_counter() - semantic_wait > args.semantic_timeout:
+            break
+        time.sleep(0.05)
+
+    prompts = gift_prompts(args.prompts, seed=args.seed)
+    filters = [manager._rule_based_filtering_from_database(p) for p in prompts]
+    unique_filters = list({json.dumps(f, sort_keys=True, ensure_ascii=False): f for f in filters}.values())
+
+    def cold(fn):
+        def call(filter_dict):
+            manager.cache.clear()
+            fn(filter_dict)
+        return call
+
+    micro = {
+        "rule_based_filtering": measure(manager._rule_based_filtering_from_database, prompts),
+        "search_products_cold": measure(cold(manager.search_products), unique_filters),
+        "search_products_warm": measure(manager.search_products, filters),
+        "page_products_cold": measure(cold(lambda f: manager.page_products(f, limit=20)), unique_filters),
+        "page_products_warm": measure(lambda f: manager.page_products(f, limit=20), filters),
+        "avg_matches": round(float(np.mean([len(manager.index.match(f)) for f in unique_filters])), 1),
+    }
+
+    questions = [f"quà {p['occasion']} cho {p['gift_recipient']} thích {p['Preferences'] or 'đồ đẹp'}"
+                 for p in prompts[:args.llm_questions]]
+    manager.cache.clear()
+    micro["string_question_llm_stub"] = asyncio.run(
+        measure_async(lambda q: manager._model_response(q), questions)
+    )
+    micro["llm_stub_requests"] = stub.requests
+
+    # Cùng câu hỏi qua backend chạy trong process (không round trip mạng)
+    from AnalysisManager import PROMPT_TEMPLATE, budget_price_range
+    from ModelBackend import create_model_backend
+    remote, manager.model = manager.model, create_model_backend(
+        "local", prompt_path=PROMPT_TEMPLATE, price_range=budget_price_range)
+    manager.cache.clear()
+    micro["string_question_local"] = asyncio.run(
+        measure_async(lambda q: manager._model_response(q), questions)
+    )
+    manager.model = remote
+
+    end_to_end = {}
+    for name, path in (("products_paginated", "/products?limit=20"), ("products_legacy", "/products")):
+        manager.cache.clear()
+        asyncio.run(load_test(API.app, path, prompts, min(len(prompts), 50), 4, args.max_seconds))  # warm-up
+        end_to_end[name] = asyncio.run(
+            load_test(API.app, path, prompts, args.requests, args.concurrency, args.max_seconds)
+        )
+
+    stub.stop()
+    return {
+        "rows": manager.index.size,
+        "startup_s": round(startup_s, 3),
+        "semantic_index_s": round(manager.snapshot.semantic_duration or 0.0, 3),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "unique_filters": len(unique_filters),
+        "micro": micro,
+        "end_to_end": end_to_end,
+    }
+
+
+def environment() -> dict:
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def flatten(data, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict) -> Dict[str, dict]:
+    """
+    So sánh các chỉ số thời gian/throughput với lần chạy trước (ratio > 1 nghĩa là chậm hơn)
+    """
+    old, new = flatten(baseline.get("results", {})), flatten(current.get("results", {}))
+    diff = {}
+    for name, value in new.items():
+        if name not in old or not (name.endswith("_ms") or name.endswith("_rps") or name.endswith("_s")):
+            continue
+        before = old[name]
+        if not before:
+            continue
+        ratio = value / before
+        if name.endswith("_rps"):
+            ratio = before / value if value else float("inf")
+        diff[name] = {"before": before, "after": value, "slowdown": round(ratio, 3)}
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Số dòng catalog, phân tách bằng dấu phẩy")
+    parser.add_argument("--prompts", type=int, default=2000, help="Số GiftPrompt giả lập")
+    parser.add_argument("--requests", type=int, default=2000, help="Số request mỗi kịch bản end-to-end")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-seconds", type=float, default=30, help="Giới hạn thời gian mỗi kịch bản end-to-end")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-questions", type=int, default=50)
+    parser.add_argument("--semantic-timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Ghi JSON kết quả vào file")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    report = {"environment": environment(), "config": vars(args).copy(), "results": {}}
+    for key in ("child", "rows", "output", "compare"):
+        report["config"].pop(key, None)
+
+    for rows in (int(s) for s in args.sizes.split(",") if s.strip()):
+        workdir = tempfile.mkdtemp(prefix=f"what2gift-bench-{rows}-")
+        try:
+            generated = time.perf_counter()
+            write_catalog(os.path.join(workdir, "database.csv"), rows, args.seed)
+            # Cùng các file cấu hình server cần cạnh catalog (taxonomy thiếu -> bảng gợi ý bị tắt)
+            for name in ("huggingface_prompt.txt", "gift_taxonomy.json"):
+                shutil.copy(os.path.join(ROOT, name), workdir)
+            print(f"[{rows}] catalog generated in {time.perf_counter() - generated:.1f} s", file=sys.stderr)
+
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--rows", str(rows)]
+            for key in ("prompts", "requests", "concurrency", "max_seconds", "llm_latency_ms", "llm_questions",
+                        "semantic_timeout", "seed"):
+                cmd += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join([ROOT, BENCH_DIR])}
+            proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                report["results"][str(rows)] = {"error": proc.stderr.strip().splitlines()[-1:]}
+                continue
+            report["results"][str(rows)] = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"[{rows}] done", file=sys.stderr)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(json.load(f), report)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+CPU cho phần serialize response /products: đường cũ (records dict -> validate response_model=Dict ->
+jsonable_encoder -> json chuẩn) so với đường mới (JSON bytes đã encode sẵn + orjson cho envelope).
+
+    python benchmarks/bench_serialization.py --rows 100000 --sizes 50,500
+
+Kèm end-to-end POST /products?limit=N qua ASGI client (CPU process mỗi request). In kết quả dạng JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import gift_prompts, write_catalog  # noqa: E402
+
+
+def cpu_per_call(fn, repeat: int) -> float:
+    fn()
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return round((time.process_time() - started) / repeat * 1000, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sizes", default="50,500")
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="what2gift-serialize-")
+    write_catalog(os.path.join(workdir, "database.csv"), args.rows)
+    shutil.copy(os.path.join(ROOT, "huggingface_prompt.txt"), workdir)
+    os.chdir(workdir)
+    os.environ.update({"CATALOG_POLL_INTERVAL": "0", "CATALOG_BINARY": "", "SEMANTIC_SEARCH": "0",
+                       "METRICS_ENABLED": "0", "HF_API_URL": "http://127.0.0.1:9/models/gpt2"})
+    os.environ.pop("HUGGINGFACE_API_TOKEN", None)
+
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    from typing import Dict
+    import API
+    from JsonCodec import dumps_with_fragment, orjson
+
+    manager = API.analysis_manager
+    index = manager.index
+    prompt = gift_prompts(1)[0]
+    response_model = TypeAdapter(Dict)
+
+    result = {"rows": args.rows, "orjson": orjson is not None, "sizes": {}}
+    for size in (int(s) for s in args.sizes.split(",")):
+        positions = index.top(index.match({}), size)
+        envelope = {"status": "success", "prompt": prompt, "session_id": "x", "total_products": size}
+
+        def legacy():
+            payload = dict(envelope, products=index.take(positions))
+            validated = response_model.validate_python(payload)
+            return JSONResponse(jsonable_encoder(validated)).body
+
+        def lean():
+            return dumps_with_fragment(envelope, "products", index.take_json(positions))
+
+        assert json.loads(legacy()) == json.loads(lean())
+        old_ms, new_ms = cpu_per_call(legacy, args.repeat), cpu_per_call(lean, args.repeat)
+
+        async def end_to_end():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=API.app), base_url="http://bench") as client:
+                path = f"/products?limit={size}"
+                await client.post(path, json=prompt)
+                started = time.process_time()
+                for _ in range(args.repeat):
+                    await client.post(path, json=prompt)
+                return round((time.process_time() - started) / args.repeat * 1000, 4)
+
+        result["sizes"][str(size)] = {
+            "response_kb": round(len(lean()) / 1024, 1),
+            "serialize_legacy_cpu_ms": old_ms,
+            "serialize_lean_cpu_ms": new_ms,
+            "reduction": round(1 - new_ms / old_ms, 3) if old_ms else None,
+            "end_to_end_cpu_ms": asyncio.run(end_to_end()),
+        }
+
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
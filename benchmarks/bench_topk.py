@@ -0,0 +1,55 @@
+"""
+So sánh top-k (argpartition) với sort toàn bộ khi xếp hạng kết quả.
+
+    python benchmarks/bench_topk.py --rows 500000
+
+In kết quả dạng JSON (thời gian trung vị, ms).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ProductIndex import ProductIndex  # noqa: E402
+from synthetic import synthetic_catalog  # noqa: E402
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(float(np.median(samples)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    index = ProductIndex(synthetic_catalog(args.rows))
+    queries = {
+        "all_products": {},
+        "budget_only": {'min_price': 100000, 'max_price': 1000000},
+        "category_sex_budget": {'category': 'bag', 'sex': 'female', 'min_price': 200000, 'max_price': 800000},
+    }
+    result = {"rows": args.rows, "queries": {}}
+    for name, filter_dict in queries.items():
+        positions = index.match(filter_dict)
+        entry = {"matches": len(positions)}
+        for k in (20, 50, 500):
+            full = timed(lambda: index.take(index.order(positions, 'score', filter_dict)[:k]), args.repeat)
+            top = timed(lambda: index.take(index.top(positions, k, 'score', filter_dict)), args.repeat)
+            entry[f"k={k}"] = {"full_sort_ms": full, "top_k_ms": top, "speedup": round(full / top, 1) if top else None}
+        result["queries"][name] = entry
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Server giả lập Hugging Face Inference API để benchmark không phụ thuộc mạng.
+
+    python benchmarks/llm_stub.py --port 8765 --latency-ms 150
+
+Trả về dạng [{"generated_text": ...}] như API thật; một phần câu trả lời cố tình sai format
+(giống GPT-2) để đo cả nhánh fallback.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+RESPONSES = [
+    "{'category': 'watch', 'sex': 'male', 'min_price': 300000, 'max_price': 1000000}",
+    "{'category': 'bag', 'sex': 'female', 'max_price': 800000}",
+    "{'category': 'perfume'}",
+    "Here are some gift ideas for your father: a watch or a wallet.",
+]
+
+
+class LLMStub:
+    """
+    Chạy server trong thread nền; latency và tỉ lệ lỗi 5xx cấu hình được
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, port: int = 0, seed: int = 0) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                with stub._lock:
+                    stub.requests += 1
+                    fail = stub._random.random() < stub.error_rate
+                    text = stub._random.choice(RESPONSES)
+                time.sleep(stub.latency)
+                if fail:
+                    status, body = 503, {"error": "Model is currently loading"}
+                else:
+                    status, body = 200, [{"generated_text": text}]
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/models/gpt2"
+
+    def start(self) -> "LLMStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    stub = LLMStub(args.latency_ms / 1000, args.error_rate, args.port)
+    print(f"LLM stub listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,115 @@
+"""
+Dữ liệu giả lập cho benchmark: catalog theo schema database.csv và tập GiftPrompt gần với thực tế.
+
+    python benchmarks/synthetic.py --rows 100000 --out /tmp/database.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+
+CATEGORIES = ['shirt', 'pants', 'dress', 'jacket', 'hoodie', 'shorts', 'sweater', 'leggings', 'vest', 'watch',
+              'wallet', 'bag', 'shoes', 'hat', 'accessory', 'belt', 'scarf', 'socks', 'glasses', 'perfume']
+
+# Tên gốc tiếng Việt theo category (giống kiểu tên sản phẩm trong database.csv)
+PRODUCT_NOUNS = {
+    'shirt': ['Áo Sơ Mi', 'Áo Thun', 'Áo Polo'], 'pants': ['Quần Jeans', 'Quần Tây', 'Quần Jogger'],
+    'dress': ['Váy', 'Đầm Suông', 'Đầm Dự Tiệc'], 'jacket': ['Áo Khoác', 'Áo Bomber', 'Áo Dù'],
+    'hoodie': ['Áo Hoodie', 'Áo Nỉ'], 'shorts': ['Quần Short', 'Quần Đùi'], 'sweater': ['Áo Len', 'Áo Cardigan'],
+    'leggings': ['Quần Legging', 'Quần Bó'], 'vest': ['Áo Vest', 'Áo Gile'], 'watch': ['Đồng Hồ'],
+    'wallet': ['Ví Da', 'Ví Cầm Tay'], 'bag': ['Túi Xách', 'Balo', 'Túi Tote'], 'shoes': ['Giày Sneaker', 'Giày Da', 'Dép'],
+    'hat': ['Mũ Lưỡi Trai', 'Nón Bucket'], 'accessory': ['Vòng Tay', 'Dây Chuyền', 'Nhẫn Bạc'],
+    'belt': ['Thắt Lưng', 'Dây Nịt'], 'scarf': ['Khăn Lụa', 'Khăn Quàng'], 'socks': ['Tất Cổ Cao', 'Vớ'],
+    'glasses': ['Kính Râm', 'Gọng Kính'], 'perfume': ['Nước Hoa'],
+}
+ADJECTIVES = ['Cao Cấp', 'Công Sở', 'Basic', 'Oversize', 'Thể Thao', 'Hàn Quốc', 'Vintage', 'Dáng Rộng',
+              'Thanh Lịch', 'Trẻ Trung', 'Chính Hãng', 'Da Thật', 'Cotton', 'Mùa Hè', 'Giữ Ấm']
+COLORS = ['Đen', 'Trắng', 'Xám', 'Be', 'Xanh Navy', 'Đỏ Đô', 'Hồng Pastel', 'Nâu']
+SEX_WORDS = {'male': 'Nam', 'female': 'Nữ', 'unisex': 'Unisex'}
+DESCRIPTIONS = ['Chất liệu cotton, thoáng mát', 'Kiểu dáng thanh lịch, dễ phối', 'Phong cách trẻ trung, bền màu',
+                'Dáng dài, họa tiết hoa nhí', 'Phù hợp đi làm và đi chơi', 'Quà tặng ý nghĩa cho người thân',
+                'Đóng hộp sang trọng, có thẻ bảo hành', 'Chống nước, dùng hằng ngày']
+BRANDS = ['Canifa', 'IVY Moda', 'Nike', 'Adidas', "Levi's", 'H&M', 'Zara', 'Uniqlo', 'Local Brand', 'Casio']
+
+
+def synthetic_catalog(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Catalog ngẫu nhiên (cố định theo seed) cùng cột và kiểu dữ liệu với database.csv
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, rows + 1)
+    categories = rng.choice(CATEGORIES, rows)
+    sexes = rng.choice(['male', 'female', 'unisex'], rows, p=[0.4, 0.4, 0.2])
+    noun_pick = rng.integers(0, 3, rows)
+    adjectives = rng.choice(ADJECTIVES, rows)
+    colors = rng.choice(COLORS, rows)
+    names = [
+        f"{PRODUCT_NOUNS[c][k % len(PRODUCT_NOUNS[c])]} {SEX_WORDS[s]} {a} Màu {col}"
+        for c, s, k, a, col in zip(categories, sexes, noun_pick, adjectives, colors)
+    ]
+    return pd.DataFrame({
+        'product_id': ids,
+        'category': categories,
+        'product_name': names,
+        'brand': rng.choice(BRANDS, rows),
+        # Giá trong khoảng như database.csv (69k - 7.99M)
+        'price': np.clip(rng.lognormal(12.8, 0.9, rows) // 1000 * 1000, 69000, 7990000).astype(np.int64),
+        'stock': rng.integers(0, 200, rows),
+        'rating': np.round(rng.uniform(3.0, 5.0, rows), 1),
+        'num_reviews': rng.integers(0, 5000, rows),
+        'description': rng.choice(DESCRIPTIONS, rows),
+        'sex': sexes,
+        'image_url': [f"https://cdn.example.com/p/{i}.jpg" for i in ids],
+        'product_link': [f"https://s.shopee.vn/p{i}" for i in ids],
+    })
+
+
+def write_catalog(path: str, rows: int, seed: int = 0) -> str:
+    synthetic_catalog(rows, seed).to_csv(path, index=False)
+    return path
+
+
+RECIPIENTS = [('bố', 'nam'), ('mẹ', 'nữ'), ('bạn gái', 'nữ'), ('bạn trai', 'nam'), ('anh trai', 'nam'),
+              ('em gái', 'nữ'), ('sếp', 'nam'), ('đồng nghiệp', 'nữ'), ('con', 'trẻ em'), ('bạn thân', 'unisex')]
+OCCASIONS = ['sinh nhật', 'kỷ niệm', 'tết', '8/3', '20/10', 'valentine', 'tốt nghiệp', 'giáng sinh']
+# Preferences: phần lớn khớp bảng category, một phần là mô tả tự do (đi qua chỉ mục ngữ nghĩa) hoặc bỏ trống
+PREFERENCES = ['áo sơ mi', 'đồng hồ', 'túi xách', 'nước hoa', 'giày', 'ví da', 'phụ kiện', 'áo khoác', 'váy',
+               'khăn', 'kính', 'quần jeans', 'sơ mi', 'Đồng Hồ Nam', 'balo đi học',
+               'đồ công sở thanh lịch', 'quà tặng ý nghĩa', 'đồ thể thao', 'màu pastel nhẹ nhàng']
+BUDGETS = ['150.000', '300.000', '500.000', '800.000', '1.000.000', '2,000,000', '5.000.000', '1tr', None]
+SEX_VARIANTS = {'nam': ['nam', 'Nam', 'male'], 'nữ': ['nữ', 'Nữ', 'female'], 'trẻ em': ['trẻ em'],
+                'unisex': ['unisex', 'không rõ']}
+
+
+def gift_prompts(count: int, seed: int = 1, preferences: Optional[List[str]] = None) -> List[dict]:
+    """
+    Tập payload GiftPrompt lặp lại theo phân phối gần thực tế (một số prompt phổ biến lặp nhiều lần)
+    """
+    rng = np.random.default_rng(seed)
+    preferences = preferences or PREFERENCES
+    # Phân phối Zipf nhẹ để có cả prompt nóng (cache hit) lẫn prompt hiếm
+    weights = 1.0 / np.arange(1, len(preferences) + 1) ** 0.8
+    weights /= weights.sum()
+    prompts = []
+    for _ in range(count):
+        recipient, sex = RECIPIENTS[rng.integers(len(RECIPIENTS))]
+        variants = SEX_VARIANTS[sex]
+        preference = preferences[rng.choice(len(preferences), p=weights)] if rng.random() > 0.1 else None
+        prompts.append({
+            'gift_recipient': recipient,
+            'sex': variants[rng.integers(len(variants))],
+            'occasion': OCCASIONS[rng.integers(len(OCCASIONS))],
+            'Preferences': preference,
+            'budget': BUDGETS[rng.integers(len(BUDGETS))],
+        })
+    return prompts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="database.synthetic.csv")
+    args = parser.parse_args()
+    write_catalog(args.out, args.rows, args.seed)
+    print(f"Wrote {args.rows} rows to {args.out}")
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+# AnalysisManager đọc cấu hình khi import và mở database.csv theo đường dẫn tương đối
+os.chdir(ROOT)
+for name, value in (("CHANGE_LOG", ""), ("SEMANTIC_SEARCH", "0"), ("CATALOG_POLL_INTERVAL", "0"),
+                    ("MODEL_BACKEND", "stub"), ("RESULT_CACHE_BACKEND", "memory"), ("SESSION_BACKEND", "memory")):
+    os.environ.setdefault(name, value)
+
+from llm_stub import LLMStub  # noqa: E402
+
+# Server giả lập Hugging Face cho test của AsyncInferenceClient/RemoteBackend
+STUB = LLMStub(latency=0.05).start()
+
+
+@pytest.fixture(scope="session")
+def manager():
+    from AnalysisManager import AnalysisManager
+    return AnalysisManager()
+
+
+@pytest.fixture
+def stub_manager(manager):
+    """
+    AnalysisManager dùng chung với StubBackend và SingleFlight mới cho từng test
+    """
+    from AnalysisManager import AVAILABLE_CATEGORIES, HF_MAX_BACKLOG
+    from InferenceClient import SingleFlight
+    from ModelBackend import StubBackend
+
+    model, flights = manager.model, manager.llm_flights
+    manager.model = StubBackend(AVAILABLE_CATEGORIES)
+    manager.llm_flights = SingleFlight(HF_MAX_BACKLOG)
+    yield manager
+    manager.model, manager.llm_flights = model, flights
@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ProductIndex import ProductIndex
+
+
+@pytest.fixture(scope="module")
+def api():
+    import API
+    return API
+
+
+def post(api, path: str, json):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+            return await client.post(path, json=json)
+    return asyncio.run(run())
+
+
+def test_first_page_uses_top_k_without_full_sort(api, monkeypatch):
+    sorts = []
+    order = ProductIndex.order
+    monkeypatch.setattr(ProductIndex, "order", lambda self, *args, **kw: sorts.append(args) or order(self, *args, **kw))
+    api.analysis_manager.cache.clear()
+    prompt = {"gift_recipient": "bố", "sex": "nam", "occasion": "sinh nhật", "Preferences": "đồng hồ"}
+
+    body = post(api, "/products?limit=2&sort=price&facets=brand", prompt).json()
+    index = api.analysis_manager.index
+    expected = index.order(index.match({'category': 'watch', 'sex': 'male'}), 'price')
+    sorts.clear()
+    assert body["total_products"] == len(expected)
+    assert [p["product_id"] for p in body["products"]] == index.product_id[expected[:2]].tolist()
+    assert sum(body["facets"]["brand"].values()) == len(expected)
+
+    # Trang sau dùng cursor: lúc này mới sắp xếp toàn bộ (và cache lại)
+    after = post(api, f"/products?limit=2&sort=price&cursor={body['next_cursor']}", prompt).json()
+    assert [p["product_id"] for p in after["products"]] == index.product_id[expected[2:4]].tolist()
+    assert len(sorts) == 1
+
+
+def test_paginated_products_fall_back_to_whole_catalog(api):
+    body = post(api, "/products?limit=3", {"gift_recipient": "bố", "sex": "nam", "occasion": "sinh nhật",
+                                           "brands": ["No Such Brand"]}).json()
+    assert body["status"] == "success_with_fallback"
+    assert body["total_products"] == api.analysis_manager.index.count and len(body["products"]) == 3
+
+
+def test_recommendation_table_head_reports_full_total(api, monkeypatch):
+    prompt = {"gift_recipient": "mẹ", "sex": "nữ", "occasion": "sinh nhật", "budget": "1000000"}
+    manager = api.analysis_manager
+    filter_dict = manager._rule_based_filtering_from_database(prompt)
+    head = manager.recommended_positions(prompt, filter_dict, manager.snapshot)
+    assert head is not None
+
+    # Nhánh bảng gợi ý chỉ tra bảng, không lọc/sắp xếp toàn catalog
+    monkeypatch.setattr(ProductIndex, "match", lambda *args, **kw: pytest.fail("full match on the table path"))
+    manager.cache.clear()
+    (index, positions, total), _ = manager.product_positions(prompt)
+    monkeypatch.undo()
+
+    assert positions.tolist() == head.tolist()
+    assert total == len(index.match(filter_dict)) == index.match_count(filter_dict)
+    body = post(api, "/products?facets=category", prompt).json()
+    paged = post(api, "/products?limit=5&facets=category", prompt).json()
+    assert body["total_products"] == paged["total_products"] == total
+    assert body["facets"] == paged["facets"]
@@ -0,0 +1,33 @@
+import shutil
+
+import AnalysisManager as analysis
+from CatalogChanges import compact, parse_entry
+
+
+def upsert(product_id, **fields):
+    return parse_entry({'op': 'upsert', 'product': {'product_id': product_id, **fields}})
+
+
+def stock(manager, product_id):
+    index = manager.index
+    return index.records[index.positions_of([product_id])[0]]['stock']
+
+
+def test_lagging_worker_reloads_after_compaction(tmp_path, monkeypatch):
+    shutil.copy(analysis.DATABASE, tmp_path / "database.csv")
+    monkeypatch.setattr(analysis, "DATABASE", str(tmp_path / "database.csv"))
+    monkeypatch.setattr(analysis, "CHANGE_LOG", str(tmp_path / "catalog_changes.ndjson"))
+    monkeypatch.setattr(analysis, "CATALOG_BINARY", "")
+    writer, lagging = analysis.AnalysisManager(), analysis.AnalysisManager()
+
+    writer.apply_catalog_changes([upsert(1, stock=11), upsert(2, stock=12)])
+    # Log được gộp vào CSV trước khi worker chậm kịp đọc hai dòng trên
+    compact(analysis.DATABASE, analysis.CHANGE_LOG)
+    writer.apply_catalog_changes([upsert(3, stock=13)])
+
+    lagging.sync_changes()
+    assert [stock(lagging, i) for i in (1, 2, 3)] == [11, 12, 13]
+    assert lagging.snapshot.log_generation == writer.snapshot.log_generation
+    version = lagging.snapshot.version
+    lagging.sync_changes()
+    assert lagging.snapshot.version == version
@@ -0,0 +1,118 @@
+import asyncio
+
+import httpx
+import pytest
+
+from InferenceClient import AsyncInferenceClient, CircuitBreaker, CircuitOpenError
+
+
+def open_breaker() -> CircuitBreaker:
+    # reset_timeout=0: lời gọi kế tiếp là probe half_open
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.trip()
+    return breaker
+
+
+def test_cancelled_probe_reopens_the_circuit():
+    from conftest import STUB
+
+    client = AsyncInferenceClient(STUB.url, breaker=open_breaker())
+
+    async def run():
+        probe = asyncio.ensure_future(client.generate({"inputs": "x"}))
+        await asyncio.sleep(0.01)
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        await client.aclose()
+
+    asyncio.run(run())
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_unexpected_probe_error_reopens_the_circuit(monkeypatch):
+    client = AsyncInferenceClient("http://127.0.0.1:9/model", breaker=open_breaker())
+
+    async def broken(*args):
+        raise httpx.DecodingError("invalid gzip body")
+
+    monkeypatch.setattr(client, "_post_once", broken)
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(client.generate({"inputs": "x"}))
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    client.breaker.reset_timeout = 60
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.generate({"inputs": "x"}))
+
+
+def test_generate_against_local_stub_server():
+    from conftest import STUB
+
+    client = AsyncInferenceClient(STUB.url)
+
+    async def run():
+        results = await asyncio.gather(*(client.generate({"inputs": str(i)}) for i in range(4)))
+        await client.aclose()
+        return results
+
+    before = STUB.requests
+    results = asyncio.run(run())
+    assert STUB.requests - before == 4
+    assert all(isinstance(r, list) and "generated_text" in r[0] for r in results)
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_upstream_errors_are_retried_then_trip_the_breaker():
+    from llm_stub import LLMStub
+    from InferenceClient import InferenceError
+
+    stub = LLMStub(latency=0, error_rate=1.0).start()
+    try:
+        client = AsyncInferenceClient(stub.url, max_retries=2, backoff=0.001,
+                                      breaker=CircuitBreaker(failure_threshold=3))
+        with pytest.raises(InferenceError, match="503"):
+            asyncio.run(client.generate({"inputs": "x"}))
+        assert stub.requests == 3
+        assert client.breaker.state == CircuitBreaker.OPEN
+    finally:
+        stub.stop()
+
+
+def test_each_event_loop_keeps_its_own_client():
+    import threading
+    from conftest import STUB
+
+    client = AsyncInferenceClient(STUB.url)
+    other_ready, main_done = threading.Event(), threading.Event()
+    seen = {}
+
+    def other_loop():
+        async def run():
+            await client.generate({"inputs": "a"})
+            seen["other"] = client._ensure_client()[0]
+            other_ready.set()
+            # Loop này vẫn chạy trong lúc thread chính dùng client: client của nó không bị thay hay bỏ rơi
+            await asyncio.get_running_loop().run_in_executor(None, main_done.wait)
+            await client.generate({"inputs": "b"})
+            seen["still"] = client._ensure_client()[0]
+            await client.aclose()
+            seen["closed"] = seen["other"].is_closed
+        asyncio.run(run())
+
+    thread = threading.Thread(target=other_loop)
+    thread.start()
+    other_ready.wait(5)
+
+    async def main():
+        await client.generate({"inputs": "c"})
+        mine = client._ensure_client()[0]
+        await client.aclose()
+        return mine
+
+    mine = asyncio.run(main())
+    main_done.set()
+    thread.join(5)
+    assert mine is not seen["other"] and mine.is_closed
+    assert seen["still"] is seen["other"] and seen["closed"]
@@ -0,0 +1,129 @@
+import ast
+import asyncio
+
+import pytest
+
+from InferenceClient import AsyncInferenceClient
+from ModelBackend import (LocalIntentBackend, MicroBatcher, RemoteBackend, StubBackend, create_model_backend,
+                          extract_dict)
+
+
+def budget_range(budget):
+    return 69000, budget
+
+
+def test_create_model_backend_selects_backend():
+    assert isinstance(create_model_backend("stub", categories=["watch"]), StubBackend)
+    local = create_model_backend("local", prompt_path="huggingface_prompt.txt", price_range=budget_range)
+    assert isinstance(local, LocalIntentBackend) and local.name == "local"
+    client = AsyncInferenceClient("http://127.0.0.1:9/model")
+    remote = create_model_backend("remote", client=client)
+    assert isinstance(remote, RemoteBackend) and remote.client is client and remote.available
+    with pytest.raises(ValueError, match="Unknown model backend: onnx"):
+        create_model_backend("onnx")
+
+
+def test_micro_batcher_groups_concurrent_calls():
+    batches = []
+
+    def predict(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(predict, max_batch=3)
+        return batcher, await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    batcher, results = asyncio.run(run())
+    assert results == [0, 2, 4, 6, 8, 10, 12]
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert batcher.stats() == {"batches": 3, "items": 7, "largest_batch": 3, "avg_batch": 2.33}
+
+
+def test_micro_batcher_propagates_errors_to_the_batch():
+    def predict(items):
+        raise RuntimeError("model crashed")
+
+    async def run():
+        batcher = MicroBatcher(predict)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(run())] == ["model crashed", "model crashed"]
+
+
+def test_local_backend_batches_concurrent_questions():
+    backend = LocalIntentBackend("huggingface_prompt.txt", budget_range)
+    questions = ["đồng hồ cho bố 2 triệu", "váy cho mẹ từ 300k đến 500k", "quà bất ngờ"]
+
+    async def run():
+        await backend.warmup()
+        return await asyncio.gather(*(backend.generate(q, "", q) for q in questions))
+
+    outputs = [ast.literal_eval(output) for output in asyncio.run(run())]
+    assert outputs[0] == {'category': 'watch', 'sex': 'male', 'min_price': 69000, 'max_price': 2000000}
+    assert outputs[1] == {'category': 'dress', 'sex': 'female', 'min_price': 300000, 'max_price': 500000}
+    assert outputs[2] == {'sex': 'unisex'}
+    # warmup là một batch, ba câu hỏi đồng thời là batch thứ hai
+    assert backend.batcher.stats() == {"batches": 2, "items": 5, "largest_batch": 3, "avg_batch": 2.5}
+
+
+@pytest.mark.parametrize("question, expected", [
+    # 'bà' và 'ba' trùng nhau khi bỏ dấu; 'vợ' trùng 'vớ' (tất)
+    ("quà sinh nhật cho bà 500k", {'sex': 'female', 'min_price': 69000, 'max_price': 500000}),
+    ("quà cho vợ", {'sex': 'unisex'}),
+    ("qua cho ba", {'sex': 'male'}),
+    ("mua vớ cho bố", {'category': 'socks', 'sex': 'male'}),
+    ("mua vo cho bo", {'category': 'socks', 'sex': 'male'}),
+    ("áo khoac cho mẹ", {'category': 'jacket', 'sex': 'female'}),
+])
+def test_local_backend_respects_written_accents(question, expected):
+    backend = LocalIntentBackend("huggingface_prompt.txt", budget_range)
+    assert backend.predict(question) == expected
+
+
+def test_stub_backend_is_deterministic():
+    stub = StubBackend(["watch", "bag", "shoes"])
+
+    async def run():
+        return [await stub.generate(q, "", q) for q in ("quà cho bố", "quà cho bố", "quà cho mẹ")]
+
+    first, again, other = asyncio.run(run())
+    assert first == again and stub.calls == 3
+    assert set(ast.literal_eval(other)) == {'category', 'sex'}
+    assert asyncio.run(StubBackend([], response="{'category': 'bag'}").generate("x", "", "x")) == "{'category': 'bag'}"
+    with pytest.raises(ValueError, match="needs categories or a fixed response"):
+        create_model_backend("stub")
+
+
+def test_stub_output_drives_model_response(stub_manager):
+    stub_manager.model = StubBackend([], response="{'category': 'watch', 'sex': 'male'}")
+    products, session_id = asyncio.run(stub_manager._model_response("quà gì cũng được"))
+    assert stub_manager.model.calls == 1 and session_id
+    expected = stub_manager.index.match({'category': 'watch', 'sex': 'male'})
+    assert products and len(products) == len(expected)
+    assert all(p['category'] == 'watch' and p['sex'] == 'male' for p in products)
+
+
+def test_model_response_looks_up_recipient_and_occasion(stub_manager, monkeypatch):
+    stub_manager.model = StubBackend([], response="{'sex': 'female', 'min_price': 600000, 'max_price': 1000000}")
+    contexts = []
+    search = stub_manager.search_products
+    monkeypatch.setattr(stub_manager, "search_products", lambda f, q=None: contexts.append(q) or search(f, q))
+    products, _ = asyncio.run(stub_manager._model_response("quà sinh nhật cho mẹ dưới 1 triệu"))
+    assert contexts == [{'gift_recipient': 'parent', 'occasion': 'birthday'}]
+    table = stub_manager.snapshot.recommendations
+    head = table.lookup('parent', 'birthday', 'female', 600000, 1000000)
+    assert [p['product_id'] for p in products] == stub_manager.index.product_id[head].tolist()
+
+
+def test_unparseable_model_output_is_reported(stub_manager):
+    stub_manager.model = StubBackend([], response="Sorry, I can't help with that")
+    response, _ = asyncio.run(stub_manager._model_response("quà gì cũng được"))
+    assert stub_manager.model.calls == 1
+    # Chỉ mục ngữ nghĩa tắt (SEMANTIC_SEARCH=0) -> không có kết quả thay thế, trả về lỗi format
+    assert response == "Error occurred: Invalid AI response format -> Sorry, I can't help with that"
+
+
+def test_extract_dict_takes_first_dictionary():
+    assert extract_dict("Response: {'category': 'bag'} and {'x': 1}") == "{'category': 'bag'}"
+    assert extract_dict("Assistant Response: none") == "none"
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CatalogChanges import coalesce, parse_entry, resolve
+from ProductIndex import SORT_KEYS, ProductIndex
+from Ranking import top_k
+
+
+@pytest.fixture(scope="module")
+def index():
+    """
+    Chỉ mục có rating null như sau PATCH /catalog {"rating": null}
+    """
+    base = ProductIndex(pd.read_csv("database.csv"))
+    watches = base.match({'category': 'watch', 'sex': 'male'})
+    ids = base.product_id[watches[:2]].tolist()
+    entries = [parse_entry({'op': 'upsert', 'product': {'product_id': i, 'rating': None}}) for i in ids]
+    changes, _ = resolve(base, coalesce(entries))
+    return base.apply(changes)
+
+
+def test_top_k_puts_nan_last():
+    values = np.array([3.0, np.nan, 1.0, np.nan, 2.0])
+    assert top_k(values, np.arange(5), 3).tolist() == [2, 4, 0]
+    assert top_k(values, np.arange(5), 4).tolist() == [2, 4, 0, 1]
+    assert top_k(np.array([np.nan, np.nan]), np.array([7, 3]), 1).tolist() == [1]
+
+
+@pytest.mark.parametrize("sort", SORT_KEYS)
+def test_first_page_matches_full_sort_with_null_ratings(index, sort):
+    positions = index.match({'category': 'watch', 'sex': 'male'})
+    assert np.isnan(index.rating[positions]).sum() == 2
+    ordered = index.order(positions, sort)
+    for k in range(1, len(positions) + 1):
+        assert index.top(positions, k, sort).tolist() == ordered[:k].tolist()
+
+
+@pytest.mark.parametrize("sort", ['rating', '-rating'])
+def test_cursor_pages_through_null_ratings(index, sort):
+    ordered = index.order(index.match({'category': 'watch', 'sex': 'male'}), sort)
+    seen, cursor = [], None
+    while True:
+        page, cursor = index.page(ordered, sort, 2, cursor)
+        seen += page.tolist()
+        if cursor is None:
+            break
+    assert seen == ordered.tolist()
+    # Sản phẩm thiếu rating đứng cuối ở cả hai chiều
+    assert np.isnan(index.rating[ordered[-2:]]).all()
@@ -0,0 +1,98 @@
+import asyncio
+import unicodedata
+
+import pytest
+
+from InferenceClient import LoadShedError, SingleFlight
+
+
+def test_concurrent_identical_keys_share_one_call():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        flights = SingleFlight(max_pending=4)
+        results = await asyncio.gather(*(flights.do("same", fetch) for _ in range(5)))
+        return flights, results
+
+    flights, results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [value for value, _ in results] == ["result"] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert flights.stats() == {"pending": 0, "max_pending": 4, "started": 1, "shared": 4, "shed": 0}
+
+
+def test_waiters_share_the_exception():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.do("same", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(e, RuntimeError) and str(e) == "upstream down" for e in results)
+
+
+def test_backlog_over_limit_is_shed():
+    async def slow():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def run():
+        flights = SingleFlight(max_pending=2)
+        results = await asyncio.gather(*(flights.do(key, slow) for key in ("a", "b", "c")), return_exceptions=True)
+        # Backlog đã hết -> khóa mới lại được nhận
+        after = await flights.do("c", slow)
+        return flights, results, after
+
+    flights, results, after = asyncio.run(run())
+    assert results[:2] == [("ok", False), ("ok", False)]
+    assert isinstance(results[2], LoadShedError)
+    assert after == ("ok", False)
+    assert flights.stats()["shed"] == 1
+
+
+def test_identical_questions_make_one_backend_call(stub_manager):
+    questions = ["Quà sinh nhật cho bố", "quà sinh nhật  cho BỐ", "Quà sinh nhật cho bố "]
+
+    async def run():
+        return await asyncio.gather(*(stub_manager._model_response(q) for q in questions))
+
+    results = asyncio.run(run())
+    assert stub_manager.model.calls == 1
+    assert stub_manager.llm_flights.stats()["shared"] == 2
+    products = [result for result, _ in results]
+    assert products[0] and products[1:] == [products[0]] * 2
+
+
+def test_excess_backlog_falls_back_without_backend_call(stub_manager):
+    from InferenceClient import SingleFlight
+
+    stub_manager.llm_flights = SingleFlight(max_pending=1)
+
+    async def run():
+        return await asyncio.gather(stub_manager._model_response("đồng hồ cho bố"),
+                                    stub_manager._model_response("váy cho mẹ"))
+
+    (first, _), (shed, _) = asyncio.run(run())
+    assert stub_manager.model.calls == 1
+    assert stub_manager.llm_flights.stats()["shed"] == 1
+    # Bị từ chối -> vẫn trả danh sách sản phẩm (semantic tắt: toàn bộ catalog) thay vì lỗi
+    assert isinstance(shed, list) and len(shed) == len(stub_manager.data)
+    assert isinstance(first, list)
+
+
+@pytest.mark.parametrize("question, key", [
+    ("  Quà  Sinh Nhật ", "quà sinh nhật"),
+    ("quà sinh nhật", "quà sinh nhật"),
+])
+def test_question_key_normalizes_case_space_and_unicode(question, key):
+    from AnalysisManager import AnalysisManager
+
+    assert AnalysisManager._question_key(question) == key